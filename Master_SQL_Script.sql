@@ -1,44 +1,22 @@
 -- Master_SQL_Script.sql
 
--- 1. CLEANUP 
+-- Each run upserts only the snapshot date(s) it loads, earlier dates are kept as history.
+
+--------------------------------------------------------------------------------
+-- 1. CLEANUP (only with `final_database_update.py --rebuild`: drops all history)
+--------------------------------------------------------------------------------
+-- @REBUILD
 DROP TABLE IF EXISTS historical_screener_data;
-DROP TABLE IF EXISTS historical_screener_data_staging;
 DROP TABLE IF EXISTS screener_indicators;
 DROP TABLE IF EXISTS indicator_weights;
 DROP TABLE IF EXISTS final_score;
+-- @END REBUILD
 
 --------------------------------------------------------------------------------
--- 2. CREATE STAGING TABLE
---------------------------------------------------------------------------------
-CREATE TABLE historical_screener_data_staging (
-    "Name" TEXT, "BSE Code" TEXT, "NSE Code" TEXT, "Industry" TEXT, "Date" TEXT, 
-    "Current Price" TEXT, "Price to Earning" TEXT, "best p/e" TEXT, "Market Capitalization" TEXT, 
-    "Debt to equity" TEXT, "FII holdingQ1" TEXT, "FII holdingQ2" TEXT, "FII holgrowth" TEXT, 
-    "Public holding" TEXT, "Change in FII holding" TEXT, "Promoter holdingQ1" TEXT, 
-    "Promoter holdingQ2" TEXT, "Promoter holgrowth" TEXT, "Change in promoter holding" TEXT, 
-    "Pledged percentage" TEXT, "DII holdingQ1" TEXT, "DII holdingQ2" TEXT, "DII holgrowth" TEXT, 
-    "Change in DII holding" TEXT, "ROCE3yr avg" TEXT, "PEG Ratio" TEXT, 
-    "SalesQ1" TEXT, "SalesQ2" TEXT, "SalesQ3" TEXT, "SalesQ4" TEXT, "SalesQ5" TEXT, "SalesQ6" TEXT, 
-    "SalesQ7" TEXT, "SalesQ8" TEXT, "Sales growth" TEXT, 
-    "EPS_Q1" TEXT, "EPS_Q2" TEXT, "EPS_Q3" TEXT, "EPS_Q4" TEXT, "EPS_Q5" TEXT, "EPS_Q6" TEXT, 
-    "EPS_Q7" TEXT, "EPS_Q8" TEXT, "EPSgrowth" TEXT, "Dividend yield" TEXT, 
-    "OPMQ1" TEXT, "OPMQ2" TEXT, "OPMQ3" TEXT, "OPMQ4" TEXT, "OPMQ5" TEXT, "OPMQ6" TEXT, 
-    "OPMQ7" TEXT, "OPMQ8" TEXT, "OPM_growth" TEXT, "OPM_4Q" TEXT, "op_avg" TEXT, 
-    "COA-Net" TEXT, "Management Score" TEXT, "Transcriptions_score" TEXT
-);
-
---------------------------------------------------------------------------------
--- 3. IMPORT RAW DATA USING COPY (Path replaced by Python)
+-- 2. CREATE FINAL TABLE (Target Table, one partition per month of snapshot_date)
 --------------------------------------------------------------------------------
-COPY historical_screener_data_staging FROM '<path/to/nifty-total-market.csv>'
-DELIMITER ','
-CSV HEADER
-NULL 'NaN'; 
-
---------------------------------------------------------------------------------
--- 4. CREATE FINAL TABLE (Target Table)
---------------------------------------------------------------------------------
-CREATE TABLE historical_screener_data (
+-- Monthly partitions are created by final_database_update.py before each load.
+CREATE TABLE IF NOT EXISTS historical_screener_data (
     stock_name TEXT, bse_code BIGINT, nse_code TEXT, industry TEXT, snapshot_date DATE,
     current_price NUMERIC, price_to_earning NUMERIC, best_p_e NUMERIC, market_capitalization NUMERIC,
     debt_to_equity NUMERIC, fii_holding_q1 NUMERIC, fii_holding_q2 NUMERIC, fii_holgrowth NUMERIC,
@@ -52,52 +30,28 @@ CREATE TABLE historical_screener_data (
     eps_q1 NUMERIC, eps_q2 NUMERIC, eps_q3 NUMERIC, eps_q4 NUMERIC, eps_q5 NUMERIC, eps_q6 NUMERIC, eps_q7 NUMERIC, eps_q8 NUMERIC, eps_growth NUMERIC, 
     opm_q1 NUMERIC, opm_q2 NUMERIC, opm_q3 NUMERIC, opm_q4 NUMERIC, opm_q5 NUMERIC, opm_q6 NUMERIC, opm_q7 NUMERIC, opm_q8 NUMERIC, opm_growth NUMERIC, 
     opm_4q NUMERIC, op_avg NUMERIC
-);
+) PARTITION BY RANGE (snapshot_date);
 
---------------------------------------------------------------------------------
--- 5. INSERT DATA WITH ROBUST TRANSFORMATION
---------------------------------------------------------------------------------
-INSERT INTO historical_screener_data (
-    stock_name, bse_code, nse_code, industry, snapshot_date, current_price, price_to_earning, best_p_e, market_capitalization, debt_to_equity, fii_holding_q1, fii_holding_q2, fii_holgrowth, public_holding, change_in_fii_holding, promoter_holding_q1, promoter_holding_q2, promoter_holgrowth, change_in_promoter_holding, pledged_percentage, dii_holding_q1, dii_holding_q2, dii_holgrowth, change_in_dii_holding, roce_3yr_avg, peg_ratio, dividend_yield, coa_net, management_score, transcriptions_score,
-    sales_q1, sales_q2, sales_q3, sales_q4, sales_q5, sales_q6, sales_q7, sales_q8, sales_growth, 
-    eps_q1, eps_q2, eps_q3, eps_q4, eps_q5, eps_q6, eps_q7, eps_q8, eps_growth, 
-    opm_q1, opm_q2, opm_q3, opm_q4, opm_q5, opm_q6, opm_q7, opm_q8, opm_growth, opm_4q, op_avg
-)
-SELECT
-    "Name"::TEXT, NULLIF("BSE Code", '')::BIGINT, NULLIF("NSE Code", '')::TEXT, "Industry"::TEXT, 
-    TO_DATE("Date", 'DD-MM-YYYY'), NULLIF("Current Price", '')::NUMERIC, NULLIF("Price to Earning", '')::NUMERIC, 
-    NULLIF("best p/e", '')::NUMERIC, NULLIF("Market Capitalization", '')::NUMERIC, NULLIF("Debt to equity", '')::NUMERIC, 
-    NULLIF("FII holdingQ1", '')::NUMERIC, NULLIF("FII holdingQ2", '')::NUMERIC, NULLIF("FII holgrowth", '')::NUMERIC, 
-    NULLIF("Public holding", '')::NUMERIC, NULLIF("Change in FII holding", '')::NUMERIC, NULLIF("Promoter holdingQ1", '')::NUMERIC, 
-    NULLIF("Promoter holdingQ2", '')::NUMERIC, NULLIF("Promoter holgrowth", '')::NUMERIC, NULLIF("Change in promoter holding", '')::NUMERIC, 
-    NULLIF("Pledged percentage", '')::NUMERIC, NULLIF("DII holdingQ1", '')::NUMERIC, NULLIF("DII holdingQ2", '')::NUMERIC, 
-    NULLIF("DII holgrowth", '')::NUMERIC, NULLIF("Change in DII holding", '')::NUMERIC, NULLIF("ROCE3yr avg", '')::NUMERIC, 
-    NULLIF("PEG Ratio", '')::NUMERIC, NULLIF("Dividend yield", '')::NUMERIC, NULLIF("COA-Net", '')::NUMERIC, 
-    NULLIF("Management Score", '')::NUMERIC, NULLIF("Transcriptions_score", '')::NUMERIC,
-
-    NULLIF("SalesQ1", '')::NUMERIC, NULLIF("SalesQ2", '')::NUMERIC, NULLIF("SalesQ3", '')::NUMERIC, NULLIF("SalesQ4", '')::NUMERIC, 
-    NULLIF("SalesQ5", '')::NUMERIC, NULLIF("SalesQ6", '')::NUMERIC, NULLIF("SalesQ7", '')::NUMERIC, NULLIF("SalesQ8", '')::NUMERIC, 
-    NULLIF("Sales growth", '')::NUMERIC, 
-    
-    NULLIF("EPS_Q1", '')::NUMERIC, NULLIF("EPS_Q2", '')::NUMERIC, NULLIF("EPS_Q3", '')::NUMERIC, NULLIF("EPS_Q4", '')::NUMERIC, 
-    NULLIF("EPS_Q5", '')::NUMERIC, NULLIF("EPS_Q6", '')::NUMERIC, NULLIF("EPS_Q7", '')::NUMERIC, NULLIF("EPS_Q8", '')::NUMERIC, 
-    NULLIF("EPSgrowth", '')::NUMERIC, 
-    
-    NULLIF("OPMQ1", '')::NUMERIC, NULLIF("OPMQ2", '')::NUMERIC, NULLIF("OPMQ3", '')::NUMERIC, NULLIF("OPMQ4", '')::NUMERIC, 
-    NULLIF("OPMQ5", '')::NUMERIC, NULLIF("OPMQ6", '')::NUMERIC, NULLIF("OPMQ7", '')::NUMERIC, NULLIF("OPMQ8", '')::NUMERIC, 
-    NULLIF("OPM_growth", '')::NUMERIC, NULLIF("OPM_4Q", '')::NUMERIC, NULLIF("op_avg", '')::NUMERIC
+CREATE INDEX IF NOT EXISTS historical_screener_data_nse_date_idx ON historical_screener_data (nse_code, snapshot_date);
 
-FROM historical_screener_data_staging;
+-- Rows of this run are staged here first (dropped at commit)
+CREATE TEMP TABLE historical_screener_data_load (LIKE historical_screener_data) ON COMMIT DROP;
 
 --------------------------------------------------------------------------------
--- 6. CLEAN UP STAGING TABLE
+-- 3. LOAD DATA (Python streams the merged rows here with COPY ... FROM STDIN)
 --------------------------------------------------------------------------------
-DROP TABLE historical_screener_data_staging;
+-- @LOAD historical_screener_data_load
 
--- F. Drop and Create the screener_indicators table
-DROP TABLE IF EXISTS screener_indicators;
+CREATE TEMP TABLE snapshot_dates ON COMMIT DROP AS
+SELECT DISTINCT snapshot_date FROM historical_screener_data_load;
+
+-- Upsert: a reloaded snapshot date replaces that date's rows, every other date is untouched
+DELETE FROM historical_screener_data WHERE snapshot_date IN (SELECT snapshot_date FROM snapshot_dates);
+
+INSERT INTO historical_screener_data SELECT * FROM historical_screener_data_load;
 
-CREATE TABLE screener_indicators (
+-- F. Create the screener_indicators table (recomputed for the loaded dates only)
+CREATE TABLE IF NOT EXISTS screener_indicators (
     nse_code TEXT NOT NULL, name VARCHAR(255), industry VARCHAR(255), data_date DATE NOT NULL,
     d_to_e_indicator SMALLINT, ph_indicator SMALLINT, ph_trend_indicator SMALLINT, dii_trend_indicator SMALLINT,
     fii_trend_indicator SMALLINT, peg_indicator SMALLINT, roce_indicator SMALLINT, sales_growth_indicator SMALLINT,
@@ -108,6 +62,8 @@ CREATE TABLE screener_indicators (
     PRIMARY KEY (nse_code, data_date)
 );
 
+DELETE FROM screener_indicators WHERE data_date IN (SELECT snapshot_date FROM snapshot_dates);
+
 -- G. Final Indicator Calculation and Population
 WITH LatestData AS (
     SELECT
@@ -121,6 +77,7 @@ WITH LatestData AS (
         h.transcriptions_score AS transcriptions_score_numeric,
         h.coa_net AS coa_net_numeric
     FROM historical_screener_data h
+    WHERE h.snapshot_date IN (SELECT snapshot_date FROM snapshot_dates)
 )
 INSERT INTO screener_indicators (
     nse_code, name, industry, data_date, d_to_e_indicator, ph_indicator, ph_trend_indicator, dii_trend_indicator,
@@ -191,11 +148,13 @@ ON CONFLICT (nse_code, data_date) DO UPDATE SET
     transcriptions_indicator = EXCLUDED.transcriptions_indicator;
 
 -- Create the indicator_weights table
-CREATE TABLE indicator_weights (
-    name TEXT NOT NULL, valid_from DATE NOT NULL, valid_upto DATE, weight DOUBLE PRECISION NOT NULL
+CREATE TABLE IF NOT EXISTS indicator_weights (
+    name TEXT NOT NULL, valid_from DATE NOT NULL, valid_upto DATE, weight DOUBLE PRECISION NOT NULL,
+    PRIMARY KEY (name, valid_from)
 );
 
--- Insert the indicator weights
+-- Insert the indicator weights (weights already in the table are kept)
+-- To change a weight, set valid_upto on its current row and add a row with the new valid_from.
 INSERT INTO indicator_weights (name, valid_from, valid_upto, weight) VALUES
 ('Debt to Equity', '2025-10-15', NULL, 0.06),
 ('ROCE (last 3 years)', '2025-10-15', NULL, 0.11),
@@ -212,31 +171,52 @@ INSERT INTO indicator_weights (name, valid_from, valid_upto, weight) VALUES
 ('Operating Profit Trend', '2025-10-15', NULL, 0.04),
 ('EPS Trend', '2025-10-15', NULL, 0.06),
 ('OPM Trend', '2025-10-15', NULL, 0.06),
-('Transcriptions', '2025-10-15', NULL, 0.04);
+('Transcriptions', '2025-10-15', NULL, 0.04)
+ON CONFLICT (name, valid_from) DO NOTHING;
 
--- Drop existing final_score table if it exists
-DROP TABLE IF EXISTS final_score;
+-- Create the final_score table (maintained incrementally, one row per company and date)
+CREATE TABLE IF NOT EXISTS final_score (
+    nse_code TEXT NOT NULL, name VARCHAR(255), industry VARCHAR(255), data_date DATE NOT NULL, final_score NUMERIC,
+    PRIMARY KEY (nse_code, data_date)
+);
+
+-- Top-N per date and per-industry rankings
+CREATE INDEX IF NOT EXISTS final_score_date_score_idx ON final_score (data_date, final_score DESC);
+CREATE INDEX IF NOT EXISTS final_score_industry_date_idx ON final_score (industry, data_date);
+
+-- Calculate the final score for the loaded dates
+DELETE FROM final_score WHERE data_date IN (SELECT snapshot_date FROM snapshot_dates);
 
--- Create the final_score table and calculate the final score
-CREATE TABLE final_score AS
+-- Each indicator is unpivoted to (name, value) and joined to the weight valid on the row's data_date.
+-- Validity periods of one indicator must not overlap. A date with any weight missing scores NULL.
+INSERT INTO final_score (nse_code, name, industry, data_date, final_score)
 SELECT
     si.nse_code, si.name, si.industry, si.data_date,
-    ROUND((
-        COALESCE(si.d_to_e_indicator, 0) * (SELECT weight FROM indicator_weights WHERE name = 'Debt to Equity') +
-        COALESCE(si.roce_indicator, 0) * (SELECT weight FROM indicator_weights WHERE name = 'ROCE (last 3 years)') +
-        COALESCE(si.coa_net_indicator, 0) * (SELECT weight FROM indicator_weights WHERE name = 'Cash from Operating Activity Trend') +
-        COALESCE(si.best_p_e_indicator, 0) * (SELECT weight FROM indicator_weights WHERE name = 'Price to Earning') +
-        COALESCE(si.peg_indicator, 0) * (SELECT weight FROM indicator_weights WHERE name = 'PEG Ratio') +
-        COALESCE(si.management_score_indicator, 0) * (SELECT weight FROM indicator_weights WHERE name = 'Management Quality') +
-        COALESCE(si.div_yield_indicator, 0) * (SELECT weight FROM indicator_weights WHERE name = 'High Dividend Yield%') +
-        COALESCE(si.ph_indicator, 0) * (SELECT weight FROM indicator_weights WHERE name = 'Promoter Holding') +
-        COALESCE(si.ph_trend_indicator, 0) * (SELECT weight FROM indicator_weights WHERE name = 'Promoter Holding Trend') +
-        COALESCE(si.dii_trend_indicator, 0) * (SELECT weight FROM indicator_weights WHERE name = 'DII Holding Trend') +
-        COALESCE(si.fii_trend_indicator, 0) * (SELECT weight FROM indicator_weights WHERE name = 'FII Holding Trend') +
-        COALESCE(si.sales_growth_indicator, 0) * (SELECT weight FROM indicator_weights WHERE name = 'Sales Trend') +
-        COALESCE(si.opm_trend_indicator, 0) * (SELECT weight FROM indicator_weights WHERE name = 'OPM Trend') +
-        COALESCE(si.eps_growth_indicator, 0) * (SELECT weight FROM indicator_weights WHERE name = 'EPS Trend') +
-        COALESCE(si.op_avggrowth_indicator, 0) * (SELECT weight FROM indicator_weights WHERE name = 'Operating Profit Trend') +
-        COALESCE(si.transcriptions_indicator, 0) * (SELECT weight FROM indicator_weights WHERE name = 'Transcriptions')
-    )::numeric, 4) AS final_score
-FROM screener_indicators si;
\ No newline at end of file
+    CASE WHEN COUNT(w.weight) = COUNT(*)
+        THEN ROUND(SUM(COALESCE(ind.value, 0) * w.weight)::numeric, 4)
+    END AS final_score
+FROM screener_indicators si
+CROSS JOIN LATERAL (VALUES
+    ('Debt to Equity', si.d_to_e_indicator),
+    ('ROCE (last 3 years)', si.roce_indicator),
+    ('Cash from Operating Activity Trend', si.coa_net_indicator),
+    ('Price to Earning', si.best_p_e_indicator),
+    ('PEG Ratio', si.peg_indicator),
+    ('Management Quality', si.management_score_indicator),
+    ('High Dividend Yield%', si.div_yield_indicator),
+    ('Promoter Holding', si.ph_indicator),
+    ('Promoter Holding Trend', si.ph_trend_indicator),
+    ('DII Holding Trend', si.dii_trend_indicator),
+    ('FII Holding Trend', si.fii_trend_indicator),
+    ('Sales Trend', si.sales_growth_indicator),
+    ('OPM Trend', si.opm_trend_indicator),
+    ('EPS Trend', si.eps_growth_indicator),
+    ('Operating Profit Trend', si.op_avggrowth_indicator),
+    ('Transcriptions', si.transcriptions_indicator)
+) AS ind(name, value)
+LEFT JOIN indicator_weights w
+    ON w.name = ind.name
+    AND w.valid_from <= si.data_date
+    AND (w.valid_upto IS NULL OR si.data_date <= w.valid_upto)
+WHERE si.data_date IN (SELECT snapshot_date FROM snapshot_dates)
+GROUP BY si.nse_code, si.name, si.industry, si.data_date;
@@ -2,6 +2,13 @@
 import pandas as pd
 import os
 import time
+import json
+import queue
+import argparse
+import shutil
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.by import By
@@ -10,6 +17,11 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.service import Service as ChromeService
 from selenium.common.exceptions import TimeoutException
 
+import instrumentation
+import stage_cache
+from rate_limiter import AdaptiveRateLimiter, ThrottledError
+from screener_http import ScreenerHttpFetcher
+
 # --- Configuration (UPDATE THESE) ---
 PROJECT_ROOT = os.getcwd() 
 DOWNLOAD_DIRECTORY = os.path.join(PROJECT_ROOT, 'StocksExportsConsolidated1Nov')
@@ -19,16 +31,174 @@ SCREENER_EMAIL = "shresthyadav124@gmail.com" # Replace Placeholder
 SCREENER_PASSWORD = "Hanumanji@12" # Replace Placeholder
 LOGIN_URL = "https://www.screener.in/login/"
 
-# (The setup_webdriver, login_to_screener, and try_download functions remain the same)
+# --- Politeness ---
+# One limiter is shared by every worker and download path. It starts at
+# SCREENER_REQUESTS_PER_SECOND, speeds up on success and halves on throttling/timeouts.
+SCREENER_REQUESTS_PER_SECOND = 0.5
+SCREENER_MIN_REQUESTS_PER_SECOND = 0.1
+SCREENER_MAX_REQUESTS_PER_SECOND = 2.0
+THROTTLE_MARKERS = ("Too Many Requests", "429", "rate limit")
+SCREENER_RATE_LIMITER = AdaptiveRateLimiter(
+    SCREENER_REQUESTS_PER_SECOND,
+    SCREENER_MIN_REQUESTS_PER_SECOND,
+    SCREENER_MAX_REQUESTS_PER_SECOND,
+    name="screener_rate_limiter",
+)
+
+class AmbiguousDownloadError(Exception):
+    """More than one export finished in a browser's download folder, so none can be attributed to the ticker."""
+
+# --- Fetch Mode ---
+# "http": log in once and fetch exports over a pooled HTTP session; tickers that fail
+#         there are retried with the browser workers. "browser": Selenium only.
+FETCH_MODE = "http"
+HTTP_WORKERS = 8
+
+# --- Worker Pool ---
+# Each worker drives its own browser, logs in once and downloads into its own
+# sub-folder of DOWNLOAD_DIRECTORY; every finished export is moved up right away.
+NUM_BROWSER_WORKERS = 4
+HEADLESS_WORKERS = True
+WORKER_DIRECTORY_PREFIX = '.worker_'
+
+# --- Download Tracking ---
+# Records which ticker produced which export file, when, its sha256 and the report variant.
+# Kept outside DOWNLOAD_DIRECTORY so the folder holds nothing but exports.
+DOWNLOAD_MANIFEST_PATH = os.path.join(PROJECT_ROOT, 'download_manifest.json')
+LEGACY_DOWNLOAD_MANIFEST_PATH = os.path.join(DOWNLOAD_DIRECTORY, 'download_manifest.json')
+# Exports younger than this are not downloaded again (a crashed run resumes where it stopped)
+MAX_EXPORT_AGE_HOURS = 24
+# Optional list of NSE codes (one per line) refreshed regardless of age, e.g. during results season
+STALE_LIST_PATH = os.path.join(PROJECT_ROOT, 'stale_tickers.txt')
+DOWNLOAD_POLL_INTERVAL = 0.1     # seconds between folder checks
+DOWNLOAD_TIMEOUT_INITIAL = 60    # used until a download has been observed
+DOWNLOAD_TIMEOUT_MIN = 10
+DOWNLOAD_TIMEOUT_MAX = 120
+DOWNLOAD_TIMEOUT_FACTOR = 4      # timeout = factor x moving average of recent downloads
+IN_PROGRESS_SUFFIXES = ('.crdownload', '.tmp')
+
+class DownloadTracker:
+    """Waits for the export started by a click to be finalized in one browser's download folder."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.average_seconds = None
+
+    def snapshot(self):
+        return set(os.listdir(self.directory))
+
+    def timeout(self):
+        if self.average_seconds is None:
+            return DOWNLOAD_TIMEOUT_INITIAL
+        return min(DOWNLOAD_TIMEOUT_MAX, max(DOWNLOAD_TIMEOUT_MIN, DOWNLOAD_TIMEOUT_FACTOR * self.average_seconds))
+
+    def wait_for_download(self, before):
+        """Returns the path of the new .xlsx once Chrome has renamed its .crdownload and the size is stable.
+
+        Only an export started after `before` was taken is accepted, and only when it is the sole new one:
+        a download abandoned by an earlier timeout that finishes now cannot be told apart from this one.
+        """
+        start = time.perf_counter()
+        deadline = start + self.timeout()
+        abandoned = {f for f in before if f.endswith(IN_PROGRESS_SUFFIXES)}
+        last_size = None
+        try:
+            while time.perf_counter() < deadline:
+                current = self.snapshot()
+                if abandoned - current:
+                    raise AmbiguousDownloadError(
+                        f"An earlier download ({', '.join(sorted(abandoned - current))}) finished meanwhile.")
+                in_progress = [f for f in current - abandoned if f.endswith(IN_PROGRESS_SUFFIXES)]
+                new_files = sorted(f for f in current - before if f.endswith('.xlsx'))
+                if len(new_files) > 1:
+                    raise AmbiguousDownloadError(f"Several new exports appeared: {', '.join(new_files)}.")
+                if new_files and not in_progress:
+                    path = os.path.join(self.directory, new_files[0])
+                    size = os.path.getsize(path)
+                    if size > 0 and size == last_size:
+                        self._record_duration(time.perf_counter() - start)
+                        return path
+                    last_size = size
+                time.sleep(DOWNLOAD_POLL_INTERVAL)
+            raise TimeoutException(f"Download did not complete within {self.timeout():.0f}s.")
+        except (AmbiguousDownloadError, TimeoutException):
+            self.sweep()
+            raise
+
+    def sweep(self):
+        """Deletes finished exports nobody claimed, so a late file is never credited to the next ticker."""
+        for filename in os.listdir(self.directory):
+            if filename.endswith('.xlsx'):
+                try:
+                    os.remove(os.path.join(self.directory, filename))
+                except OSError:
+                    pass    # still locked by the browser; the abandoned-download check covers it
+        instrumentation.incr("download_tracker.sweeps")
+
+    def _record_duration(self, seconds):
+        # Exponential moving average so the timeout follows the site's current speed
+        if self.average_seconds is None:
+            self.average_seconds = seconds
+        else:
+            self.average_seconds = 0.7 * self.average_seconds + 0.3 * seconds
+        instrumentation.observe("download_completion", seconds)
 
-def setup_webdriver():
-    if not os.path.exists(DOWNLOAD_DIRECTORY):
-        os.makedirs(DOWNLOAD_DIRECTORY)
+class DownloadManifest:
+    """Thread-safe per-ticker freshness record, saved to DOWNLOAD_MANIFEST_PATH after every change."""
+
+    def __init__(self, path=DOWNLOAD_MANIFEST_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self.entries = {}
+        if path == DOWNLOAD_MANIFEST_PATH and not os.path.exists(path) and os.path.exists(LEGACY_DOWNLOAD_MANIFEST_PATH):
+            os.replace(LEGACY_DOWNLOAD_MANIFEST_PATH, path)
+            print(f"📦 Moved the download manifest out of the download folder to {path}.")
+        if os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"⚠️ Could not read download manifest {path}: {e}. Starting a new one.")
+
+    def record(self, code, filename, report_type):
+        file_hash = stage_cache.hash_file(os.path.join(DOWNLOAD_DIRECTORY, filename)).hexdigest()
+        with self._lock:
+            self.entries[code] = {
+                "file": filename,
+                "report_type": report_type,
+                "sha256": file_hash,
+                "downloaded_at": datetime.datetime.now().isoformat(timespec='seconds'),
+            }
+            self._save()
+
+    def is_fresh(self, code, max_age_hours, now=None):
+        """True if the ticker's export was downloaded within `max_age_hours` and is still on disk."""
+        entry = self.entries.get(code)
+        if not entry or not os.path.exists(os.path.join(DOWNLOAD_DIRECTORY, entry["file"])):
+            return False
+        try:
+            downloaded_at = datetime.datetime.fromisoformat(entry["downloaded_at"])
+        except (KeyError, ValueError):
+            return False
+        age = (now or datetime.datetime.now()) - downloaded_at
+        return age <= datetime.timedelta(hours=max_age_hours)
+
+    def _save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.entries, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+def setup_webdriver(download_directory=DOWNLOAD_DIRECTORY, headless=False):
+    if not os.path.exists(download_directory):
+        os.makedirs(download_directory)
     
     chrome_options = Options()
     chrome_options.add_argument("--window-size=1200,800")
+    if headless:
+        chrome_options.add_argument("--headless=new")
     chrome_options.add_experimental_option("prefs", {
-        "download.default_directory": DOWNLOAD_DIRECTORY,
+        "download.default_directory": download_directory,
         "download.prompt_for_download": False
     })
 
@@ -48,29 +218,46 @@ def login_to_screener(driver: webdriver.Chrome):
     WebDriverWait(driver, 30).until(EC.url_changes(LOGIN_URL))
     print("Login successful! Continuing with downloads.")
 
-def try_download(driver, url, report_type):
-    driver.get(url)
-    time.sleep(2)
-    export_button_xpaths = ["//button[@aria-label='Export to Excel']", "//button[span[contains(text(), 'Export to Excel')]]"]
-    for xpath in export_button_xpaths:
+def is_throttled(driver):
+    title = driver.title or ""
+    return any(marker.lower() in title.lower() for marker in THROTTLE_MARKERS)
+
+def try_download(driver, url, report_type, tracker, limiter=SCREENER_RATE_LIMITER):
+    """Clicks "Export to Excel" on `url` and returns the path of the completed download."""
+    with instrumentation.timer(f"screener_export.{report_type.lower()}"):
         try:
-            export_button = WebDriverWait(driver, 5).until(EC.element_to_be_clickable((By.XPATH, xpath)))
-            export_button.click()
-            time.sleep(5)
-            return True
-        except TimeoutException:
-            continue
-    raise TimeoutException(f"{report_type} export button not found.")
+            limiter.acquire()
+            driver.get(url)
+            if is_throttled(driver):
+                raise ThrottledError(f"Throttled by Screener on {url}")
 
+            export_button_xpaths = ["//button[@aria-label='Export to Excel']", "//button[span[contains(text(), 'Export to Excel')]]"]
+            for xpath in export_button_xpaths:
+                try:
+                    export_button = WebDriverWait(driver, 5).until(EC.element_to_be_clickable((By.XPATH, xpath)))
+                except TimeoutException:
+                    continue
+                before = tracker.snapshot()
+                limiter.acquire()
+                export_button.click()
+                downloaded_path = tracker.wait_for_download(before)
+                limiter.on_success()
+                return downloaded_path
+        except (ThrottledError, TimeoutException):
+            limiter.on_throttle()
+            raise
+        # The page loaded fine but has no export button (e.g. no consolidated financials)
+        raise TimeoutException(f"{report_type} export button not found.")
 
-def bulk_download_reports(driver: webdriver.Chrome):
-    
+
+def load_tickers(df_stocks=None):
+    """Returns the unique NSE codes from the input CSV (or the frame handed in by the in-process runner)."""
     # -----------------------------------------------------------
     # FIX: Read the CSV normally and select the 'NSE Code' column
     # -----------------------------------------------------------
     try:
-        # Load the CSV, stripping columns just in case of hidden spaces
-        df_stocks = pd.read_csv(INPUT_CSV_PATH)
+        # Load the CSV (unless the in-process runner handed us the frame), stripping columns just in case of hidden spaces
+        df_stocks = pd.read_csv(INPUT_CSV_PATH) if df_stocks is None else df_stocks.copy()
         df_stocks.columns = df_stocks.columns.str.strip() 
         
         # Select the column containing the tickers
@@ -78,32 +265,200 @@ def bulk_download_reports(driver: webdriver.Chrome):
             # Fallback check if the column name was somehow different, though unlikely here
             raise ValueError("Input file must contain a column named 'NSE Code'.")
             
-        unique_nse_codes = df_stocks['NSE Code'].dropna().unique().tolist()
-        total_to_process = len(unique_nse_codes)
-        successful_downloads = 0
+        return df_stocks['NSE Code'].dropna().unique().tolist()
     except Exception as e:
         print(f"❌ Could not read and process input CSV: {e}")
         raise # Reraise the exception to stop the pipeline
 
-    for index, code in enumerate(unique_nse_codes):
-        print(f"\n[{index + 1}/{total_to_process}] Processing {code}...")
-        consolidated_url = f"https://www.screener.in/company/{code}/consolidated/"
-        standalone_url = f"https://www.screener.in/company/{code}/"
+def download_ticker(driver, code, tracker, manifest):
+    """Downloads the consolidated export of one ticker, falling back to standalone, into DOWNLOAD_DIRECTORY.
+
+    Returns the final path of the export, or None if both variants failed.
+    """
+    consolidated_url = f"https://www.screener.in/company/{code}/consolidated/"
+    standalone_url = f"https://www.screener.in/company/{code}/"
+    start = time.perf_counter()
+    report_type = "Consolidated"
+    try:
+        downloaded_path = try_download(driver, consolidated_url, report_type, tracker)
+    except:
+        instrumentation.incr("ticker_download.retries", key=code)
+        report_type = "Standalone"
         try:
-            try_download(driver, consolidated_url, "Consolidated")
-        except:
-            try:
-                try_download(driver, standalone_url, "Standalone")
-            except Exception:
-                print(f" -> SKIPPED: Failed both consolidated and standalone for {code}.")
+            downloaded_path = try_download(driver, standalone_url, report_type, tracker)
+        except Exception:
+            instrumentation.incr("ticker_download.errors", key=code)
+            print(f" -> SKIPPED: Failed both consolidated and standalone for {code}.")
+            downloaded_path = None
+    instrumentation.observe("ticker_download", time.perf_counter() - start, key=code)
+    instrumentation.incr("tickers_processed")
+    if downloaded_path is None:
+        return None
+
+    # Worker folders hand the finished file over to the shared export folder straight away
+    filename = os.path.basename(downloaded_path)
+    final_path = os.path.join(DOWNLOAD_DIRECTORY, filename)
+    if os.path.abspath(downloaded_path) != os.path.abspath(final_path):
+        os.replace(downloaded_path, final_path)
+    manifest.record(code, filename, report_type)
+    return final_path
 
-def main():
-    driver = setup_webdriver()
+def load_stale_list(path=STALE_LIST_PATH):
+    """Reads the optional stale list; blank lines and '#' comments are ignored."""
+    if not path or not os.path.exists(path):
+        return set()
+    with open(path) as f:
+        return {line.strip() for line in f if line.strip() and not line.strip().startswith('#')}
+
+def select_tickers(tickers, manifest, max_age_hours=MAX_EXPORT_AGE_HOURS, stale_codes=()):
+    """Drops tickers whose export is still fresh, unless they are on the stale list."""
+    now = datetime.datetime.now()
+    selected = [code for code in tickers if code in stale_codes or not manifest.is_fresh(code, max_age_hours, now)]
+    skipped = len(tickers) - len(selected)
+    forced = len([code for code in selected if code in stale_codes])
+    print(f"📋 {len(selected)} tickers to download, {skipped} still fresh (< {max_age_hours}h), "
+          f"{forced} forced by the stale list.")
+    instrumentation.incr("tickers_skipped_fresh", skipped)
+    return selected
+
+def browser_worker(worker_id, ticker_queue, total_to_process, progress, stats, manifest):
+    """Logs in once, then downloads tickers from the shared queue until it is empty."""
+    worker_name = f"worker_{worker_id}"
+    worker_directory = os.path.join(DOWNLOAD_DIRECTORY, f"{WORKER_DIRECTORY_PREFIX}{worker_id}")
+    worker_stats = {"downloaded": 0, "failed": 0, "seconds": 0.0}
+    stats[worker_name] = worker_stats
+
+    driver = None
+    start = time.perf_counter()
     try:
+        driver = setup_webdriver(worker_directory, headless=HEADLESS_WORKERS)
+        tracker = DownloadTracker(worker_directory)
         login_to_screener(driver)
-        bulk_download_reports(driver)
+        while True:
+            try:
+                code = ticker_queue.get_nowait()
+            except queue.Empty:
+                break
+            with progress["lock"]:
+                progress["started"] += 1
+                print(f"\n[{progress['started']}/{total_to_process}] {worker_name} processing {code}...")
+            if download_ticker(driver, code, tracker, manifest):
+                worker_stats["downloaded"] += 1
+            else:
+                worker_stats["failed"] += 1
+    except Exception as e:
+        print(f"🔥 {worker_name} stopped: {e}")
+    finally:
+        if driver is not None:
+            driver.quit()
+        worker_stats["seconds"] = time.perf_counter() - start
+        # Anything still in the folder finished after its wait gave up and belongs to no ticker
+        shutil.rmtree(worker_directory, ignore_errors=True)
+
+def run_worker_pool(tickers, num_workers=NUM_BROWSER_WORKERS, manifest=None):
+    """Downloads `tickers` with `num_workers` browsers pulling from one queue; returns per-worker stats."""
+    ticker_queue = queue.Queue()
+    for code in tickers:
+        ticker_queue.put(code)
+
+    os.makedirs(DOWNLOAD_DIRECTORY, exist_ok=True)
+    manifest = manifest or DownloadManifest()
+    progress = {"lock": threading.Lock(), "started": 0}
+    stats = {}
+    threads = [
+        threading.Thread(target=browser_worker, args=(i + 1, ticker_queue, len(tickers), progress, stats, manifest),
+                         daemon=True)
+        for i in range(min(num_workers, len(tickers)))
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    print("\n--- Worker Throughput ---")
+    for worker_name, worker_stats in sorted(stats.items()):
+        minutes = worker_stats["seconds"] / 60
+        rate = worker_stats["downloaded"] / minutes if minutes > 0 else 0.0
+        print(f"  {worker_name}: {worker_stats['downloaded']} downloaded, {worker_stats['failed']} failed, "
+              f"{rate:.1f} tickers/min")
+        instrumentation.incr("worker.downloads", worker_stats["downloaded"], key=worker_name)
+        instrumentation.incr("worker.failures", worker_stats["failed"], key=worker_name)
+        instrumentation.observe("worker.wall", worker_stats["seconds"], key=worker_name)
+
+    if not ticker_queue.empty():
+        print(f"⚠️ {ticker_queue.qsize()} tickers were never attempted (all workers stopped early).")
+
+    downloaded = sum(w["downloaded"] for w in stats.values())
+    print(f"\n✅ Downloaded {downloaded}/{len(tickers)} tickers with {len(threads)} workers.")
+    return stats
+
+def http_download_ticker(fetcher, code, manifest):
+    """Browserless version of download_ticker. Returns the export path, or None so the browser can retry."""
+    start = time.perf_counter()
+    try:
+        downloaded_path, report_type = fetcher.fetch_export(code, DOWNLOAD_DIRECTORY)
+    except Exception as e:
+        instrumentation.incr("ticker_download.http_failures", key=code)
+        print(f" -> HTTP fetch failed for {code}: {e}")
+        return None
     finally:
-        driver.quit()
+        instrumentation.observe("ticker_download", time.perf_counter() - start, key=code)
+
+    instrumentation.incr("tickers_processed")
+    manifest.record(code, os.path.basename(downloaded_path), report_type)
+    return downloaded_path
+
+def run_http_fetch(tickers, manifest, num_workers=HTTP_WORKERS):
+    """Downloads over one logged-in HTTP session; returns the tickers that still need the browser."""
+    fetcher = ScreenerHttpFetcher(SCREENER_RATE_LIMITER, pool_size=num_workers)
+    try:
+        try:
+            fetcher.login(SCREENER_EMAIL, SCREENER_PASSWORD)
+        except Exception as e:
+            print(f"⚠️ HTTP login failed ({e}). Falling back to the browser for every ticker.")
+            return list(tickers)
+
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            results = list(executor.map(lambda code: http_download_ticker(fetcher, code, manifest), tickers))
+    finally:
+        fetcher.close()
+
+    failed = [code for code, path in zip(tickers, results) if path is None]
+    print(f"\n✅ HTTP mode downloaded {len(tickers) - len(failed)}/{len(tickers)} tickers.")
+    return failed
+
+def main(df_stocks=None, num_workers=NUM_BROWSER_WORKERS, max_age_hours=MAX_EXPORT_AGE_HOURS,
+         stale_list_path=STALE_LIST_PATH, fetch_mode=FETCH_MODE):
+    os.makedirs(DOWNLOAD_DIRECTORY, exist_ok=True)
+    manifest = DownloadManifest()
+    tickers = select_tickers(load_tickers(df_stocks), manifest, max_age_hours, load_stale_list(stale_list_path))
+
+    if fetch_mode == "http" and tickers:
+        tickers = run_http_fetch(tickers, manifest)
+        if tickers:
+            print(f"🌐 Retrying {len(tickers)} tickers with the browser workers.")
+
+    # A single worker still uses its own folder, so a re-download never turns into "Name (1).xlsx"
+    if tickers:
+        run_worker_pool(tickers, max(1, num_workers), manifest)
+
+def run_stage(frames, checkpoint=True):
+    """In-process entry point. The exports always land on disk, so nothing is handed on in memory."""
+    main(frames.get('query-results.csv'))
+    return {}
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Download Screener Excel exports for every NSE code.")
+    parser.add_argument("--workers", type=int, default=NUM_BROWSER_WORKERS, help="Number of browser workers.")
+    parser.add_argument("--max-age-hours", type=float, default=MAX_EXPORT_AGE_HOURS,
+                        help="Skip tickers whose export is younger than this (0 re-downloads everything).")
+    parser.add_argument("--stale-list", default=STALE_LIST_PATH,
+                        help="File of NSE codes to refresh regardless of age.")
+    parser.add_argument("--fetch-mode", choices=["http", "browser"], default=FETCH_MODE,
+                        help="Fetch over HTTP with browser fallback, or use the browser only.")
+    args = parser.parse_args()
+    try:
+        main(num_workers=args.workers, max_age_hours=args.max_age_hours, stale_list_path=args.stale_list,
+             fetch_mode=args.fetch_mode)
+    finally:
+        instrumentation.flush("bulk_downloader")
\ No newline at end of file
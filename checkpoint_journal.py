@@ -0,0 +1,99 @@
+# checkpoint_journal.py (Crash-safe append-only JSONL journal of scorer results)
+import json
+import os
+import time
+
+import pandas as pd
+
+# --- Configuration ---
+JOURNAL_FLUSH_EVERY = 10          # records buffered before a write + fsync
+JOURNAL_FLUSH_SECONDS = 5.0       # ...or this long after the last flush, whichever comes first
+
+class CheckpointJournal:
+    """Append-only record log with an in-memory index of finished keys.
+
+    Records are buffered and written as JSON lines with one fsync per flush, so a crash loses at
+    most the last unflushed batch. A record counts as finished only when all `required` fields are
+    set; failed ones are asked again on the next run. compact() turns the journal into the final
+    CSV and removes it.
+    """
+
+    def __init__(self, path, key="Name", required=(), seed_csv=None):
+        self.path = path
+        self.key = key
+        self.required = list(required)
+        self.records = {}     # key -> latest record
+        self.done = set()     # keys whose record is complete
+        self._buffer = []
+        self._last_flush = time.monotonic()
+
+        if os.path.exists(path):
+            self._load()
+        elif seed_csv and os.path.exists(seed_csv):
+            self._seed(seed_csv)
+
+    # --- Loading ---
+    def _index(self, record):
+        key = record.get(self.key)
+        if key is None:
+            return
+        self.records[key] = record
+        if all(record.get(field) is not None for field in self.required):
+            self.done.add(key)
+        else:
+            self.done.discard(key)
+
+    def _load(self):
+        with open(self.path, encoding='utf-8') as f:
+            for line_number, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    self._index(json.loads(line))
+                except ValueError:
+                    # A crash mid-write can leave one truncated last line
+                    print(f"⚠️ Skipping unreadable journal line {line_number} in {self.path}")
+        print(f"📂 Resuming from {self.path}: {len(self.done)} finished, {len(self.records) - len(self.done)} to retry.")
+
+    def _seed(self, csv_path):
+        """Starts the journal from an existing score CSV (results of earlier runs)."""
+        try:
+            df = pd.read_csv(csv_path)
+        except Exception as e:
+            print(f"⚠️ Error reading {csv_path}: {e}. Proceeding fresh.")
+            return
+        df = df.astype(object).where(df.notna(), None)
+        for record in df.to_dict("records"):
+            self.append(record)
+        self.flush()
+        print(f"📂 Found {len(self.done)} processed companies in {csv_path}.")
+
+    # --- Writing ---
+    def __contains__(self, key):
+        return key in self.done
+
+    def append(self, record):
+        self._index(record)
+        self._buffer.append(json.dumps(record, default=str))
+        if len(self._buffer) >= JOURNAL_FLUSH_EVERY or time.monotonic() - self._last_flush >= JOURNAL_FLUSH_SECONDS:
+            self.flush()
+
+    def flush(self):
+        if self._buffer:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write('\n'.join(self._buffer) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            self._buffer = []
+        self._last_flush = time.monotonic()
+
+    def compact(self, output_path, columns):
+        """Writes the latest record per key to output_path (atomically), drops the journal and returns the frame."""
+        self.flush()
+        df = pd.DataFrame(list(self.records.values()), columns=columns)
+        tmp_path = f"{output_path}.tmp"
+        df.to_csv(tmp_path, index=False)
+        os.replace(tmp_path, output_path)
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        return df
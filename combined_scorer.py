@@ -0,0 +1,98 @@
+# combined_scorer.py (Management and growth scores for every company in one Gemini request per batch)
+import pandas as pd
+
+import checkpoint_journal
+import instrumentation
+import llm_cache
+import scoring_engine
+import security_master
+from quality_mngmnt import MANAGEMENT_SCORE    # importing a scorer module registers its score
+from transcriptions import GROWTH_SCORE
+
+# --- Configuration ---
+INPUT_FILE = r"C:\StockModelPipeline\query-results.csv"
+OUTPUT_FILE = r"C:\StockModelPipeline\query-results_scores.csv"
+FAILED_FILE = r"C:\StockModelPipeline\query-results_scoresfailed.csv"
+JOURNAL_FILE = r"C:\StockModelPipeline\query-results_scores.journal.jsonl"  # resume log of an unfinished run
+
+# Registered scores requested together; each becomes one column of OUTPUT_FILE
+SCORE_NAMES = [MANAGEMENT_SCORE["name"], GROWTH_SCORE["name"]]
+
+def main(df=None, score_names=SCORE_NAMES):
+    """Scores every company on all scores (resuming an interrupted run) and returns them."""
+    client = scoring_engine.get_client()
+    if client is None:
+        print("\n🚫 Cannot run main() due to client initialization failure.")
+        return None
+
+    definitions = [scoring_engine.SCORE_REGISTRY[name] for name in score_names]
+    score_columns = [d["column"] for d in definitions]
+    columns = [security_master.SECURITY_ID, "Name"] + score_columns
+
+    df = pd.read_csv(INPUT_FILE) if df is None else df.copy()
+    if "Name" not in df.columns:
+        raise ValueError("❌ CSV must have a 'Name' column.")
+
+    df["Name"] = df["Name"].astype(str).str.strip()
+    df = df[df["Name"] != ""]
+
+    # Resume: companies an interrupted run already finished are not asked again.
+    # Completed runs are not reused; unchanged scores come back from llm_cache instead.
+    journal = checkpoint_journal.CheckpointJournal(JOURNAL_FILE, required=score_columns)
+    df_remaining = df[[name not in journal for name in df["Name"]]].reset_index(drop=True)
+    print(f"➡️ {len(df_remaining)} companies remaining to process.")
+
+    # Batch answers are keyed by NSE code; companies without one fall back to their name
+    codes = df_remaining["NSE Code"] if "NSE Code" in df_remaining.columns else df_remaining["Name"]
+    codes = codes.where(codes.notna(), df_remaining["Name"]).astype(str).str.strip()
+    names_by_code = dict(zip(codes, df_remaining["Name"]))
+    ids = security_master.get_master().resolve_frame(df_remaining, "combined_scorer", learn=False)
+    ids_by_code = dict(zip(codes, ids))
+
+    failed = []
+    completed = 0
+
+    def to_row(code, scores):
+        return {
+            security_master.SECURITY_ID: None if pd.isna(ids_by_code[code]) else ids_by_code[code],
+            "Name": names_by_code[code],
+            **{d["column"]: scores[d["name"]] for d in definitions},
+        }
+
+    def on_result(code, scores):
+        # Runs on the event loop thread as each company finishes, so appends never interleave
+        nonlocal completed
+        completed += 1
+        row = to_row(code, scores)
+        print(f"({completed}/{len(df_remaining)}) → {row}")
+        journal.append(row)
+        instrumentation.incr("companies_scored")
+        if any(score is None for score in scores.values()):
+            failed.append(row["Name"])
+
+    try:
+        scoring_engine.run_scoring(client, list(names_by_code.items()), definitions, on_result=on_result)
+    finally:
+        journal.flush()
+    llm_cache.get_cache().report()
+    df_scores = journal.compact(OUTPUT_FILE, columns)
+
+    if failed:
+        pd.DataFrame({"Failed_Companies": failed}).to_csv(FAILED_FILE, index=False)
+        print(f"\n⚠️ Companies with a missing score saved to {FAILED_FILE}")
+
+    print(f"\n✅ Completed! Results saved to: {OUTPUT_FILE}")
+    return df_scores
+
+def run_stage(frames, checkpoint=True):
+    """In-process entry point. OUTPUT_FILE is always written; the journal covers resuming."""
+    df_scores = main(frames.get('query-results.csv'))
+    if df_scores is None:
+        raise RuntimeError("Gemini client is not initialized.")
+    return {'query-results_scores.csv': df_scores}
+
+if __name__ == "__main__":
+    try:
+        main()
+    finally:
+        instrumentation.flush("combined_scorer")
@@ -1,16 +1,21 @@
 # final_database_update.py (FINAL, WORKING VERSION)
 import pandas as pd
+import argparse
+import datetime
+import io
 import os
-import psycopg2 
+import re
 import numpy as np
 
+import instrumentation
+import security_master
+from security_master import SECURITY_ID
+
 # --- Configuration (UPDATE THESE) ---
 PROJECT_ROOT = os.getcwd()
 INPUT_PROCESSED_FILE = os.path.join(PROJECT_ROOT, 'Initial_Processed_Data.csv')
-QUANT_FILE = os.path.join(PROJECT_ROOT, 'Master_Quantitative_Data.xlsx') # <-- Source of the new values
-MGMT_SCORE_FILE = os.path.join(PROJECT_ROOT, 'query-results_mngmnt.csv')
-GROWTH_SCORE_FILE = os.path.join(PROJECT_ROOT, 'query-results_growth.csv') 
-OUTPUT_CSV_FOR_SQL = os.path.join(PROJECT_ROOT, 'master_data_for_sql_upload.csv') 
+QUANT_FILE = os.path.join(PROJECT_ROOT, 'Master_Quantitative_Data.parquet') # <-- Source of the new values (directory of part files)
+SCORE_FILE = os.path.join(PROJECT_ROOT, 'query-results_scores.csv') # <-- Management and growth scores (combined_scorer)
 SQL_SCRIPT_PATH = os.path.join(PROJECT_ROOT, 'Master_SQL_Script.sql')
 
 DB_CONFIG = {
@@ -36,143 +41,259 @@ SQL_STAGING_COLUMNS = [
     "COA-Net", "Management Score", "Transcriptions_score" # <--- FINAL DB NAMES (60 columns)
 ]
 
-def combine_and_prepare_data():
-    print("\n--- Merging Data Sources for SQL Upload ---")
-    
-    df_base = pd.read_csv(INPUT_PROCESSED_FILE) 
-    
-    # --- Load and Prepare Quantitative Data from Excel ---
-    df_quant = pd.read_excel(QUANT_FILE)
-    
-    # Standardize column names before merge
-    df_base.columns = df_base.columns.str.strip()
-    df_quant.columns = df_quant.columns.str.strip()
-    df_quant.rename(columns={'Company Name': 'Name'}, inplace=True)
+# --- COPY Target: DataFrame column -> (historical_screener_data column, type) ---
+# Rows are streamed straight into the typed table; there is no staging table or cast INSERT.
+SQL_COLUMN_MAP = {
+    "Name": ("stock_name", "text"), "BSE Code": ("bse_code", "bigint"), "NSE Code": ("nse_code", "text"),
+    "Industry": ("industry", "text"), "Date": ("snapshot_date", "date"),
+    "Current Price": ("current_price", "numeric"), "Price to Earning": ("price_to_earning", "numeric"),
+    "best p/e": ("best_p_e", "numeric"), "Market Capitalization": ("market_capitalization", "numeric"),
+    "Debt to equity": ("debt_to_equity", "numeric"),
+    "FII holdingQ1": ("fii_holding_q1", "numeric"), "FII holdingQ2": ("fii_holding_q2", "numeric"),
+    "FII holgrowth": ("fii_holgrowth", "numeric"), "Public holding": ("public_holding", "numeric"),
+    "Change in FII holding": ("change_in_fii_holding", "numeric"),
+    "Promoter holdingQ1": ("promoter_holding_q1", "numeric"), "Promoter holdingQ2": ("promoter_holding_q2", "numeric"),
+    "Promoter holgrowth": ("promoter_holgrowth", "numeric"),
+    "Change in promoter holding": ("change_in_promoter_holding", "numeric"),
+    "Pledged percentage": ("pledged_percentage", "numeric"),
+    "DII holdingQ1": ("dii_holding_q1", "numeric"), "DII holdingQ2": ("dii_holding_q2", "numeric"),
+    "DII holgrowth": ("dii_holgrowth", "numeric"), "Change in DII holding": ("change_in_dii_holding", "numeric"),
+    "ROCE3yr avg": ("roce_3yr_avg", "numeric"), "PEG Ratio": ("peg_ratio", "numeric"),
+    "Dividend yield": ("dividend_yield", "numeric"),
+    **{f"SalesQ{i}": (f"sales_q{i}", "numeric") for i in range(1, 9)}, "Sales growth": ("sales_growth", "numeric"),
+    **{f"EPS_Q{i}": (f"eps_q{i}", "numeric") for i in range(1, 9)}, "EPSgrowth": ("eps_growth", "numeric"),
+    **{f"OPMQ{i}": (f"opm_q{i}", "numeric") for i in range(1, 9)},
+    "OPM_growth": ("opm_growth", "numeric"), "OPM_4Q": ("opm_4q", "numeric"), "op_avg": ("op_avg", "numeric"),
+    "COA-Net": ("coa_net", "numeric"), "Management Score": ("management_score", "numeric"),
+    "Transcriptions_score": ("transcriptions_score", "numeric"),
+}
+HISTORY_TABLE = "historical_screener_data"     # partitioned by month of snapshot_date
+COPY_TARGET_TABLE = "historical_screener_data_load"   # per-run staging table, upserted into HISTORY_TABLE
+COPY_MARKER = f"-- @LOAD {COPY_TARGET_TABLE}"   # where Master_SQL_Script.sql expects the rows
+REBUILD_SECTION = re.compile(r"^-- @REBUILD$.*?^-- @END REBUILD$", re.MULTILINE | re.DOTALL)
+COPY_CHUNK_ROWS = 50_000
+DATE_FORMAT = '%d-%m-%Y'
 
-    # Normalize common placeholder null-like strings to actual NaN for safe fillna
-    null_like_values = ["NaN", "nan", "None", "none", "N/A", "NA", "-", "—", "", " "]
-    df_base.replace(null_like_values, np.nan, inplace=True)
-    df_quant.replace(null_like_values, np.nan, inplace=True)
-    
-    # --- FIX: Robust Merging Key ---
-    def normalize_key(s):
-        """Creates a robust key for matching names despite whitespace/punctuation differences."""
-        # Remove all non-alphanumeric characters and lowercase
-        return s.astype(str).str.lower().str.replace(r"[^a-z0-9]", "", regex=True)
+# Only these columns are read from the quantitative Parquet output
+QUANT_COLUMNS = [
+    SECURITY_ID, "Company Name", "best p/e", "Sales growth", "op_avg", "OPM_growth", "OPM_4Q", "EPSgrowth", "COA-Net",
+    *[f"SalesQ{i+1}" for i in range(8)],
+    *[f"OPMQ{i+1}" for i in range(8)],
+    *[f"EPS_Q{i+1}" for i in range(8)],
+]
+
+SCORE_COLUMNS = ["Management Score", "Transcriptions_score"]
+
+# --- Merge Schema: declared dtype of every SQL_STAGING_COLUMNS column ---
+# Every numeric column is loaded into a NUMERIC column, so it stays float64: float32 would round
+# ratios and scores to ~7 significant digits and COPY would write e.g. 0.1 as 0.100000001
+SQL_KIND_DTYPES = {"text": "string", "date": "string", "bigint": "Int64", "numeric": "float64"}
+STAGING_DTYPES = {col: SQL_KIND_DTYPES[kind] for col, (_, kind) in SQL_COLUMN_MAP.items()}
+# Placeholder strings treated as missing when the sources are read
+NULL_TOKENS = ["NaN", "nan", "None", "none", "N/A", "NA", "-", "—", "", " "]
 
-    df_base['Name_key'] = normalize_key(df_base['Name'])
-    df_quant['Name_key'] = normalize_key(df_quant['Name'])
+def read_source(path, columns=None):
+    """Reads a CSV with null tokens parsed as NaN at read time, keeping only `columns` (after stripping names)."""
+    usecols = None if columns is None else (lambda c: c.strip() in columns)
+    df = pd.read_csv(path, usecols=usecols, na_values=NULL_TOKENS)
+    df.columns = df.columns.str.strip()
+    return df
 
-    # Merge using the robust key; retain the original 'Name' column from df_base
-    df_merged = df_base.merge(df_quant, on='Name_key', how='left', suffixes=('_base', '_quant'))
+def apply_schema(df):
+    """Casts every schema column of df to its declared dtype; unparseable values and null tokens become NA."""
+    for col in df.columns.intersection(list(STAGING_DTYPES)):
+        dtype = STAGING_DTYPES[col]
+        values = df[col]
+        if dtype == "string":
+            values = values.astype("string").str.strip()
+            df[col] = values.mask(values.isin(NULL_TOKENS))
+        elif dtype == "Int64":
+            df[col] = pd.to_numeric(values, errors='coerce').round().astype("Int64")
+        else:
+            df[col] = pd.to_numeric(values, errors='coerce').astype(dtype)
+    return df
+
+def with_security_id(df, label):
+    """Ensures a Security ID column; rows of sources written without one are resolved through the security master."""
+    ids = df[SECURITY_ID].astype("string") if SECURITY_ID in df.columns else pd.Series(pd.NA, index=df.index, dtype="string")
+    missing = ids.isna()
+    if missing.any():
+        ids[missing] = security_master.get_master().resolve_frame(df[missing], label, learn=False)
+    df[SECURITY_ID] = ids
+    return df
+
+def keyed(df):
+    """One row per Security ID (the last), so a left join never multiplies rows; rows without an ID never match."""
+    return df.drop(columns=['Name']).dropna(subset=[SECURITY_ID]).drop_duplicates(SECURITY_ID, keep='last')
+
+def combine_and_prepare_data(df_base=None, df_quant=None, df_scores=None):
+    """Merges all sources into the upload frame. Frames handed in by the in-process runner skip the file reads."""
+    print("\n--- Merging Data Sources for SQL Upload ---")
+    schema_columns = {*STAGING_DTYPES, SECURITY_ID}
     
-    # Drop the technical key column
-    df_merged.drop(columns=['Name_key'], inplace=True)
-
-    # --- FIX: Prioritize Quantitative Data (df_quant) ---
-    # Merge logic to ensure quantitative data fills non-NaN values from the base data.
-    cols_to_drop = []
-    for col in df_merged.columns:
-        if col.endswith('_base'):
-            base_name = col[:-5] 
-            quant_col = base_name + '_quant'
-            
-            if quant_col in df_merged.columns:
-                # Use the non-null value, prioritizing the quantitative data (_quant)
-                # If _quant is NaN, it falls back to the original base value (_base)
-                df_merged[base_name] = df_merged[quant_col].fillna(df_merged[col])
-                
-                cols_to_drop.append(col)
-                cols_to_drop.append(quant_col)
-            else:
-                 # If the quantitative file didn't have a match, retain the original base column 
-                 # and rename it back
-                 df_merged.rename(columns={col: base_name}, inplace=True)
-        
-        # This handles columns that came ONLY from the quant file. If they are now '_quant' they are duplicates.
-        elif col.endswith('_quant') and col not in cols_to_drop:
-             cols_to_drop.append(col)
+    if df_base is None:
+        df_base = read_source(INPUT_PROCESSED_FILE, schema_columns)
+    else:
+        df_base = df_base.copy()
+        df_base.columns = df_base.columns.str.strip()
+        df_base = df_base[df_base.columns.intersection(list(schema_columns))]
+    df_base = with_security_id(apply_schema(df_base.reset_index(drop=True)), "base data")
     
-    df_merged.drop(columns=cols_to_drop, errors='ignore', inplace=True)
-
-    # --- Load and Merge Score Data (Remains similar) ---
-    def load_scores(file, target_col, source_col):
-        """Loads score CSVs and renames the score column for merging."""
-        
-        base_names = df_base['Name'].unique() 
-        try:
-            df = pd.read_csv(file)
-            df.columns = df.columns.str.strip()
-            df.rename(columns={'Company Name': 'Name'}, inplace=True, errors='ignore') 
-            df.replace(null_like_values, np.nan, inplace=True) # Normalize nulls in score files too
-            
-            if 'Name' not in df.columns or source_col not in df.columns:
-                # Fallback on the original base names if the merge key fails
-                return pd.DataFrame({'Name': base_names, target_col: np.nan})
-            
-            # Merge on normalized key for score files as well for consistency
-            df['Name_key'] = normalize_key(df['Name'])
-            
-            # Create a simple frame using the normalized key for merging
-            return df[['Name_key', source_col]].rename(columns={source_col: target_col})
-            
-        except Exception as e:
-            print(f"❌ Error loading score file {file}: {e}. Filling with NaN.")
-            return pd.DataFrame({'Name_key': df_merged['Name_key'].unique(), target_col: np.nan})
+    # --- Load and Prepare Quantitative Data from Parquet ---
+    df_quant = pd.read_parquet(QUANT_FILE, columns=QUANT_COLUMNS) if df_quant is None else df_quant.copy()
+    df_quant.columns = df_quant.columns.str.strip()
+    df_quant = with_security_id(apply_schema(df_quant.rename(columns={'Company Name': 'Name'})), "quantitative data")
 
-    df_mgmt = load_scores(MGMT_SCORE_FILE, 'Management Score', 'Management Score') 
-    df_growth = load_scores(GROWTH_SCORE_FILE, 'Transcriptions_score', 'Transcriptions_score') 
-    
-    # Merge scores using the Name_key from the main merged DataFrame
-    df_merged = df_merged.merge(df_mgmt, on='Name', how='left') # Assume scores file uses original Name, if not, change 'Name' to 'Name_key'
-    df_merged = df_merged.merge(df_growth, on='Name', how='left')
+    # --- Load Score Data ---
+    try:
+        if df_scores is None:
+            df_scores = read_source(SCORE_FILE, [SECURITY_ID, "Name", *SCORE_COLUMNS])
+        else:
+            df_scores = df_scores.copy()
+            df_scores.columns = df_scores.columns.str.strip()
+        df_scores = apply_schema(df_scores.reindex(columns=[SECURITY_ID, "Name", *SCORE_COLUMNS]))
+    except Exception as e:
+        print(f"❌ Error loading score file {SCORE_FILE}: {e}. Filling with NaN.")
+        df_scores = pd.DataFrame(columns=[SECURITY_ID, "Name", *SCORE_COLUMNS])
+    df_scores = with_security_id(df_scores, "scores")
+
+    # --- Single Exact Join on the Security ID ---
+    # Quantitative values and scores are aligned to the base rows, then take priority
+    # over the base values in one vectorized combine (base only fills their gaps)
+    df_quant, df_scores = keyed(df_quant), keyed(df_scores)
+    master = security_master.get_master()
+    master.report_join("quantitative data", df_base[SECURITY_ID], df_quant[SECURITY_ID])
+    master.report_join("scores", df_base[SECURITY_ID], df_scores[SECURITY_ID])
+    df_updates = (
+        df_base[[SECURITY_ID]]
+        .merge(df_quant, on=SECURITY_ID, how='left')
+        .merge(df_scores, on=SECURITY_ID, how='left')
+        .drop(columns=[SECURITY_ID])
+    )
+    df_merged = df_updates.combine_first(df_base)
     
     # --- Final Column Cleanup and Selection ---
-    
-    if 'Industry Group' in df_merged.columns:
-        df_merged.drop(columns=['Industry Group'], inplace=True)
-    
     missing_cols = [col for col in SQL_STAGING_COLUMNS if col not in df_merged.columns]
     if missing_cols:
         print(f"⚠️ Warning: Adding missing columns (filled with NaN): {missing_cols}")
-        for col in missing_cols:
-            df_merged[col] = np.nan
     
     # Select and order the columns precisely for the COPY command
-    df_final = df_merged.reindex(columns=SQL_STAGING_COLUMNS)
+    df_final = df_merged.reindex(columns=SQL_STAGING_COLUMNS).astype(STAGING_DTYPES)
+    instrumentation.incr("rows_prepared", len(df_final))
+    print(f"✅ Combined data prepared: {len(df_final)} rows, {len(df_final.columns)} columns.")
+    return df_final
 
-    # Convert NaNs to 'NaN' string for PostgreSQL COPY command
-    df_final.replace({np.nan: 'NaN', None: 'NaN', pd.NaT: 'NaN'}, inplace=True)
-    
-    df_final.to_csv(OUTPUT_CSV_FOR_SQL, index=False, na_rep='NaN')
-    print(f"✅ Combined data saved to {OUTPUT_CSV_FOR_SQL} with {len(df_final.columns)} columns.")
-    return OUTPUT_CSV_FOR_SQL
+# --- COPY FROM STDIN ---
+def to_copy_frame(df_final):
+    """Renames to historical_screener_data columns and converts each one to its SQL type (missing -> None/NaN)."""
+    df_copy = pd.DataFrame(index=df_final.index)
+    for source_col, (sql_col, sql_type) in SQL_COLUMN_MAP.items():
+        values = df_final[source_col]
+        if sql_type == "numeric":
+            df_copy[sql_col] = pd.to_numeric(values, errors='coerce').replace([np.inf, -np.inf], np.nan)
+        elif sql_type == "bigint":
+            df_copy[sql_col] = pd.to_numeric(values, errors='coerce').round().astype('Int64')
+        elif sql_type == "date":
+            df_copy[sql_col] = pd.to_datetime(values, format=DATE_FORMAT, errors='coerce').dt.strftime('%Y-%m-%d')
+        else:
+            df_copy[sql_col] = values.where(values.notna(), None)
+    return df_copy
+
+def copy_dataframe(cursor, df_copy, table=COPY_TARGET_TABLE, chunk_rows=COPY_CHUNK_ROWS):
+    """Streams a to_copy_frame() frame from memory into `table` with COPY FROM STDIN, chunk_rows rows per COPY."""
+    columns = ", ".join(f'"{c}"' for c in df_copy.columns)
+    copy_sql = f"COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv, NULL '')"
+
+    rows_loaded = 0
+    for start in range(0, len(df_copy), chunk_rows):
+        buffer = io.StringIO()
+        # Unquoted empty fields are NULL; numbers keep full float precision
+        df_copy.iloc[start:start + chunk_rows].to_csv(buffer, header=False, index=False, na_rep='')
+        buffer.seek(0)
+        with instrumentation.timer("postgres.copy"):
+            cursor.copy_expert(copy_sql, buffer)
+        rows_loaded += max(cursor.rowcount, 0)
+    instrumentation.incr("postgres.rows_loaded", rows_loaded)
+    return rows_loaded
+
+# --- Snapshot Partitions ---
+def snapshot_dates(df_copy):
+    return sorted(datetime.date.fromisoformat(d) for d in df_copy["snapshot_date"].dropna().unique())
+
+def ensure_partitions(cursor, dates, table=HISTORY_TABLE):
+    """Creates the monthly partition of `table` for every month in `dates` that has none yet."""
+    for month in sorted({d.replace(day=1) for d in dates}):
+        next_month = (month + datetime.timedelta(days=32)).replace(day=1)
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {table}_{month:%Y_%m} PARTITION OF {table} "
+            f"FOR VALUES FROM ('{month}') TO ('{next_month}')"
+        )
+
+def needs_rebuild(cursor, table=HISTORY_TABLE):
+    """True if `table` still exists as the old unpartitioned table (it only ever held one snapshot)."""
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (table,))
+    row = cursor.fetchone()
+    return row is not None and row[0] != 'p'
+
+# --- Database Execution ---
+def is_comment_only(chunk):
+    return all(not line.strip() or line.strip().startswith('--') for line in chunk.splitlines())
 
-# --- Database Execution (No Fixes Needed Here) ---
-def execute_sql_script(csv_path):
+def split_commands(sql):
+    """Statements of a script split on ';'. Chunks holding only comments (e.g. section banners) are skipped."""
+    return [cmd for cmd in sql.split(';') if not is_comment_only(cmd)]
+
+def load_script_commands(script, rebuild=False):
+    """Commands to run before and after the COPY; the @REBUILD section is only kept when rebuild is set."""
+    if COPY_MARKER not in script:
+        raise ValueError(f"{SQL_SCRIPT_PATH} has no '{COPY_MARKER}' line to load the data at.")
+    if not rebuild:
+        script = REBUILD_SECTION.sub("", script)
+    before_load, after_load = script.split(COPY_MARKER, 1)
+    return split_commands(before_load), split_commands(after_load)
+
+def execute_sql_script(df_final, rebuild=False):
+    """Upserts the snapshot date(s) of df_final; rebuild=True drops every table (and all history) first."""
+    import psycopg2    # only needed for the upload; the merge and script parsing work without it
     print("\n--- Executing SQL Commands via psycopg2 ---")
     
     with open(SQL_SCRIPT_PATH, 'r') as f:
         master_sql_script = f.read()
+    load_script_commands(master_sql_script)
+
+    df_copy = to_copy_frame(df_final)
+    missing_dates = df_copy["snapshot_date"].isna()
+    if missing_dates.any():
+        print(f"⚠️ Warning: Skipping {missing_dates.sum()} rows without a valid Date.")
+        df_copy = df_copy[~missing_dates]
+    dates = snapshot_dates(df_copy)
+    if not dates:
+        print("⚠️ No rows to load. Database left unchanged.")
+        return
 
     conn = None
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        cursor = conn.cursor()
-        
-        sql_safe_path = csv_path.replace(os.sep, '/')
-        final_sql = master_sql_script.replace("'<path/to/nifty-total-market.csv>'", f"'{sql_safe_path}'")
-        commands = [cmd for cmd in final_sql.split(';') if cmd.strip() != '']
-        
-        for command in commands:
-            if command.strip().startswith("COPY"):
-                copy_command = f"COPY historical_screener_data_staging FROM '{sql_safe_path}' DELIMITER ',' CSV HEADER NULL 'NaN';"
-                print("Executing COPY command...")
-                cursor.execute(copy_command)
-            else:
+        with instrumentation.timer("postgres.load"):
+            conn = psycopg2.connect(**DB_CONFIG)
+            cursor = conn.cursor()
+
+            if not rebuild and needs_rebuild(cursor):
+                print(f"♻️ {HISTORY_TABLE} is not partitioned yet. Rebuilding all tables once.")
+                rebuild = True
+            before_load, after_load = load_script_commands(master_sql_script, rebuild)
+            
+            for command in before_load:
                 cursor.execute(command)
+            ensure_partitions(cursor, dates)
+
+            print("Executing COPY FROM STDIN...")
+            rows_loaded = copy_dataframe(cursor, df_copy)
+            print(f"📥 {rows_loaded} rows staged for snapshot date(s) {', '.join(map(str, dates))}.")
 
-        conn.commit()
+            for command in after_load:
+                cursor.execute(command)
+
+            conn.commit()
         print("✅ PostgreSQL Database updated successfully.")
 
     except psycopg2.Error as e:
@@ -181,9 +302,26 @@ def execute_sql_script(csv_path):
     finally:
         if conn: conn.close()
 
-def main():
-    csv_to_upload = combine_and_prepare_data()
-    execute_sql_script(csv_to_upload)
+def main(rebuild=False):
+    df_final = combine_and_prepare_data()
+    execute_sql_script(df_final, rebuild=rebuild)
+
+def run_stage(frames, checkpoint=True):
+    """In-process entry point. Nothing is written to disk; the merged frame is streamed to PostgreSQL."""
+    df_final = combine_and_prepare_data(
+        frames.get('Initial_Processed_Data.csv'),
+        frames.get('Master_Quantitative_Data.parquet'),
+        frames.get('query-results_scores.csv'),
+    )
+    execute_sql_script(df_final)
+    return {}
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Merge all sources and upsert today's snapshot into PostgreSQL.")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="Drop and recreate every table first. Deletes all earlier snapshots.")
+    args = parser.parse_args()
+    try:
+        main(rebuild=args.rebuild)
+    finally:
+        instrumentation.flush("final_database_update")
\ No newline at end of file
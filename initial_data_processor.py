@@ -4,20 +4,16 @@ import os
 import datetime
 import numpy as np
 
+import security_master
+
 PROJECT_ROOT = os.getcwd() 
 INPUT_CSV_PATH = os.path.join(PROJECT_ROOT, 'query-results.csv') 
 OUTPUT_CSV_PATH = os.path.join(PROJECT_ROOT, 'Initial_Processed_Data.csv')
 
-def process_initial_data():
-    print("\n--- Running Initial Data Processor ---")
-    
-    try:
-        df = pd.read_csv(INPUT_CSV_PATH)
-    except FileNotFoundError:
-        raise
-    
-    df.columns = df.columns.str.strip()
-    df_temp = df.copy() 
+def process_initial_frame(df):
+    """Applies the date stamp, Q1 renames and holding trend metrics to the raw screener frame."""
+    df_temp = df.copy()
+    df_temp.columns = df_temp.columns.str.strip()
     
     # 1. Add 'Date' column (FIX: Use clean format DD-MM-YYYY)
     df_temp['Date'] = datetime.date.today().strftime('%d-%m-%Y')
@@ -49,10 +45,40 @@ def process_initial_data():
         df_temp.loc[mask, growth_col] = ((df_temp.loc[mask, q1_col] / df_temp.loc[mask, q2_col]) - 1) * 100
         df_temp.loc[~mask, growth_col] = np.nan 
 
-    # 4. Save the processed data
+    # 4. Canonical Security ID (new listings are registered in the security master)
+    master = security_master.get_master()
+    df_temp.insert(0, security_master.SECURITY_ID, master.resolve_frame(df_temp, "initial_data_processor"))
+    master.save()
+
+    return df_temp
+
+def process_initial_data():
+    print("\n--- Running Initial Data Processor ---")
+    
+    try:
+        df = pd.read_csv(INPUT_CSV_PATH)
+    except FileNotFoundError:
+        raise
+    
+    df_temp = process_initial_frame(df)
+
+    # 5. Save the processed data
     df_temp.to_csv(OUTPUT_CSV_PATH, index=False)
     
     print(f"✅ Initial data processed and saved to {OUTPUT_CSV_PATH}")
 
+def run_stage(frames, checkpoint=True):
+    """In-process entry point: takes the raw frame from `frames` and returns the processed one."""
+    df = frames.get('query-results.csv')
+    if df is None:
+        df = pd.read_csv(INPUT_CSV_PATH)
+
+    df_temp = process_initial_frame(df)
+    if checkpoint:
+        df_temp.to_csv(OUTPUT_CSV_PATH, index=False)
+        print(f"💾 Checkpoint written to {OUTPUT_CSV_PATH}")
+
+    return {'Initial_Processed_Data.csv': df_temp}
+
 if __name__ == "__main__":
     process_initial_data()
\ No newline at end of file
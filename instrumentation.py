@@ -0,0 +1,187 @@
+# instrumentation.py (Run metrics: timings, counters, JSON run manifest and Prometheus textfile)
+import datetime
+import glob
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# --- Configuration ---
+# Next to the pipeline scripts, not wherever the pipeline was launched from
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+# Every process of a run writes its metrics here; pipeline_main merges them at the end
+METRICS_DIRECTORY = os.environ.get('MARKETLENS_METRICS_DIR', os.path.join(PROJECT_ROOT, 'run_metrics'))
+RUN_MANIFEST_PATH = os.path.join(PROJECT_ROOT, 'run_manifest.json')
+PROMETHEUS_TEXTFILE_PATH = os.path.join(PROJECT_ROOT, 'marketlens.prom')
+PERCENTILES = (50, 90, 95, 99)
+
+# --- Recorder ---
+class Recorder:
+    """Thread-safe store of raw timing samples and counters, grouped by metric and optional key (e.g. ticker)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.timings = {}   # metric -> key -> [seconds]
+            self.counters = {}  # metric -> key -> count
+
+    def observe(self, metric, seconds, key=None):
+        with self._lock:
+            self.timings.setdefault(metric, {}).setdefault(key or '', []).append(seconds)
+
+    def incr(self, metric, n=1, key=None):
+        with self._lock:
+            by_key = self.counters.setdefault(metric, {})
+            by_key[key or ''] = by_key.get(key or '', 0) + n
+
+    @contextmanager
+    def timer(self, metric, key=None):
+        """Times the block under `metric`; an exception escaping the block also counts as `<metric>.errors`."""
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.incr(f'{metric}.errors', key=key)
+            raise
+        finally:
+            self.observe(metric, time.perf_counter() - start, key=key)
+
+    def export(self):
+        with self._lock:
+            return {
+                'timings': {m: {k: list(v) for k, v in by_key.items()} for m, by_key in self.timings.items()},
+                'counters': {m: dict(by_key) for m, by_key in self.counters.items()},
+            }
+
+RECORDER = Recorder()
+observe = RECORDER.observe
+incr = RECORDER.incr
+timer = RECORDER.timer
+
+# --- Fragments (one per process / in-process stage) ---
+def _merge_raw(target, raw):
+    for metric, by_key in raw.get('timings', {}).items():
+        for key, samples in by_key.items():
+            target['timings'].setdefault(metric, {}).setdefault(key, []).extend(samples)
+    for metric, by_key in raw.get('counters', {}).items():
+        for key, n in by_key.items():
+            counts = target['counters'].setdefault(metric, {})
+            counts[key] = counts.get(key, 0) + n
+    return target
+
+def flush(component):
+    """Writes everything recorded so far to this component's fragment file, then resets the recorder."""
+    raw = RECORDER.export()
+    RECORDER.reset()
+    if not raw['timings'] and not raw['counters']:
+        return
+
+    os.makedirs(METRICS_DIRECTORY, exist_ok=True)
+    path = os.path.join(METRICS_DIRECTORY, f'{component}.json')
+    if os.path.exists(path):
+        with open(path) as f:
+            raw = _merge_raw(json.load(f), raw)
+    _write_atomic(path, json.dumps(raw))
+
+def reset_run():
+    """Removes fragments left over from a previous run."""
+    for path in glob.glob(os.path.join(METRICS_DIRECTORY, '*.json')):
+        os.remove(path)
+
+# --- Summaries ---
+def percentile(sorted_samples, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_samples:
+        return None
+    rank = max(1, math.ceil(p / 100 * len(sorted_samples)))
+    return sorted_samples[rank - 1]
+
+def summarize(samples):
+    ordered = sorted(samples)
+    summary = {'count': len(ordered), 'total_seconds': round(sum(ordered), 6), 'max_seconds': ordered[-1] if ordered else None}
+    summary.update({f'p{p}_seconds': percentile(ordered, p) for p in PERCENTILES})
+    return summary
+
+def summarize_component(raw):
+    timings = {}
+    for metric, by_key in raw.get('timings', {}).items():
+        all_samples = [s for samples in by_key.values() for s in samples]
+        timings[metric] = summarize(all_samples)
+        keyed = {k: summarize(v) for k, v in by_key.items() if k}
+        if keyed:
+            timings[metric]['by_key'] = keyed
+
+    counters = {}
+    for metric, by_key in raw.get('counters', {}).items():
+        counters[metric] = {'total': sum(by_key.values())}
+        keyed = {k: n for k, n in by_key.items() if k}
+        if keyed:
+            counters[metric]['by_key'] = keyed
+
+    return {'timings': timings, 'counters': counters}
+
+# --- Run Manifest & Prometheus Export ---
+def _write_atomic(path, text):
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+def _prometheus_name(metric):
+    return ''.join(c if c.isalnum() else '_' for c in metric)
+
+def render_prometheus(components):
+    """Per-key breakdowns (one series per ticker) stay in the JSON manifest to keep label cardinality low."""
+    lines = [
+        '# HELP marketlens_duration_seconds Wall time of instrumented operations.',
+        '# TYPE marketlens_duration_seconds summary',
+    ]
+    for component, summary in sorted(components.items()):
+        for metric, stats in sorted(summary['timings'].items()):
+            labels = f'component="{component}",metric="{_prometheus_name(metric)}"'
+            for p in PERCENTILES:
+                lines.append(f'marketlens_duration_seconds{{{labels},quantile="{p / 100}"}} {stats[f"p{p}_seconds"]}')
+            lines.append(f'marketlens_duration_seconds_sum{{{labels}}} {stats["total_seconds"]}')
+            lines.append(f'marketlens_duration_seconds_count{{{labels}}} {stats["count"]}')
+
+    lines += [
+        '# HELP marketlens_events_total Counted events (retries, errors, rows processed).',
+        '# TYPE marketlens_events_total counter',
+    ]
+    for component, summary in sorted(components.items()):
+        for metric, stats in sorted(summary['counters'].items()):
+            labels = f'component="{component}",metric="{_prometheus_name(metric)}"'
+            lines.append(f'marketlens_events_total{{{labels}}} {stats["total"]}')
+
+    lines += [
+        '# HELP marketlens_last_run_timestamp_seconds Unix time at which this run\'s metrics were written.',
+        '# TYPE marketlens_last_run_timestamp_seconds gauge',
+        f'marketlens_last_run_timestamp_seconds {int(time.time())}',
+    ]
+    return '\n'.join(lines) + '\n'
+
+def write_run_manifest(run_info=None):
+    """Merges every fragment of this run into RUN_MANIFEST_PATH and PROMETHEUS_TEXTFILE_PATH."""
+    components = {}
+    for path in sorted(glob.glob(os.path.join(METRICS_DIRECTORY, '*.json'))):
+        component = os.path.splitext(os.path.basename(path))[0]
+        try:
+            with open(path) as f:
+                components[component] = summarize_component(json.load(f))
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Could not read metrics fragment {path}: {e}")
+
+    manifest = {
+        'generated_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        **(run_info or {}),
+        'components': components,
+    }
+    _write_atomic(RUN_MANIFEST_PATH, json.dumps(manifest, indent=2))
+    _write_atomic(PROMETHEUS_TEXTFILE_PATH, render_prometheus(components))
+    print(f"📈 Run manifest written to {RUN_MANIFEST_PATH} and {PROMETHEUS_TEXTFILE_PATH}")
+    return manifest
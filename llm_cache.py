@@ -0,0 +1,153 @@
+# llm_cache.py (SQLite cache of Gemini scores per model, prompt template, company and fiscal period)
+import datetime
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import instrumentation
+
+# --- Configuration ---
+PROJECT_ROOT = os.getcwd()
+LLM_CACHE_PATH = os.path.join(PROJECT_ROOT, 'llm_cache.sqlite')
+LLM_CACHE_TTL_DAYS = 120          # a score is never reused past this age, even within the same period
+LLM_CACHE_MAX_ENTRIES = 50_000    # least recently used entries beyond this are evicted
+FISCAL_YEAR_START_MONTH = 4       # Indian fiscal year: April - March
+
+# --- Keys ---
+def fiscal_period(date=None):
+    """Indian fiscal quarter of `date` (default today), e.g. 'FY2025-26 Q3' for October 2025."""
+    date = date or datetime.date.today()
+    start_year = date.year if date.month >= FISCAL_YEAR_START_MONTH else date.year - 1
+    quarter = (date.month - FISCAL_YEAR_START_MONTH) % 12 // 3 + 1
+    return f"FY{start_year}-{str(start_year + 1)[2:]} Q{quarter}"
+
+def template_hash(build_prompt, build_batch_prompt=None):
+    """Hash of the prompt wording, rendered with placeholders so any change to the template changes the key."""
+    digest = hashlib.sha256(build_prompt("{company}").encode())
+    if build_batch_prompt is not None:
+        digest.update(build_batch_prompt([("{code}", "{company}")]).encode())
+    return digest.hexdigest()[:16]
+
+# --- Cache ---
+class LLMCache:
+    """Scores keyed by (model, template hash, company, fiscal period), with TTL and LRU eviction."""
+
+    def __init__(self, path=LLM_CACHE_PATH, ttl_days=LLM_CACHE_TTL_DAYS, max_entries=LLM_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl_seconds = ttl_days * 86400
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_scores (
+                model TEXT NOT NULL,
+                template_hash TEXT NOT NULL,
+                company TEXT NOT NULL,
+                fiscal_period TEXT NOT NULL,
+                score REAL NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, template_hash, company, fiscal_period)
+            )
+        """)
+        self.evict()
+
+    def get(self, model, template, company, period):
+        """Returns the cached score, or None on a miss (unknown, expired or from another period)."""
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT score, created_at FROM llm_scores "
+                "WHERE model = ? AND template_hash = ? AND company = ? AND fiscal_period = ?",
+                (model, template, company, period),
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                self.misses += 1
+                instrumentation.incr("llm_cache.misses")
+                return None
+            self.conn.execute(
+                "UPDATE llm_scores SET last_used = ? "
+                "WHERE model = ? AND template_hash = ? AND company = ? AND fiscal_period = ?",
+                (now, model, template, company, period),
+            )
+            self.conn.commit()
+            self.hits += 1
+            instrumentation.incr("llm_cache.hits")
+            return row[0]
+
+    def put(self, model, template, company, period, score):
+        """Stores a valid score; failed (None) scores are never cached so they are retried next run."""
+        if score is None:
+            return
+        now = time.time()
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO llm_scores VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (model, template, company, period, score, now, now),
+            )
+            self.conn.commit()
+
+    def evict(self):
+        """Drops expired entries, then the least recently used ones beyond max_entries."""
+        with self._lock:
+            expired = self.conn.execute(
+                "DELETE FROM llm_scores WHERE created_at < ?", (time.time() - self.ttl_seconds,)
+            ).rowcount
+            overflow = self.conn.execute(
+                "DELETE FROM llm_scores WHERE rowid IN ("
+                "SELECT rowid FROM llm_scores ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            ).rowcount
+            self.conn.commit()
+        if expired or overflow:
+            print(f"🧹 LLM cache: evicted {expired} expired and {overflow} least recently used entries.")
+
+    def scope(self, model, template, period=None):
+        return CacheScope(self, model, template, period or fiscal_period())
+
+    def report(self):
+        lookups = self.hits + self.misses
+        if lookups:
+            print(f"📊 LLM cache: {self.hits}/{lookups} hits ({self.hits / lookups:.0%}), "
+                  f"{self.misses} scores had to be requested.")
+
+    def close(self):
+        self.conn.close()
+
+class CacheScope:
+    """The cache seen by one scorer run: model, template and fiscal period are fixed, only the company varies."""
+
+    def __init__(self, cache, model, template, period):
+        self.cache = cache
+        self.model = model
+        self.template = template
+        self.period = period
+
+    def get(self, company):
+        return self.cache.get(self.model, self.template, company, self.period)
+
+    def put(self, company, score):
+        self.cache.put(self.model, self.template, company, self.period, score)
+
+_CACHE = None
+
+def get_cache():
+    """Process-wide cache, opened on first use."""
+    global _CACHE
+    if _CACHE is None:
+        _CACHE = LLMCache()
+    return _CACHE
+
+if __name__ == "__main__":
+    cache = get_cache()
+    rows = cache.conn.execute(
+        "SELECT model, template_hash, fiscal_period, COUNT(*) FROM llm_scores "
+        "GROUP BY model, template_hash, fiscal_period ORDER BY fiscal_period"
+    ).fetchall()
+    print(f"🗃️ {LLM_CACHE_PATH}")
+    for model, template, period, count in rows:
+        print(f"  {period}  {model}  template {template}: {count} scores")
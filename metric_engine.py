@@ -0,0 +1,61 @@
+# metric_engine.py (Vectorized growth / EPS / OPM / COA-Net metrics for the whole universe)
+import numpy as np
+import pandas as pd
+
+# Net profit is reported in crores; EPS = net profit x 1 crore / number of equity shares
+CRORE = 10_000_000
+
+def to_numeric_matrix(values):
+    """Converts raw cells (any shape, any types) to float64 the way pd.to_numeric(errors='coerce') does per cell."""
+    raw = np.asarray(values, dtype=object)
+    flat = pd.to_numeric(pd.Series(raw.ravel(), dtype=object), errors='coerce')
+    return flat.to_numpy(dtype=np.float64).reshape(raw.shape)
+
+def ttm_growth(quarterly):
+    """N x 8 quarters (oldest first) -> (latest TTM, previous TTM, growth %). Growth is NaN where previous TTM is 0."""
+    ttm_2 = np.nansum(quarterly[:, 0:4], axis=1)
+    ttm_1 = np.nansum(quarterly[:, 4:8], axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        growth = np.where(ttm_2 != 0, ((ttm_1 / ttm_2) - 1) * 100, np.nan)
+    return ttm_1, ttm_2, growth
+
+def eps_matrix(net_profits, equity_shares):
+    """N x 8 net profits and N equity share counts -> N x 8 EPS; NaN where profit is missing or shares <= 0."""
+    shares = equity_shares[:, None]
+    valid = ~np.isnan(net_profits) & (shares > 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(valid, (net_profits * CRORE) / shares, np.nan)
+
+def annual_growth(annual):
+    """N x k annual values -> N x (k-1) growth factors (Curr / Prev * 100); NaN where Prev is 0."""
+    prev, curr = annual[:, :-1], annual[:, 1:]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(prev != 0, (curr / prev) * 100, np.nan)
+
+def coa_net(cfo_growth, sales_growth):
+    """Counts the years where CFO growth >= 70% of sales growth; inf/NaN years never count."""
+    comparable = np.isfinite(cfo_growth) & np.isfinite(sales_growth)
+    with np.errstate(invalid='ignore'):
+        return np.sum(comparable & (cfo_growth >= (0.70 * sales_growth)), axis=1)
+
+def compute_metrics(sales_q, op_q, opm_q, net_profit_q, equity_shares, sales_annual, cfo_annual):
+    """Computes every derived figure for N stocks at once. Inputs may hold raw cells; they are coerced first."""
+    sales_q, op_q, opm_q, net_profit_q = (to_numeric_matrix(m) for m in (sales_q, op_q, opm_q, net_profit_q))
+    equity_shares = to_numeric_matrix(equity_shares)
+    sales_annual, cfo_annual = to_numeric_matrix(sales_annual), to_numeric_matrix(cfo_annual)
+
+    _, _, sales_growth = ttm_growth(sales_q)
+    _, _, op_growth = ttm_growth(op_q)
+    opm_4q_sum, _, opm_growth = ttm_growth(opm_q)
+    eps = eps_matrix(net_profit_q, equity_shares)
+    _, _, eps_growth = ttm_growth(eps)
+
+    return {
+        "Sales growth": sales_growth,
+        "op_avg": op_growth,
+        "OPM_growth": opm_growth,
+        "OPM_4Q": opm_4q_sum,
+        "EPS_Q": eps,
+        "EPSgrowth": eps_growth,
+        "COA-Net": coa_net(annual_growth(cfo_annual), annual_growth(sales_annual)),
+    }
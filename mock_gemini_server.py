@@ -0,0 +1,184 @@
+# mock_gemini_server.py (Local stand-in for Gemini's generateContent endpoint, for tests and benchmarks)
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# --- Configuration ---
+DEFAULT_PORT = 8765
+# Fractions of requests answered with each failure; the rest get a valid score
+DEFAULT_BEHAVIOUR = {
+    "latency": 0.5,            # mean seconds per answer
+    "latency_jitter": 0.25,    # +/- uniform
+    "error_rate": 0.0,         # HTTP 500
+    "throttle_rate": 0.0,      # HTTP 429 at random
+    "rpm": 0,                  # HTTP 429 once more than this many requests arrive in a minute (0 = no limit)
+    "empty_rate": 0.0,         # empty text
+    "non_numeric_rate": 0.0,   # prose instead of a number / JSON
+    "out_of_range_rate": 0.0,  # numbers outside every score range
+    "drop_rate": 0.0,          # batch answers: fraction of companies left out
+}
+
+GENERATE_PATH = re.compile(r"^/[^/]+/models/([^/:]+):generateContent")
+COMPANY_LINE = re.compile(r"^- (\S+):", re.MULTILINE)
+SCORE_LINE = re.compile(r'^"(\w+)" - a number', re.MULTILINE)
+
+# --- Answers ---
+def _score():
+    return round(random.uniform(1, 10), 1)
+
+def _bad_value(shape):
+    return {"non_numeric": "strong", "out_of_range": 42.0}[shape]
+
+def build_answer(prompt, behaviour):
+    """Text the model 'returns' for this prompt; single-score prompts get a number, batch prompts JSON."""
+    roll = random.random()
+    shape = "ok"
+    for name in ("empty", "non_numeric", "out_of_range"):
+        rate = behaviour[f"{name}_rate"]
+        if roll < rate:
+            shape = name
+            break
+        roll -= rate
+
+    if shape == "empty":
+        return ""
+
+    codes = COMPANY_LINE.findall(prompt)
+    if not codes:
+        return "I cannot say." if shape == "non_numeric" else str(_bad_value(shape) if shape != "ok" else _score())
+
+    score_names = SCORE_LINE.findall(prompt)
+    if shape == "non_numeric" and random.random() < 0.5:
+        return "Here are the scores you asked for."    # not JSON at all
+    answer = {}
+    for code in codes:
+        if random.random() < behaviour["drop_rate"]:
+            continue
+        value = lambda: _bad_value(shape) if shape != "ok" and random.random() < 0.5 else _score()
+        answer[code] = {name: value() for name in score_names} if score_names else value()
+    return json.dumps(answer)
+
+def generate_response(text, prompt_tokens, model):
+    return {
+        "candidates": [{
+            "content": {"parts": [{"text": text}], "role": "model"},
+            "finishReason": "STOP",
+            "index": 0,
+        }],
+        "usageMetadata": {
+            "promptTokenCount": prompt_tokens,
+            "candidatesTokenCount": max(1, len(text) // 4),
+            "totalTokenCount": prompt_tokens + max(1, len(text) // 4),
+        },
+        "modelVersion": model,
+    }
+
+def error_response(code, status, message):
+    return {"error": {"code": code, "message": message, "status": status}}
+
+# --- Server ---
+class MockGeminiServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, behaviour=None):
+        super().__init__(address, MockGeminiHandler)
+        self.behaviour = {**DEFAULT_BEHAVIOUR, **(behaviour or {})}
+        self.lock = threading.Lock()
+        self.arrivals = deque()
+        self.stats = {"requests": 0, "ok": 0, "throttled": 0, "errors": 0}
+
+    @property
+    def base_url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def admit(self):
+        """Decides how to answer the next request: 'ok', 'throttled' or 'error'."""
+        with self.lock:
+            now = time.monotonic()
+            self.stats["requests"] += 1
+            while self.arrivals and now - self.arrivals[0] >= 60:
+                self.arrivals.popleft()
+            self.arrivals.append(now)
+
+            rpm = self.behaviour["rpm"]
+            if (rpm and len(self.arrivals) > rpm) or random.random() < self.behaviour["throttle_rate"]:
+                outcome = "throttled"
+            elif random.random() < self.behaviour["error_rate"]:
+                outcome = "errors"
+            else:
+                outcome = "ok"
+            self.stats[outcome] += 1
+            return outcome
+
+class MockGeminiHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=UTF-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/stats":
+            with self.server.lock:
+                self._send_json(200, dict(self.server.stats))
+        else:
+            self._send_json(404, error_response(404, "NOT_FOUND", "Unknown path."))
+
+    def do_POST(self):
+        match = GENERATE_PATH.match(self.path)
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if not match:
+            self._send_json(404, error_response(404, "NOT_FOUND", "Unknown path."))
+            return
+
+        behaviour = self.server.behaviour
+        time.sleep(max(0.0, behaviour["latency"] + random.uniform(-1, 1) * behaviour["latency_jitter"]))
+
+        outcome = self.server.admit()
+        if outcome == "throttled":
+            self._send_json(429, error_response(429, "RESOURCE_EXHAUSTED", "Resource has been exhausted (mock)."))
+            return
+        if outcome == "errors":
+            self._send_json(500, error_response(500, "INTERNAL", "Internal error (mock)."))
+            return
+
+        prompt = "".join(
+            part.get("text", "") for content in request.get("contents", []) for part in content.get("parts", [])
+        )
+        text = build_answer(prompt, behaviour)
+        self._send_json(200, generate_response(text, len(prompt) // 4, match.group(1)))
+
+def start_server(behaviour=None, host="127.0.0.1", port=0):
+    """Starts the mock in a background thread (port 0 = any free port) and returns the server."""
+    server = MockGeminiServer((host, port), behaviour)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def add_behaviour_arguments(parser):
+    for name, default in DEFAULT_BEHAVIOUR.items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=type(default), default=default, dest=name)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a fake Gemini generateContent endpoint.")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    add_behaviour_arguments(parser)
+    args = parser.parse_args()
+
+    behaviour = {name: getattr(args, name) for name in DEFAULT_BEHAVIOUR}
+    server = MockGeminiServer(("127.0.0.1", args.port), behaviour)
+    print(f"🧪 Mock Gemini listening on {server.base_url} (set GEMINI_BASE_URL to use it)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -1,34 +1,88 @@
-# pipeline_main.py (UPDATED for two score files)
+# pipeline_main.py (UPDATED for two score files, DAG scheduling)
 import subprocess
 import time
 import os
 import sys
+import argparse
+import importlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import instrumentation
+import stage_cache
 
 # --- Configuration (UPDATE THIS BASE PATH) ---
-PROJECT_ROOT = r'C:\StockModelPipeline' 
+PROJECT_ROOT = r'C:\StockModelPipeline'
 os.chdir(PROJECT_ROOT)
 
-# --- List of scripts to run sequentially ---
-SCRIPTS = [
-    "initial_data_processor.py",
-    "bulk_downloader.py",
-    "quantitative_extraction.py",
-    "quality_mngmnt.py",    # <--- NEW MANAGEMENT SCORE SCRIPT
-    "transcriptions.py",    # <--- NEW GROWTH SCORE SCRIPT
-    "final_database_update.py",
+# Maximum number of stage processes allowed to run at the same time
+MAX_PARALLEL_STAGES = 3
+
+# --- Stage graph: each stage declares the files it reads and writes ---
+# A stage depends on every stage that produces one of its inputs; inputs that no
+# stage produces (e.g. query-results.csv) must already exist on disk. "optional_inputs"
+# are read when present and may be missing (e.g. on the first run).
+# Stage outputs are cached under a hash of the inputs, code (script + imported project modules) and stage config
+# unless "cache" is False (stages whose effect lives outside the project folder). Stages that also depend on
+# the calendar list it under "volatile" (see stage_cache.VOLATILE_COMPONENTS).
+STAGES = [
+    {
+        "name": "initial_data_processor",
+        "script": "initial_data_processor.py",
+        "inputs": ["query-results.csv"],
+        "outputs": ["Initial_Processed_Data.csv"],
+        "volatile": ["date"],    # Stamps every row with today's date
+    },
+    {
+        "name": "bulk_downloader",
+        "script": "bulk_downloader.py",
+        "inputs": ["query-results.csv"],
+        "outputs": ["StocksExportsConsolidated1Nov", "download_manifest.json"],
+        "cache": False,    # Skips fresh tickers itself via its download manifest; exports age out by time
+    },
+    {
+        "name": "quantitative_extraction",
+        "script": "quantitative_extraction.py",
+        "inputs": ["StocksExportsConsolidated1Nov"],
+        # The manifest maps exports to NSE codes; the parse cache supplies the rows of unchanged exports
+        "optional_inputs": ["download_manifest.json", "extraction_cache.parquet"],
+        "outputs": ["Master_Quantitative_Data.parquet"],
+    },
+    {
+        "name": "combined_scorer",    # Management + growth scores in one Gemini request per batch
+        "script": "combined_scorer.py",
+        "inputs": ["query-results.csv"],
+        "outputs": ["query-results_scores.csv"],
+        "volatile": ["fiscal_period"],    # Scores are refreshed once per fiscal quarter (llm_cache)
+    },
+    {
+        "name": "final_database_update",
+        "script": "final_database_update.py",
+        "inputs": [
+            "Initial_Processed_Data.csv",
+            "Master_Quantitative_Data.parquet",
+            "query-results_scores.csv",
+        ],
+        "outputs": [],
+        "cache": False,    # Loads PostgreSQL; there is nothing on disk to reuse
+    },
 ]
 
+# Kept for callers that still iterate over the plain script list
+SCRIPTS = [stage["script"] for stage in STAGES]
+
 def run_script(script_name):
     """Executes a single Python script."""
     script_path = os.path.join(PROJECT_ROOT, script_name)
     print(f"\n--- Starting {script_name} ---")
-    
+
     if not os.path.exists(script_path):
         print(f"❌ Error: Script not found at {script_path}. Skipping.")
         return False
-        
+
     try:
-        subprocess.run([sys.executable, script_path], check=True, cwd=PROJECT_ROOT)
+        with instrumentation.timer("stage", key=script_name):
+            subprocess.run([sys.executable, script_path], check=True, cwd=PROJECT_ROOT)
         print(f"✅ {script_name} finished successfully.")
         return True
     except subprocess.CalledProcessError as e:
@@ -39,24 +93,255 @@ def run_script(script_name):
         print(f"🔥 Critical error running {script_name}: {e}")
         return False
 
-def main_pipeline():
+def run_cached(stage, runner, use_cache=True, forced=()):
+    """Restores the stage's outputs from the stage cache when its key matches, otherwise runs it and caches."""
+    if not use_cache or not stage.get("cache", True):
+        return runner()
+
+    key = stage_cache.compute_stage_key(stage, PROJECT_ROOT)
+    if key is None:
+        return runner()
+
+    if stage["name"] in forced:
+        print(f"🔁 {stage['name']} forced, ignoring cached outputs.")
+    elif stage_cache.restore_outputs(stage, key, PROJECT_ROOT):
+        print(f"♻️ {stage['name']} unchanged (key {key[:12]}), reused cached outputs.")
+        instrumentation.incr("stage.cache_hits", key=stage["name"])
+        return True
+
+    started = time.time()
+    success = runner()
+    if success and stage_cache.store_outputs(stage, key, PROJECT_ROOT, since=started):
+        print(f"💾 Cached outputs of {stage['name']} (key {key[:12]}).")
+    return success
+
+# --- DAG Scheduling ---
+def build_dependencies(stages):
+    """Maps each stage name to the set of stage names that produce its inputs."""
+    producers = {}
+    for stage in stages:
+        for output in stage["outputs"]:
+            if output in producers:
+                raise ValueError(f"Output '{output}' is produced by both {producers[output]} and {stage['name']}.")
+            producers[output] = stage["name"]
+
+    dependencies = {}
+    for stage in stages:
+        reads = stage["inputs"] + stage.get("optional_inputs", [])
+        dependencies[stage["name"]] = {producers[i] for i in reads if i in producers}
+
+    # Reject cycles up front so the scheduler can never deadlock
+    visiting, visited = set(), set()
+    def visit(name):
+        if name in visited:
+            return
+        if name in visiting:
+            raise ValueError(f"Stage graph contains a cycle through '{name}'.")
+        visiting.add(name)
+        for dep in dependencies[name]:
+            visit(dep)
+        visiting.discard(name)
+        visited.add(name)
+    for name in dependencies:
+        visit(name)
+
+    return dependencies
+
+def missing_inputs(stage):
+    """Returns the inputs of a stage that do not exist on disk yet."""
+    return [i for i in stage["inputs"] if not os.path.exists(os.path.join(PROJECT_ROOT, i))]
+
+def critical_path(dependencies, timings):
+    """Walks back from the last finishing stage along the dependency that finished last."""
+    if not timings:
+        return [], 0.0
+
+    path = []
+    current = max(timings, key=lambda name: timings[name]["end"])
+    while current is not None:
+        path.append(current)
+        finished_deps = [d for d in dependencies[current] if d in timings]
+        current = max(finished_deps, key=lambda d: timings[d]["end"]) if finished_deps else None
+    path.reverse()
+
+    duration = timings[path[-1]]["end"] - timings[path[0]]["start"]
+    return path, duration
+
+def run_dag(stages, max_workers=MAX_PARALLEL_STAGES, use_cache=True, forced=()):
+    """Runs stages as soon as their dependencies finish; independent branches run concurrently."""
+    dependencies = build_dependencies(stages)
+    by_name = {stage["name"]: stage for stage in stages}
+    pending = [stage["name"] for stage in stages]
+    completed, failed = set(), set()
+    timings = {}
+    lock = threading.Lock()
+
+    def timed_run(name):
+        start = time.perf_counter()
+        stage = by_name[name]
+        success = run_cached(stage, lambda: run_script(stage["script"]), use_cache, forced)
+        with lock:
+            timings[name] = {"start": start, "end": time.perf_counter()}
+        return success
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        running = {}
+        while pending or running:
+            if not failed:
+                for name in list(pending):
+                    if not dependencies[name] <= completed:
+                        continue
+                    absent = missing_inputs(by_name[name])
+                    if absent:
+                        print(f"🛑 {name} cannot start, missing inputs: {absent}")
+                        failed.add(name)
+                        pending.remove(name)
+                        continue
+                    pending.remove(name)
+                    running[executor.submit(timed_run, name)] = name
+
+            if not running:
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                if future.result():
+                    completed.add(name)
+                else:
+                    failed.add(name)
+
+    skipped = [name for name in pending if name not in failed]
+    return completed, failed, skipped, timings, dependencies
+
+# --- In-Process Runner ---
+def topological_order(stages, dependencies):
+    """Orders stages so every stage comes after the stages it depends on (declaration order otherwise)."""
+    ordered, placed = [], set()
+    remaining = [stage["name"] for stage in stages]
+    while remaining:
+        for name in remaining:
+            if dependencies[name] <= placed:
+                ordered.append(name)
+                placed.add(name)
+                remaining.remove(name)
+                break
+    return ordered
+
+def run_in_process(stages, checkpoint=True, use_cache=True, forced=()):
+    """Runs every stage's `run_stage(frames, checkpoint)` in this interpreter, handing DataFrames along in memory."""
+    import pandas as pd
+
+    dependencies = build_dependencies(stages)
+    by_name = {stage["name"]: stage for stage in stages}
+    completed, failed = set(), set()
+    timings = {}
+
+    # Artifact name -> DataFrame; stages fall back to disk for anything not in here
+    frames = {'query-results.csv': pd.read_csv(os.path.join(PROJECT_ROOT, 'query-results.csv'))}
+
+    order = topological_order(stages, dependencies)
+    for name in order:
+        module_name = os.path.splitext(by_name[name]["script"])[0]
+        print(f"\n--- Starting {name} (in-process) ---")
+        start = time.perf_counter()
+
+        def runner():
+            try:
+                module = importlib.import_module(module_name)
+                frames.update(module.run_stage(frames, checkpoint=checkpoint))
+                print(f"✅ {name} finished successfully.")
+                return True
+            except Exception as e:
+                print(f"🛑 {name} FAILED. Pipeline stopped.")
+                print(f"Error details: {e}")
+                return False
+
+        # Without checkpoints stages skip writing their outputs, so the files on disk are leftovers
+        # of an earlier run: neither restoring nor storing them would be correct
+        if run_cached(by_name[name], runner, use_cache and checkpoint, forced):
+            completed.add(name)
+        else:
+            failed.add(name)
+            instrumentation.incr("stage.errors", key=name)
+        timings[name] = {"start": start, "end": time.perf_counter()}
+        instrumentation.observe("stage", timings[name]["end"] - start, key=name)
+        instrumentation.flush(name)
+        if failed:
+            break
+
+    skipped = [name for name in order if name not in completed and name not in failed]
+    return completed, failed, skipped, timings, dependencies
+
+def report_timings(timings, dependencies):
+    if not timings:
+        return [], 0.0
+
+    pipeline_start = min(t["start"] for t in timings.values())
+    print("\n--- Stage Timings ---")
+    for name, t in sorted(timings.items(), key=lambda item: item[1]["start"]):
+        print(f"  {name:<25} start +{t['start'] - pipeline_start:8.1f}s  took {t['end'] - t['start']:8.1f}s")
+
+    path, duration = critical_path(dependencies, timings)
+    serial_total = sum(t["end"] - t["start"] for t in timings.values())
+    print(f"⏱️ Critical path: {' → '.join(path)} ({duration:.1f}s)")
+    print(f"⏱️ Sum of stage times: {serial_total:.1f}s")
+    return path, duration
+
+def main_pipeline(in_process=False, checkpoint=True, use_cache=True, forced=()):
     print("#######################################################")
     print("🚀 Starting Stock Model Automation Pipeline")
     print("#######################################################")
-    
+
     if not os.path.exists(os.path.join(PROJECT_ROOT, 'query-results.csv')):
          print("🛑 CRITICAL: Initial data file 'query-results.csv' not found.")
          return
 
-    for script in SCRIPTS:
-        success = run_script(script)
-        if not success:
-            break
-        time.sleep(5) 
-    
+    # Stage processes inherit the metrics folder and write their own fragments into it
+    instrumentation.reset_run()
+    os.environ['MARKETLENS_METRICS_DIR'] = instrumentation.METRICS_DIRECTORY
+
+    if in_process:
+        completed, failed, skipped, timings, dependencies = run_in_process(
+            STAGES, checkpoint=checkpoint, use_cache=use_cache, forced=forced)
+    else:
+        completed, failed, skipped, timings, dependencies = run_dag(STAGES, use_cache=use_cache, forced=forced)
+    path, duration = report_timings(timings, dependencies)
+
+    instrumentation.flush("pipeline_main")
+    pipeline_start = min((t["start"] for t in timings.values()), default=0.0)
+    instrumentation.write_run_manifest({
+        "mode": "in-process" if in_process else "dag",
+        "completed": sorted(completed),
+        "failed": sorted(failed),
+        "not_started": skipped,
+        "stages": {
+            name: {"start_offset_seconds": round(t["start"] - pipeline_start, 3),
+                   "wall_seconds": round(t["end"] - t["start"], 3)}
+            for name, t in timings.items()
+        },
+        "critical_path": path,
+        "critical_path_seconds": round(duration, 3),
+    })
+
+    if failed:
+        print(f"\n🛑 Pipeline stopped. Failed stages: {sorted(failed)}. Not started: {skipped}")
+        return
+
     print("\n\n#######################################################")
     print("🎉 PIPELINE RUN COMPLETE. Check PostgreSQL for 'final_score' table.")
     print("#######################################################")
 
 if __name__ == "__main__":
-    main_pipeline()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Run the stock model pipeline.")
+    parser.add_argument("--in-process", action="store_true",
+                        help="Run all stages in this interpreter and pass DataFrames in memory.")
+    parser.add_argument("--no-checkpoints", action="store_true",
+                        help="In-process mode only: skip writing intermediate files that are not required.")
+    parser.add_argument("--force", action="append", default=[], metavar="STAGE",
+                        choices=[stage["name"] for stage in STAGES],
+                        help="Re-run STAGE even if its cached outputs are up to date (repeatable).")
+    parser.add_argument("--no-cache", action="store_true", help="Run every stage and ignore the stage cache.")
+    args = parser.parse_args()
+    main_pipeline(in_process=args.in_process, checkpoint=not args.no_checkpoints,
+                  use_cache=not args.no_cache, forced=set(args.force))
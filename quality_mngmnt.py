@@ -1,19 +1,10 @@
 import pandas as pd
-import time
-import os
 import re
-import random
-from google import genai 
-from google.genai.errors import APIError 
 
-# ==============================
-# 🔑 ENTER YOUR GEMINI API KEY HERE
-# ==============================
-API_KEY = "API KEY"  # <-- Ensure valid
-
-# API details
-MODEL = "gemini-2.5-flash"
-MAX_OUTPUT_TOKENS = 256
+import checkpoint_journal
+import instrumentation
+import llm_cache
+import scoring_engine
 
 # ==============================
 # 📘 FILE PATHS
@@ -21,23 +12,21 @@ MAX_OUTPUT_TOKENS = 256
 INPUT_FILE = r"C:\StockModelPipeline\query-results.csv"
 OUTPUT_FILE = r"C:\StockModelPipeline\query-results_mngmnt.csv"
 FAILED_FILE = r"C:\StockModelPipeline\query-results_failed.csv"
-
-# Initialize Gemini client
-try:
-    client = genai.Client(api_key=API_KEY)
-    print("✨ Gemini Client Initialized.")
-except Exception as e:
-    print(f"❌ Error initializing Gemini Client: {e}. Check installation/key.")
-    client = None
+JOURNAL_FILE = r"C:\StockModelPipeline\query-results_mngmnt.journal.jsonl"  # resume log of an unfinished run
 
 # ==============================
-# 🔍 Function to call Gemini API
+# 🔍 Prompt & answer parsing
 # ==============================
-def get_management_quality_score(company_name: str):
-    if client is None:
-        return None
-
-    prompt = (
+# Used when this score is requested together with others (see combined_scorer.py)
+CRITERIA = (
+    "Management Quality Score out of 10 for the quality of management, using publicly available financial data, "
+    "management commentary, governance practices, and performance indicators. Evaluate based on capital allocation, "
+    "corporate governance, return consistency, debt management, promoter integrity, and strategic execution "
+    "(10 = exceptional, 1 = very poor), with one decimal place."
+)
+
+def build_prompt(company_name: str):
+    return (
         f"Analyze the quality of management for the Indian listed company {company_name} "
         "(listed on the NSE, India) using publicly available financial data, management commentary, "
         "governance practices, and performance indicators. Evaluate based on capital allocation, "
@@ -47,101 +36,106 @@ def get_management_quality_score(company_name: str):
         "with one decimal place, e.g., 7.5. Do not include any text, explanations, or symbols."
     )
 
-    for attempt in range(3):
-        try:
-            response = client.models.generate_content(
-                model=MODEL,
-                contents=prompt,
-                config=dict(
-                    temperature=0.0,
-                    max_output_tokens=MAX_OUTPUT_TOKENS,
-                    thinking_config=dict(thinking_budget=0, include_thoughts=False),
-                ),
-            )
-
-            text_content = response.text
-            if not text_content:
-                print(f"❌ EMPTY response for {company_name}")
-                time.sleep(10 + random.uniform(0, 5))
-                continue
-
-            match = re.search(r"(\d+(\.\d+)?)", text_content.strip())
-            if match:
-                score = float(match.group(1))
-                if 1 <= score <= 10:
-                    return score
-
-            print(f"⚠️ Invalid score for {company_name}: {text_content}")
-            return None
-
-        except APIError as e:
-            print(f"❌ API Error ({attempt+1}/3) for {company_name}: {e}")
-            time.sleep(15 + random.uniform(0, 5))
-        except Exception as e:
-            print(f"❌ General Error ({attempt+1}/3) for {company_name}: {e}")
-            time.sleep(10 + random.uniform(0, 5))
-
+def parse_score(text_content: str):
+    """Returns the score in 1–10, or None if the answer holds no valid score."""
+    match = re.search(r"(\d+(\.\d+)?)", text_content.strip())
+    if match:
+        score = float(match.group(1))
+        if 1 <= score <= 10:
+            return score
     return None
 
+MANAGEMENT_SCORE = scoring_engine.register_score(
+    "management", "Management Score", CRITERIA, 1, 10, build_prompt, parse_score
+)
+
+def score_companies(companies, on_result=None, batch=True, use_cache=True):
+    """Scores (NSE code, name) pairs through scoring_engine, BATCH_SIZE per request; returns {code: score}."""
+    scores = scoring_engine.run_scoring(
+        scoring_engine.get_client(), companies, [MANAGEMENT_SCORE],
+        on_result=(lambda code, s: on_result(code, s["management"])) if on_result else None,
+        batch_size=scoring_engine.BATCH_SIZE if batch else 1, use_cache=use_cache,
+    )
+    return {code: s["management"] for code, s in scores.items()}
+
+def get_management_quality_score(company_name: str):
+    if scoring_engine.get_client() is None:
+        return None
+    return score_companies([(company_name, company_name)], batch=False)[company_name]
+
 # ==============================
 # 📊 MAIN EXECUTION (Resume Mode)
 # ==============================
-def main():
-    if client is None:
+def main(df=None):
+    """Scores every unprocessed company and returns all scores (previous runs included)."""
+    if scoring_engine.get_client() is None:
         print("\n🚫 Cannot run main() due to client initialization failure.")
-        return
+        return None
 
-    df = pd.read_csv(INPUT_FILE)
+    df = pd.read_csv(INPUT_FILE) if df is None else df.copy()
     if "Name" not in df.columns:
         raise ValueError("❌ CSV must have a 'Name' column.")
 
     df["Name"] = df["Name"].astype(str).str.strip()
     df = df[df["Name"] != ""]
 
-    # Determine which companies are already processed
-    processed_names = []
-    if os.path.exists(OUTPUT_FILE):
-        try:
-            df_done = pd.read_csv(OUTPUT_FILE)
-            processed_names = df_done["Name"].dropna().astype(str).tolist()
-            print(f"📂 Found {len(processed_names)} processed companies in {OUTPUT_FILE}.")
-        except Exception as e:
-            print(f"⚠️ Error reading output file: {e}. Proceeding fresh.")
+    # Determine which companies are already processed (earlier runs' OUTPUT_FILE seeds the journal)
+    columns = ["Name", "Management Score"]
+    journal = checkpoint_journal.CheckpointJournal(JOURNAL_FILE, required=["Management Score"], seed_csv=OUTPUT_FILE)
 
     # Filter only unprocessed companies (last ~250)
-    df_remaining = df[~df["Name"].isin(processed_names)].reset_index(drop=True)
+    df_remaining = df[[name not in journal for name in df["Name"]]].reset_index(drop=True)
     print(f"➡️ {len(df_remaining)} companies remaining to process.")
 
     if df_remaining.empty:
         print("✅ All companies already processed!")
-        return
+        return journal.compact(OUTPUT_FILE, columns)
 
     failed = []
-    for idx, name in enumerate(df_remaining["Name"], start=1):
-        total_remaining = len(df_remaining) - idx + 1
-        print(f"\n({idx}/{len(df_remaining)}, {total_remaining} left) → Getting score for: {name}")
-
-        score = get_management_quality_score(name)
-
-        pd.DataFrame([{"Name": name, "Management Score": score}]).to_csv(
-            OUTPUT_FILE, mode="a", header=not os.path.exists(OUTPUT_FILE), index=False
-        )
-
+    completed = 0
+    # Batch answers are keyed by NSE code; companies without one fall back to their name
+    codes = df_remaining["NSE Code"] if "NSE Code" in df_remaining.columns else df_remaining["Name"]
+    codes = codes.where(codes.notna(), df_remaining["Name"]).astype(str).str.strip()
+    names_by_code = dict(zip(codes, df_remaining["Name"]))
+
+    def on_result(code, score):
+        # Runs on the event loop thread as each company finishes, so appends never interleave
+        nonlocal completed
+        completed += 1
+        name = names_by_code[code]
+        print(f"({completed}/{len(df_remaining)}) → {name}: {score}")
+        journal.append({"Name": name, "Management Score": score})
+        instrumentation.incr("companies_scored")
         if score is None:
             failed.append(name)
 
-        # Delay for free-tier safety
-        time.sleep(8 + random.uniform(0, 4))
+    try:
+        score_companies(list(names_by_code.items()), on_result=on_result)
+    finally:
+        journal.flush()
+    llm_cache.get_cache().report()
+    df_scores = journal.compact(OUTPUT_FILE, columns)
 
     if failed:
         pd.DataFrame({"Failed_Companies": failed}).to_csv(FAILED_FILE, index=False)
         print(f"\n⚠️ Failed companies saved to {FAILED_FILE}")
 
     print(f"\n✅ Completed! Remaining results saved to: {OUTPUT_FILE}")
+    return df_scores
+
+def run_stage(frames, checkpoint=True):
+    """In-process entry point. OUTPUT_FILE is always written because it seeds the next run's resume."""
+    df_scores = main(frames.get('query-results.csv'))
+    if df_scores is None:
+        raise RuntimeError("Gemini client is not initialized.")
+    return {'query-results_mngmnt.csv': df_scores}
 
 # ==============================
 # 🚀 RUN
 # ==============================
 if __name__ == "__main__":
-    main()
+    try:
+        main()
+    finally:
+        instrumentation.flush("quality_mngmnt")
 
@@ -1,173 +1,462 @@
 # quantitative_extraction.py (FINAL CORRECTED - Simplified Growth)
+import hashlib
+import importlib.util
+import json
 import os
-import xlwings as xw
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+import openpyxl
+from openpyxl.utils.cell import get_column_letter, range_boundaries
 import pandas as pd
 import numpy as np
 
+import instrumentation
+import metric_engine
+import security_master
+import stage_cache
+
 # --- Configuration ---
 # NOTE: Directory name uses 31Oct to match previous successful run path
 DOWNLOAD_DIRECTORY = 'StocksExportsConsolidated1Nov' 
-OUTPUT_FILENAME = "Master_Quantitative_Data.xlsx"
+# Directory of Parquet part files, one per flushed batch; read back as a single table
+OUTPUT_FILENAME = "Master_Quantitative_Data.parquet"
+EXTRACTION_BATCH_SIZE = 250
+# Written by bulk_downloader; maps every export file to the NSE code it was downloaded for
+DOWNLOAD_MANIFEST_PATH = 'download_manifest.json'
+
+# "openpyxl": pure-Python read-only reader, workbooks spread over a process pool (any OS).
+# "xlwings": drives a desktop Excel through COM, one workbook at a time (Windows + Excel only).
+EXTRACTION_BACKEND = "openpyxl"
+EXTRACTION_WORKERS = os.cpu_count() or 1
+
+# Raw fields of every export already parsed, keyed by the export's sha256 (needs pyarrow)
+EXTRACTION_CACHE_PATH = "extraction_cache.parquet"
+# Bump whenever a reader returns different values for the same file (e.g. 2: uncached formulas are
+# detected), so rows cached by the previous readers are parsed again
+READER_VERSION = 2
+
+# --- Extraction Spec ---
+# Field -> (sheet, cell or range). When Screener moves a row, change it here.
+# Ranges come back as a flat list, single cells as a scalar.
+EXTRACTION_SPEC = {
+    "Name":          ('Quarters', 'A1'),
+    "sales_q":       ('Quarters', 'D4:K4'),
+    "op_q":          ('Quarters', 'D6:K6'),
+    "opm_q":         ('Quarters', 'D14:K14'),
+    "net_profit_q":  ('Data Sheet', 'D49:K49'),
+    "equity_shares": ('Data Sheet', 'K70'),
+    "sales_annual":  ('Profit & Loss', 'H4:K4'),
+    "best p/e":      ('Profit & Loss', 'M25'),
+    "cfo_annual":    ('Cash Flow', 'H4:K4'),
+}
 
 # --- Helper Functions ---
+# Single-stock views of metric_engine, which computes the same figures for the whole universe at once.
 def calculate_ttm_metrics(quarterly_values):
     """Calculates TTM1, TTM2, and Growth percentage (TTM/Prev TTM - 1) using simple math."""
-    numeric_values = [pd.to_numeric(q, errors='coerce') for q in quarterly_values]
-    ttm_2 = np.nansum(numeric_values[0:4]) # Previous TTM Sum
-    ttm_1 = np.nansum(numeric_values[4:8]) # Latest TTM Sum
-    growth = np.nan 
-    
-    # Simple, direct application of the formula using np.divide for safety
-    if ttm_2 != 0: 
-        growth = ((ttm_1 / ttm_2) - 1) * 100
-    # If ttm_2 is 0, growth remains np.nan (initialized) or becomes inf/NaN if TTM1 != 0
-
-    return ttm_1, ttm_2, growth
+    ttm_1, ttm_2, growth = metric_engine.ttm_growth(metric_engine.to_numeric_matrix([quarterly_values]))
+    return ttm_1[0], ttm_2[0], growth[0]
 
 def calculate_eps_metrics(net_profits, equity_shares):
     """Calculates EPS values and growth using simple math."""
-    equity_shares = pd.to_numeric(equity_shares, errors='coerce') if equity_shares else 0.0
-    conversion_factor = 10_000_000 
-    eps_values = []
-    for np_value in net_profits:
-        np_value = pd.to_numeric(np_value, errors='coerce')
-        if not pd.isna(np_value) and equity_shares > 0:
-            eps_values.append((np_value * conversion_factor) / equity_shares)
-        else: eps_values.append(np.nan)
-    numeric_eps = [pd.to_numeric(e, errors='coerce') for e in eps_values]
-    eps_2_ttm = np.nansum(numeric_eps[0:4])
-    eps_1_ttm = np.nansum(numeric_eps[4:8])
-    eps_growth = np.nan
-    
-    if eps_2_ttm != 0: 
-        eps_growth = ((eps_1_ttm / eps_2_ttm) - 1) * 100
-        
-    return eps_values, eps_1_ttm, eps_2_ttm, eps_growth
+    eps = metric_engine.eps_matrix(metric_engine.to_numeric_matrix([net_profits]),
+                                   metric_engine.to_numeric_matrix([equity_shares]))
+    eps_1_ttm, eps_2_ttm, eps_growth = metric_engine.ttm_growth(eps)
+    return list(eps[0]), eps_1_ttm[0], eps_2_ttm[0], eps_growth[0]
 
 def calculate_opm_metrics(opm_values):
     """Calculates OPM Growth percentage (TTM Sum/Prev TTM Sum - 1) and OPM_4Q Sum using simple math."""
-    numeric_opm = [pd.to_numeric(q, errors='coerce') for q in opm_values]
-    opm_2_sum = np.nansum(numeric_opm[0:4]) 
-    opm_1_sum = np.nansum(numeric_opm[4:8]) 
-    opm_4q_sum = opm_1_sum 
-    opm_growth = np.nan 
-    
-    if opm_2_sum != 0: 
-        opm_growth = ((opm_1_sum / opm_2_sum) - 1) * 100
-        
-    return opm_values, opm_4q_sum, opm_growth
+    opm_4q_sum, _, opm_growth = metric_engine.ttm_growth(metric_engine.to_numeric_matrix([opm_values]))
+    return opm_values, opm_4q_sum[0], opm_growth[0]
 
 def calculate_annual_growth(annual_values):
     """Calculates YoY growth factor (Curr / Prev * 100) for 3 years, using simple math."""
-    numeric_values = [pd.to_numeric(v, errors='coerce') for v in annual_values]
-    growth_rates = []
-    for i in range(len(numeric_values) - 1):
-        prev = numeric_values[i]; curr = numeric_values[i+1]
-        growth = np.nan
-        if prev != 0: 
-            growth = (curr / prev) * 100 
-        growth_rates.append(growth)
-    return growth_rates 
+    return list(metric_engine.annual_growth(metric_engine.to_numeric_matrix([annual_values]))[0])
 
 def calculate_coa_net_indicator(cfo_growth, sales_growth):
     """COA-Net Indicator: Sum of (1) if CFO Growth Factor >= 70% * Sales Growth Factor."""
-    coa_net_indicator = 0
-    for cfo_g, sales_g in zip(cfo_growth, sales_growth):
-        cfo_g = pd.to_numeric(cfo_g, errors='coerce')
-        sales_g = pd.to_numeric(sales_g, errors='coerce')
-        
-        # We must explicitly convert any inf (from division by zero) to NaN to ensure the comparison works
-        if np.isinf(cfo_g): cfo_g = np.nan
-        if np.isinf(sales_g): sales_g = np.nan
-
-        if not pd.isna(cfo_g) and not pd.isna(sales_g):
-            if cfo_g >= (0.70 * sales_g):
-                 coa_net_indicator += 1
-    return coa_net_indicator
+    return int(metric_engine.coa_net(metric_engine.to_numeric_matrix([cfo_growth]),
+                                     metric_engine.to_numeric_matrix([sales_growth]))[0])
 
-# --- Main Extraction Logic ---
-def main():
-    if not os.path.isdir(DOWNLOAD_DIRECTORY):
-        print(f"❌ Error: Folder '{DOWNLOAD_DIRECTORY}' not found. Did bulk_downloader run?")
-        return
-    
-    output_data = []
-    app = None
-    
-    for filename in os.listdir(DOWNLOAD_DIRECTORY):
-        if filename.endswith('.xlsx'):
-            file_path = os.path.join(DOWNLOAD_DIRECTORY, filename)
-            
-            try:
-                if app is None:
-                    app = xw.App(visible=False, add_book=False)
-                    
-                wb = app.books.open(file_path)
-                stock_data = {"File Name": filename}
-                
-                # A. Data Extraction (Quarterly)
-                sheet_q = wb.sheets['Quarters']
-                stock_data["Name"] = sheet_q.range('A1').value
-                sales_q_raw = sheet_q.range('D4:K4').options(ndim=1).value
-                op_q_raw = sheet_q.range('D6:K6').options(ndim=1).value
-                opm_q_raw, opm_4q_sum, opm_growth = calculate_opm_metrics(sheet_q.range('D14:K14').options(ndim=1).value)
-                
-                sheet_data = wb.sheets['Data Sheet']
-                eps_q_values, _, _, eps_growth = calculate_eps_metrics(
-                    sheet_data.range('D49:K49').options(ndim=1).value, sheet_data.range('K70').value
+def compile_spec(spec):
+    """Groups the spec by sheet: one bounding box per sheet plus each field's offsets inside that box."""
+    compiled = {}
+    for field, (sheet, address) in spec.items():
+        min_col, min_row, max_col, max_row = range_boundaries(address)
+        compiled.setdefault(sheet, []).append((field, min_row, min_col, max_row, max_col, ':' not in address))
+
+    plan = {}
+    for sheet, fields in compiled.items():
+        box = (min(f[1] for f in fields), min(f[2] for f in fields), max(f[3] for f in fields), max(f[4] for f in fields))
+        slices = [
+            (field, min_row - box[0], min_col - box[1], max_row - box[0] + 1, max_col - box[1] + 1, scalar)
+            for field, min_row, min_col, max_row, max_col, scalar in fields
+        ]
+        plan[sheet] = (box, slices)
+    return plan
+
+EXTRACTION_PLAN = compile_spec(EXTRACTION_SPEC)
+# Cached rows extracted with a different spec or reader version are ignored
+SPEC_HASH = hashlib.sha256(
+    json.dumps({"spec": EXTRACTION_SPEC, "reader_version": READER_VERSION}, sort_keys=True).encode()
+).hexdigest()[:16]
+TEXT_FIELDS = ("Name",)
+
+def normalize_raw_row(stock_data):
+    """Coerces every numeric spec field to float (NaN for blanks/text) so fresh and cached rows are identical."""
+    row = {"File Name": stock_data["File Name"]}
+    for field, value in stock_data.items():
+        if field == "File Name":
+            continue
+        if field in TEXT_FIELDS:
+            row[field] = None if value is None else str(value)
+        elif isinstance(value, list):
+            row[field] = metric_engine.to_numeric_matrix(value).tolist()
+        else:
+            row[field] = float(metric_engine.to_numeric_matrix([value])[0])
+    return row
+
+# --- Workbook Readers ---
+# Both readers return a rectangular block (list of rows) of cell values the way xlwings does:
+# numbers as float, empty cells as None.
+def _as_xlwings_value(value):
+    if isinstance(value, int) and not isinstance(value, bool):
+        return float(value)
+    return value
+
+class UncachedFormulaError(Exception):
+    """A required cell holds a formula without a value cached by Excel; openpyxl cannot calculate it."""
+
+class OpenpyxlWorkbook:
+    """Read-only reader. Formula cells yield the values Excel cached when the export was saved."""
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.book = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+        self._formula_book = None
+
+    def block(self, sheet, min_row, min_col, max_row, max_col):
+        width, height = max_col - min_col + 1, max_row - min_row + 1
+        rows = self.book[sheet].iter_rows(min_row=min_row, max_row=max_row, min_col=min_col, max_col=max_col,
+                                          values_only=True)
+        # Read-only sheets stop at the last stored row/column; pad like Excel's empty cells
+        block = [[_as_xlwings_value(v) for v in r] + [None] * (width - len(r)) for r in rows]
+        return block + [[None] * width for _ in range(height - len(block))]
+
+    def uncached_formulas(self, sheet, box, cells):
+        """Addresses among `cells` ((row, col) inside `box`, all read as None) that are formulas without a cached value."""
+        if self._formula_book is None:
+            self._formula_book = openpyxl.load_workbook(self.file_path, read_only=True, data_only=False)
+        min_row, min_col, max_row, max_col = box
+        rows = list(self._formula_book[sheet].iter_rows(min_row=min_row, max_row=max_row, min_col=min_col,
+                                                        max_col=max_col, values_only=True))
+        formulas = []
+        for row, col in cells:
+            r, c = row - min_row, col - min_col
+            value = rows[r][c] if r < len(rows) and c < len(rows[r]) else None
+            if isinstance(value, str) and value.startswith('='):
+                formulas.append(f"{sheet}!{get_column_letter(col)}{row}")
+        return formulas
+
+    def close(self):
+        self.book.close()
+        if self._formula_book is not None:
+            self._formula_book.close()
+
+class XlwingsWorkbook:
+    """Excel-backed reader (needs a desktop Excel installation)."""
+
+    def __init__(self, app, file_path):
+        self.book = app.books.open(file_path)
+
+    def block(self, sheet, min_row, min_col, max_row, max_col):
+        return self.book.sheets[sheet].range((min_row, min_col), (max_row, max_col)).options(ndim=2).value
+
+    def close(self):
+        self.book.close()
+
+# --- Per-Workbook Extraction ---
+def extract_workbook(wb, filename, plan=EXTRACTION_PLAN):
+    """Reads each sheet of one export in a single block and slices out the raw spec fields; metrics are computed in bulk later."""
+    stock_data = {"File Name": filename}
+    for sheet, (box, slices) in plan.items():
+        block = wb.block(sheet, *box)
+        empty_cells = []
+        for field, top, left, bottom, right, scalar in slices:
+            values = [v for r in block[top:bottom] for v in r[left:right]]
+            stock_data[field] = values[0] if scalar else values
+            empty_cells += [(box[0] + r, box[1] + c) for r in range(top, bottom) for c in range(left, right)
+                            if block[r][c] is None]
+
+        # An empty required cell is fine unless it is a formula Excel never calculated (it would become NaN silently)
+        if empty_cells and hasattr(wb, "uncached_formulas"):
+            formulas = wb.uncached_formulas(sheet, box, empty_cells)
+            if formulas:
+                raise UncachedFormulaError(
+                    f"{', '.join(formulas[:5])} {'is a formula' if len(formulas) == 1 else 'are formulas'} "
+                    f"without a cached value (open and save the file in Excel, or use the xlwings backend)."
                 )
-                
-                # B. Calculations (Growth & Indicators)
-                _, _, sales_growth = calculate_ttm_metrics(sales_q_raw)
-                _, _, op_growth = calculate_ttm_metrics(op_q_raw) 
-                
-                sheet_pnl = wb.sheets['Profit & Loss']
-                sales_yoy_growth_rates = calculate_annual_growth(sheet_pnl.range('H4:K4').options(ndim=1).value)
-                
-                sheet_cf = wb.sheets['Cash Flow']
-                cfo_yoy_growth_rates = calculate_annual_growth(sheet_cf.range('H4:K4').options(ndim=1).value)
-                
-                coa_net_indicator = calculate_coa_net_indicator(cfo_yoy_growth_rates, sales_yoy_growth_rates)
-
-                # C. Storage
-                stock_data.update({f"SalesQ{i+1}": v for i, v in enumerate(sales_q_raw)})
-                stock_data["Sales growth"] = sales_growth
-                
-                stock_data.update({f"OPMQ{i+1}": v for i, v in enumerate(opm_q_raw)}) 
-                stock_data["op_avg"] = op_growth
-                stock_data["OPM_growth"] = opm_growth
-                stock_data["OPM_4Q"] = opm_4q_sum
-                
-                stock_data.update({f"EPS_Q{i+1}": v for i, v in enumerate(eps_q_values)})
-                stock_data["EPSgrowth"] = eps_growth
-                
-                stock_data["COA-Net"] = coa_net_indicator
-                stock_data["best p/e"] = sheet_pnl.range('M25').value
-
-                output_data.append(stock_data)
-            
+    return stock_data
+
+def assemble_quantitative_rows(raw_rows):
+    """Runs metric_engine over all raw rows at once and lays the result out as one stock_data row each."""
+    if not raw_rows:
+        return pd.DataFrame()
+
+    def matrix(field):
+        return np.array([row[field] for row in raw_rows], dtype=object)
+
+    metrics = metric_engine.compute_metrics(
+        matrix("sales_q"), matrix("op_q"), matrix("opm_q"), matrix("net_profit_q"),
+        matrix("equity_shares"), matrix("sales_annual"), matrix("cfo_annual"),
+    )
+
+    df = pd.DataFrame({
+        "File Name": [row["File Name"] for row in raw_rows],
+        "Name": [row["Name"] for row in raw_rows],
+    })
+    # Quarterly sales and OPM are reported as extracted (already float after normalize_raw_row)
+    sales_q = metric_engine.to_numeric_matrix(matrix("sales_q"))
+    opm_q = metric_engine.to_numeric_matrix(matrix("opm_q"))
+    for i in range(8):
+        df[f"SalesQ{i+1}"] = sales_q[:, i]
+    df["Sales growth"] = metrics["Sales growth"]
+    for i in range(8):
+        df[f"OPMQ{i+1}"] = opm_q[:, i]
+    df["op_avg"] = metrics["op_avg"]
+    df["OPM_growth"] = metrics["OPM_growth"]
+    df["OPM_4Q"] = metrics["OPM_4Q"]
+    for i in range(8):
+        df[f"EPS_Q{i+1}"] = metrics["EPS_Q"][:, i]
+    df["EPSgrowth"] = metrics["EPSgrowth"]
+    df["COA-Net"] = metrics["COA-Net"]
+    df["best p/e"] = [row["best p/e"] for row in raw_rows]
+    return df
+
+def extract_file(file_path):
+    """Process-pool task: returns (filename, stock_data, error message)."""
+    filename = os.path.basename(file_path)
+    wb = None
+    try:
+        wb = OpenpyxlWorkbook(file_path)
+        return filename, extract_workbook(wb, filename), None
+    except UncachedFormulaError as e:
+        return filename, None, e    # extract_files retries these with Excel when it is available
+    except Exception as e:
+        return filename, None, str(e)
+    finally:
+        if wb: wb.close()
+
+def extract_files_xlwings(file_paths):
+    """Sequential Excel/COM extraction, yielding the same tuples as extract_file."""
+    import xlwings as xw
+
+    app = xw.App(visible=False, add_book=False)
+    try:
+        for file_path in file_paths:
+            filename = os.path.basename(file_path)
+            wb = None
+            try:
+                wb = XlwingsWorkbook(app, file_path)
+                yield filename, extract_workbook(wb, filename), None
             except Exception as e:
-                print(f"🔥 Critical error processing {filename}. Error: {e}")
+                yield filename, None, str(e)
             finally:
-                if 'wb' in locals() and wb: wb.close()
-                
-    if app:
-        app.quit() 
+                if wb: wb.close()
+    finally:
+        app.quit()
 
-    df = pd.DataFrame(output_data)
-    
-    # Final column filtering and renaming
-    required_cols_to_keep = [
-        "Name", "best p/e", "Sales growth", "op_avg", "OPM_growth", "OPM_4Q", "EPSgrowth", "COA-Net",
-        *[f"SalesQ{i+1}" for i in range(8)], 
-        *[f"OPMQ{i+1}" for i in range(8)], 
-        *[f"EPS_Q{i+1}" for i in range(8)],
-    ]
-    
+def extract_files_openpyxl(file_paths, workers=EXTRACTION_WORKERS):
+    if workers <= 1 or len(file_paths) <= 1:
+        yield from map(extract_file, file_paths)
+        return
+
+    chunksize = max(1, len(file_paths) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(extract_file, file_paths, chunksize=chunksize)
+
+def extract_files(file_paths, backend=EXTRACTION_BACKEND, workers=EXTRACTION_WORKERS):
+    if backend == "xlwings":
+        yield from extract_files_xlwings(file_paths)
+        return
+
+    # Workbooks with uncalculated formulas go to Excel when xlwings is installed, else they fail loudly
+    excel_available = importlib.util.find_spec("xlwings") is not None
+    paths_by_name = {os.path.basename(path): path for path in file_paths}
+    needs_excel = []
+    for filename, stock_data, error in extract_files_openpyxl(file_paths, workers):
+        if isinstance(error, UncachedFormulaError):
+            instrumentation.incr("workbooks_uncached_formulas", key=filename)
+            if excel_available:
+                needs_excel.append(paths_by_name[filename])
+                continue
+            error = str(error)
+        yield filename, stock_data, error
+
+    if needs_excel:
+        print(f"🧮 {len(needs_excel)} exports have uncalculated formulas; extracting them through Excel.")
+        yield from extract_files_xlwings(needs_excel)
+
+# --- Extraction Cache ---
+def load_extraction_cache(path=EXTRACTION_CACHE_PATH):
+    """Returns {file sha256: raw row} for rows extracted with the current spec and readers. Empty if missing or unreadable."""
+    if not os.path.exists(path):
+        return {}
+    try:
+        df_cache = pd.read_parquet(path)
+    except ImportError:
+        print("⚠️ pyarrow is not installed; extraction cache disabled, every export will be parsed.")
+        return {}
+    except Exception as e:
+        print(f"⚠️ Could not read extraction cache {path}: {e}. Re-parsing every export.")
+        return {}
+
+    df_cache = df_cache[df_cache["spec_hash"] == SPEC_HASH]
+    cache = {}
+    for record in df_cache.drop(columns="spec_hash").to_dict("records"):
+        file_hash = record.pop("file_hash")
+        cache[file_hash] = {k: (v.tolist() if isinstance(v, np.ndarray) else v) for k, v in record.items()}
+    return cache
+
+def save_extraction_cache(cache, path=EXTRACTION_CACHE_PATH):
+    """Rewrites the cache with the given entries only, so exports that disappeared are pruned."""
+    if not cache:
+        return
+    df_cache = pd.DataFrame([{"file_hash": h, "spec_hash": SPEC_HASH, **row} for h, row in cache.items()])
+    tmp_path = f"{path}.tmp"
+    try:
+        df_cache.to_parquet(tmp_path, index=False)
+    except ImportError:
+        print("⚠️ pyarrow is not installed; extraction cache not saved.")
+        return
+    os.replace(tmp_path, path)
+
+# --- Main Extraction Logic ---
+# Final column filtering and renaming; every part file gets exactly these columns and types
+required_cols_to_keep = [
+    security_master.SECURITY_ID, "Name", "best p/e", "Sales growth", "op_avg", "OPM_growth", "OPM_4Q", "EPSgrowth", "COA-Net",
+    *[f"SalesQ{i+1}" for i in range(8)], 
+    *[f"OPMQ{i+1}" for i in range(8)], 
+    *[f"EPS_Q{i+1}" for i in range(8)],
+]
+OUTPUT_DTYPES = {col: ("int64" if col == "COA-Net" else "float64") for col in required_cols_to_keep[2:]}
+OUTPUT_DTYPES[security_master.SECURITY_ID] = "string"
+OUTPUT_DTYPES["Company Name"] = "string"
+
+def finalize_batch(raw_rows):
+    """Computes metrics for one batch of raw rows and returns it in the output layout."""
+    df = assemble_quantitative_rows(raw_rows)
+    if raw_rows:
+        # Export file first (exact, via the download manifest), then the workbook's A1 name
+        df[security_master.SECURITY_ID] = security_master.get_master().resolve_frame(
+            df, "quantitative_extraction", nse=None, bse=None, name="Name", filename="File Name")
     df_final = df.reindex(columns=required_cols_to_keep)
     df_final.rename(columns={'Name': 'Company Name'}, inplace=True) 
+    return df_final.astype(OUTPUT_DTYPES)
+
+def iter_quantitative_batches(batch_size=EXTRACTION_BATCH_SIZE):
+    """Generator over finished output frames of up to `batch_size` stocks; raw rows are not kept after a batch."""
+    if not os.path.isdir(DOWNLOAD_DIRECTORY):
+        raise FileNotFoundError(f"Folder '{DOWNLOAD_DIRECTORY}' not found. Did bulk_downloader run?")
+    
+    file_paths = [os.path.join(DOWNLOAD_DIRECTORY, f) for f in os.listdir(DOWNLOAD_DIRECTORY) if f.endswith('.xlsx')]
+    batch = []
     
-    df_final.to_excel(OUTPUT_FILENAME, index=False)
+    master = security_master.get_master()
+    master.register_manifest(DOWNLOAD_MANIFEST_PATH)
+
+    # Unchanged exports come straight from the cache; only new or modified ones are parsed
+    cache = load_extraction_cache()
+    file_hashes = {path: stage_cache.hash_file(path).hexdigest() for path in file_paths}
+    kept_cache = {}
+    to_parse = []
+    try:
+        for path in file_paths:
+            cached = cache.get(file_hashes[path])
+            if cached is None:
+                to_parse.append(path)
+                continue
+            kept_cache[file_hashes[path]] = cached
+            batch.append({**cached, "File Name": os.path.basename(path)})
+            if len(batch) >= batch_size:
+                yield finalize_batch(batch)
+                batch = []
+        instrumentation.incr("workbooks_cached", len(kept_cache))
+        print(f"🗃️ {len(kept_cache)} exports unchanged (from cache), {len(to_parse)} to parse.")
+
+        for filename, stock_data, error in extract_files(to_parse):
+            if error is None:
+                stock_data = normalize_raw_row(stock_data)
+                batch.append(stock_data)
+                kept_cache[file_hashes[os.path.join(DOWNLOAD_DIRECTORY, filename)]] = stock_data
+                instrumentation.incr("workbooks_parsed")
+            else:
+                instrumentation.incr("workbooks_failed", key=filename)
+                print(f"🔥 Critical error processing {filename}. Error: {error}")
+            if len(batch) >= batch_size:
+                yield finalize_batch(batch)
+                batch = []
+
+        if batch:
+            yield finalize_batch(batch)
+    finally:
+        # Also on a crash, so the exports parsed so far are not parsed again
+        save_extraction_cache(kept_cache)
+        master.save()
+
+def write_quantitative_parquet(batches, output_path=OUTPUT_FILENAME, keep_frames=False):
+    """Streams batches into output_path as part files. Each part appears atomically, so a crash keeps finished batches."""
+    if os.path.isdir(output_path):
+        shutil.rmtree(output_path)
+    os.makedirs(output_path)
+
+    frames = []
+    part_count, row_count = 0, 0
+    for df_batch in batches:
+        part_name = f"part-{part_count:05d}.parquet"
+        part_path = os.path.join(output_path, part_name)
+        # A leading "_" keeps a temp file left by a crash out of the dataset (pyarrow skips "_" and "." names)
+        tmp_path = os.path.join(output_path, f"_{part_name}.tmp")
+        df_batch.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, part_path)
+        part_count += 1
+        row_count += len(df_batch)
+        if keep_frames:
+            frames.append(df_batch)
+
+    if part_count == 0:
+        # An empty, typed part so readers still see the schema
+        empty = finalize_batch([])
+        empty.to_parquet(os.path.join(output_path, "part-00000.parquet"), index=False)
+        frames.append(empty)
+
+    print(f"💾 {row_count} stocks written to {output_path} in {part_count} part file(s)")
+    return pd.concat(frames, ignore_index=True) if keep_frames else None
+
+def build_quantitative_frame():
+    """Extracts every export in DOWNLOAD_DIRECTORY into one in-memory frame (no files written)."""
+    batches = list(iter_quantitative_batches())
+    return pd.concat(batches, ignore_index=True) if batches else finalize_batch([])
+
+def main():
+    try:
+        with instrumentation.timer("extraction"):
+            write_quantitative_parquet(iter_quantitative_batches())
+    except FileNotFoundError as e:
+        print(f"❌ Error: {e}")
+
+def run_stage(frames, checkpoint=True):
+    """In-process entry point: returns the quantitative frame, streaming the Parquet parts only as a checkpoint."""
+    with instrumentation.timer("extraction"):
+        if checkpoint:
+            df_final = write_quantitative_parquet(iter_quantitative_batches(), keep_frames=True)
+        else:
+            df_final = build_quantitative_frame()
+
+    return {OUTPUT_FILENAME: df_final}
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    try:
+        main()
+    finally:
+        instrumentation.flush("quantitative_extraction")
\ No newline at end of file
@@ -0,0 +1,63 @@
+# rate_limiter.py (Shared token-bucket rate limiter with AIMD adaptation)
+import threading
+import time
+
+import instrumentation
+
+class ThrottledError(Exception):
+    """The site refused a request for going too fast (HTTP 429 / 503, or a throttling page in the browser)."""
+
+class AdaptiveRateLimiter:
+    """Token bucket shared by every thread that talks to one site.
+
+    The refill rate follows AIMD: each success adds `increase` requests/second (up to
+    `max_rate`), each throttle or timeout multiplies it by `decrease_factor` (down to
+    `min_rate`). The limiter therefore settles near the highest rate the site tolerates.
+    """
+
+    def __init__(self, rate, min_rate, max_rate, burst=1, increase=0.05, decrease_factor=0.5, name="rate_limiter"):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self.name = name
+        self._tokens = float(burst)
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def acquire(self):
+        """Blocks until a request may be sent; returns the seconds spent waiting."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    break
+                wait_seconds = (1 - self._tokens) / self.rate
+            time.sleep(wait_seconds)
+            waited += wait_seconds
+        if waited:
+            instrumentation.observe(f"{self.name}.wait", waited)
+        return waited
+
+    def on_success(self):
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_throttle(self):
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+            # Drop saved-up tokens so the slowdown applies to the very next request
+            self._tokens = min(self._tokens, 0.0)
+        instrumentation.incr(f"{self.name}.throttled")
+        print(f"🐢 {self.name}: slowing down to {self.rate:.2f} requests/s")
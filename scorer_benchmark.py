@@ -0,0 +1,137 @@
+# scorer_benchmark.py (Throughput benchmark of the Gemini scorers against mock_gemini_server)
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import os
+import tempfile
+import time
+
+import pandas as pd
+
+import instrumentation
+import llm_cache
+import mock_gemini_server
+import scoring_engine
+import security_master
+
+# --- Configuration ---
+DEFAULT_SCORERS = ["quality_mngmnt", "transcriptions"]
+SCORER_CHOICES = ["quality_mngmnt", "transcriptions", "combined_scorer"]
+
+def synthetic_companies(count):
+    return pd.DataFrame({
+        "Name": [f"Benchmark Company {i:04d}" for i in range(count)],
+        "NSE Code": [f"BENCH{i:04d}" for i in range(count)],
+    })
+
+def _total(by_metric, predicate):
+    return sum(sum(by_key.values()) for metric, by_key in by_metric.items() if predicate(metric))
+
+def summarize_run(scorer, df_scores, elapsed, raw, company_count):
+    """Companies per minute, retry overhead and parse-failure rate from one run's instrumentation."""
+    timings, counters = raw["timings"], raw["counters"]
+    requests = sum(
+        len(samples) for metric, by_key in timings.items()
+        if metric.startswith("gemini.") and metric != "gemini.quota_wait" for samples in by_key.values()
+    )
+    retries = _total(counters, lambda m: m.endswith(".retries"))
+    parse_failures = _total(counters, lambda m: m.endswith(".invalid") or m.endswith(".batch_fallback"))
+    score_columns = [c for c in df_scores.columns if c not in ("Name", security_master.SECURITY_ID)]
+    scores_requested = company_count * len(score_columns)
+    missing = int(df_scores[score_columns].isna().sum().sum())
+
+    return {
+        "scorer": scorer,
+        "companies": company_count,
+        "seconds": round(elapsed, 2),
+        "companies_per_minute": round(company_count / elapsed * 60, 1) if elapsed else None,
+        "requests": requests,
+        "requests_per_company": round(requests / company_count, 3) if company_count else None,
+        "retries": retries,
+        "retry_overhead": round(retries / requests, 3) if requests else 0.0,
+        "parse_failures": parse_failures,
+        "parse_failure_rate": round(parse_failures / scores_requested, 3) if scores_requested else 0.0,
+        "missing_scores": missing,
+        "quota_wait_seconds": round(sum(sum(v) for v in timings.get("gemini.quota_wait", {}).values()), 2),
+    }
+
+def run_scorer(scorer, df_companies, work_directory, verbose=False):
+    """Runs one scorer's main() on df_companies with fresh output, journal and LLM cache files."""
+    module = importlib.import_module(scorer)
+    module.OUTPUT_FILE = os.path.join(work_directory, f"{scorer}_scores.csv")
+    module.FAILED_FILE = os.path.join(work_directory, f"{scorer}_failed.csv")
+    module.JOURNAL_FILE = os.path.join(work_directory, f"{scorer}.journal.jsonl")
+    # A fresh cache per run, so every company reaches the mock
+    llm_cache._CACHE = llm_cache.LLMCache(path=os.path.join(work_directory, f"{scorer}_llm_cache.sqlite"))
+
+    instrumentation.RECORDER.reset()
+    output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    start = time.perf_counter()
+    with output:
+        df_scores = module.main(df_companies)
+    elapsed = time.perf_counter() - start
+    raw = instrumentation.RECORDER.export()
+    llm_cache._CACHE.close()
+    llm_cache._CACHE = None
+    return summarize_run(scorer, df_scores, elapsed, raw, len(df_companies))
+
+def print_report(results, server_stats):
+    print("\n📊 Scorer benchmark")
+    columns = ["scorer", "companies_per_minute", "requests_per_company", "retry_overhead",
+               "parse_failure_rate", "missing_scores", "seconds"]
+    print(pd.DataFrame(results)[columns].to_string(index=False))
+    print(f"\n🧪 Mock server: {server_stats}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Gemini scorers against a local mock server.")
+    parser.add_argument("--scorers", nargs="+", choices=SCORER_CHOICES, default=DEFAULT_SCORERS)
+    parser.add_argument("--companies", type=int, default=200, help="Number of synthetic companies.")
+    parser.add_argument("--input", help="Score the companies of this CSV instead (needs a 'Name' column).")
+    parser.add_argument("--base-url", help="Use an already running mock instead of starting one.")
+    parser.add_argument("--concurrency", type=int, default=scoring_engine.MAX_CONCURRENT_REQUESTS)
+    parser.add_argument("--batch-size", type=int, default=scoring_engine.BATCH_SIZE)
+    parser.add_argument("--max-attempts", type=int, default=scoring_engine.MAX_ATTEMPTS)
+    parser.add_argument("--backoff-base", type=float, default=scoring_engine.BACKOFF_BASE_SECONDS)
+    parser.add_argument("--quota-rpm", type=int, default=scoring_engine.REQUESTS_PER_MINUTE)
+    parser.add_argument("--json", help="Also write the results to this JSON file.")
+    parser.add_argument("--verbose", action="store_true", help="Show the scorers' own output.")
+    mock_gemini_server.add_behaviour_arguments(parser)
+    args = parser.parse_args()
+
+    server = None
+    if args.base_url:
+        base_url = args.base_url
+    else:
+        behaviour = {name: getattr(args, name) for name in mock_gemini_server.DEFAULT_BEHAVIOUR}
+        server = mock_gemini_server.start_server(behaviour)
+        base_url = server.base_url
+
+    # Tunables are read at call time, see scoring_engine
+    scoring_engine.BASE_URL = base_url
+    scoring_engine._client = None
+    scoring_engine.MAX_CONCURRENT_REQUESTS = args.concurrency
+    scoring_engine.BATCH_SIZE = args.batch_size
+    scoring_engine.MAX_ATTEMPTS = args.max_attempts
+    scoring_engine.BACKOFF_BASE_SECONDS = args.backoff_base
+    scoring_engine.REQUESTS_PER_MINUTE = args.quota_rpm
+
+    df_companies = pd.read_csv(args.input) if args.input else synthetic_companies(args.companies)
+    results = []
+    with tempfile.TemporaryDirectory() as work_directory:
+        for scorer in args.scorers:
+            print(f"⏱️ Running {scorer} on {len(df_companies)} companies against {base_url} ...")
+            results.append(run_scorer(scorer, df_companies, work_directory, verbose=args.verbose))
+
+    server_stats = dict(server.stats) if server else "external"
+    print_report(results, server_stats)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"settings": vars(args), "results": results}, f, indent=2)
+        print(f"💾 Results written to {args.json}")
+    if server:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
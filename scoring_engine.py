@@ -0,0 +1,307 @@
+# scoring_engine.py (Async Gemini scoring: score registry, bounded concurrency, RPM/TPM quota limiter, backoff with jitter)
+import asyncio
+import collections
+import json
+import os
+import random
+import time
+
+from google import genai
+from google.genai.errors import APIError
+
+import instrumentation
+import llm_cache
+
+# ==============================
+# 🔑 GEMINI API KEY (or set GEMINI_API_KEY)
+# ==============================
+API_KEY = os.environ.get("GEMINI_API_KEY", "API KEY")  # <-- Ensure valid
+# Point at a local stand-in (mock_gemini_server.py) to test or benchmark without spending quota
+BASE_URL = os.environ.get("GEMINI_BASE_URL")
+
+# API details
+MODEL = "gemini-2.5-flash"
+MAX_OUTPUT_TOKENS = 256
+GENERATION_CONFIG = dict(
+    temperature=0.0,
+    max_output_tokens=MAX_OUTPUT_TOKENS,
+    thinking_config=dict(thinking_budget=0, include_thoughts=False),
+)
+
+# --- Configuration (match the project's Gemini quota tier) ---
+# Read at call time, so a benchmark or test can tune them on the module
+MAX_CONCURRENT_REQUESTS = 8
+REQUESTS_PER_MINUTE = 1000
+TOKENS_PER_MINUTE = 1_000_000
+MAX_ATTEMPTS = 5
+BACKOFF_BASE_SECONDS = 2.0
+BACKOFF_MAX_SECONDS = 60.0
+CHARS_PER_TOKEN = 4    # rough prompt-size estimate; the quota window only needs to be conservative
+
+# Batch mode: K companies per request, answered as one JSON object keyed by NSE code
+BATCH_SIZE = 20
+BATCH_OUTPUT_TOKENS_BASE = 64
+BATCH_OUTPUT_TOKENS_PER_SCORE = 12
+
+# --- Client ---
+_client = None
+
+def get_client():
+    """The Gemini client shared by every scorer, created on first use. None if it cannot be created."""
+    global _client
+    if _client is None:
+        try:
+            http_options = {"base_url": BASE_URL} if BASE_URL else None
+            _client = genai.Client(api_key=API_KEY, http_options=http_options)
+            print(f"✨ Gemini Client Initialized{f' ({BASE_URL})' if BASE_URL else ''}.")
+        except Exception as e:
+            print(f"❌ Error initializing Gemini Client: {e}. Check installation/key.")
+    return _client
+
+# --- Score Registry ---
+# name -> definition dict. Scorer modules register their score when imported.
+SCORE_REGISTRY = {}
+
+def register_score(name, column, criteria, low, high, build_prompt, parse_score):
+    """Registers one score.
+
+    `criteria` describes the score inside multi-score prompts; `build_prompt(company_name)` and
+    `parse_score(text)` ask for and read this score on its own (single-company fallback).
+    """
+    definition = {
+        "name": name,
+        "column": column,
+        "criteria": criteria,
+        "low": low,
+        "high": high,
+        "build_prompt": build_prompt,
+        "parse_score": parse_score,
+        "metric": f"gemini.{name}_score",
+    }
+    # Cached scores are reused until the fiscal quarter, the model or the prompt wording changes
+    definition["template_hash"] = llm_cache.template_hash(
+        build_prompt, lambda companies: build_combined_prompt(companies, [definition])
+    )
+    SCORE_REGISTRY[name] = definition
+    return definition
+
+def validate_score(definition, value):
+    """Parsed score if it lies in the definition's range, else None."""
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        return None
+    score = definition["parse_score"](str(value).strip())
+    if score is None or not definition["low"] <= score <= definition["high"]:
+        return None
+    return score
+
+class QuotaLimiter:
+    """Sliding one-minute window over requests and tokens, shared by every coroutine of a run."""
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None, window=60.0):
+        self.requests_per_minute = requests_per_minute or REQUESTS_PER_MINUTE
+        self.tokens_per_minute = tokens_per_minute or TOKENS_PER_MINUTE
+        self.window = window
+        self._sent = collections.deque()   # (monotonic time, tokens)
+        self._tokens_in_window = 0
+        self._lock = asyncio.Lock()
+
+    def _expire(self, now):
+        while self._sent and now - self._sent[0][0] >= self.window:
+            self._tokens_in_window -= self._sent.popleft()[1]
+
+    async def acquire(self, tokens):
+        """Waits until one more request of `tokens` fits in the window, then books it."""
+        tokens = min(tokens, self.tokens_per_minute)
+        async with self._lock:
+            waited = 0.0
+            while True:
+                now = time.monotonic()
+                self._expire(now)
+                if (len(self._sent) < self.requests_per_minute
+                        and self._tokens_in_window + tokens <= self.tokens_per_minute):
+                    break
+                wait_seconds = self.window - (now - self._sent[0][0])
+                await asyncio.sleep(wait_seconds)
+                waited += wait_seconds
+            self._sent.append((time.monotonic(), tokens))
+            self._tokens_in_window += tokens
+        if waited:
+            instrumentation.observe("gemini.quota_wait", waited)
+
+def estimate_tokens(prompt, max_output_tokens):
+    return len(prompt) // CHARS_PER_TOKEN + max_output_tokens
+
+def backoff_delay(attempt, base=None, cap=None):
+    """Exponential backoff with full jitter: uniform(0, min(cap, base * 2^attempt))."""
+    base = BACKOFF_BASE_SECONDS if base is None else base
+    cap = BACKOFF_MAX_SECONDS if cap is None else cap
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+# --- Requests ---
+async def request_text(client, key, prompt, metric, model, config, semaphore, limiter, metric_key=None):
+    """Sends one prompt with retries; returns the stripped answer, or None after MAX_ATTEMPTS.
+
+    `key` names the request in messages; metrics are recorded under `metric_key` (default: `key`).
+    """
+    metric_key = key if metric_key is None else metric_key
+    tokens = estimate_tokens(prompt, config.get("max_output_tokens", 0))
+    for attempt in range(MAX_ATTEMPTS):
+        if attempt:
+            instrumentation.incr(f"{metric}.retries", key=metric_key)
+        try:
+            async with semaphore:
+                await limiter.acquire(tokens)
+                with instrumentation.timer(metric, key=metric_key):
+                    response = await client.aio.models.generate_content(model=model, contents=prompt, config=config)
+
+            text_content = response.text.strip() if response.text else ""
+            if text_content:
+                return text_content
+            print(f"⚠️ Empty response for {key} ({attempt+1}/{MAX_ATTEMPTS}). Retrying...")
+
+        except APIError as e:
+            print(f"❌ API Error ({attempt+1}/{MAX_ATTEMPTS}) for {key}: {e}")
+        except Exception as e:
+            print(f"❌ General Error ({attempt+1}/{MAX_ATTEMPTS}) for {key}: {e}")
+
+        if attempt + 1 < MAX_ATTEMPTS:    # no point waiting after the last attempt
+            await asyncio.sleep(backoff_delay(attempt))
+
+    return None
+
+# --- Prompts ---
+def build_combined_prompt(companies, definitions):
+    """One prompt for several (NSE code, name) pairs and several scores, answered as JSON {code: {score: value}}."""
+    criteria = "\n\n".join(
+        f'"{d["name"]}" - a number from {d["low"]} to {d["high"]}:\n{d["criteria"]}' for d in definitions
+    )
+    example = json.dumps({"TCS": {d["name"]: 7.5 for d in definitions}})
+    listing = "\n".join(f"- {code}: {name}" for code, name in companies)
+    return (
+        "You are an equity research analyst.\n\n"
+        "For each Indian listed company below (listed on the NSE), provide these scores:\n\n"
+        f"{criteria}\n\n"
+        "Return only a JSON object mapping every NSE code below to an object with one numeric value per score, "
+        f"e.g. {example}. Do not include any text or explanation.\n\n"
+        f"Companies (NSE code: name):\n{listing}"
+    )
+
+def combined_config(config, batch_size, score_count):
+    """JSON output, with room for a short entry per company and score."""
+    return {
+        **config,
+        "response_mime_type": "application/json",
+        "max_output_tokens": BATCH_OUTPUT_TOKENS_BASE + BATCH_OUTPUT_TOKENS_PER_SCORE * batch_size * score_count,
+    }
+
+def parse_combined_response(text_content, keys, definitions):
+    """Reads {code: {score: value}}; returns only entries that pass validation. A bare number is accepted for one score."""
+    try:
+        answer = json.loads(text_content)
+    except ValueError:
+        return {}
+    if not isinstance(answer, dict):
+        return {}
+
+    scores = {}
+    for key in keys:
+        entry = answer.get(key)
+        if not isinstance(entry, dict):
+            entry = {definitions[0]["name"]: entry} if len(definitions) == 1 else {}
+        valid = {}
+        for d in definitions:
+            score = validate_score(d, entry.get(d["name"]))
+            if score is not None:
+                valid[d["name"]] = score
+        scores[key] = valid
+    return scores
+
+# --- Scoring ---
+async def score_single(client, key, name, definition, model, config, semaphore, limiter):
+    """One score for one company with the definition's own prompt; None after MAX_ATTEMPTS or an invalid answer."""
+    metric = definition["metric"]
+    text_content = await request_text(client, key, definition["build_prompt"](name), metric, model, config,
+                                      semaphore, limiter)
+    if text_content is None:
+        return None
+    score = validate_score(definition, text_content)
+    if score is None:
+        instrumentation.incr(f"{metric}.invalid", key=key)
+        print(f"⚠️ Invalid {definition['name']} score for {key}: {text_content}")
+    return score
+
+async def score_batch(client, batch, definitions, model, config, semaphore, limiter):
+    """All scores for up to BATCH_SIZE companies in one request; missing or invalid ones are retried one at a time."""
+    keys = [key for key, _ in batch]
+    # Timed per batch size: a key per list of companies would make every batch its own series
+    text_content = await request_text(client, ",".join(keys), build_combined_prompt(batch, definitions),
+                                      "gemini.scores.batch", model,
+                                      combined_config(config, len(batch), len(definitions)), semaphore, limiter,
+                                      metric_key=f"size_{len(batch)}")
+    scores = parse_combined_response(text_content, keys, definitions) if text_content else {}
+    for key in keys:
+        answered = all(d["name"] in scores.get(key, {}) for d in definitions)
+        instrumentation.incr("gemini.scores.batch_answered" if answered else "gemini.scores.batch_missing", key=key)
+
+    missing = [(key, name, d) for key, name in batch for d in definitions if d["name"] not in scores.get(key, {})]
+    if missing:
+        instrumentation.incr("gemini.scores.batch_fallback", len(missing))
+        print(f"↩️ {len(missing)} of {len(batch) * len(definitions)} scores missing or invalid in batch answer; "
+              "asking for them one by one.")
+        singles = await asyncio.gather(*(
+            score_single(client, key, name, d, model, config, semaphore, limiter) for key, name, d in missing
+        ))
+        for (key, _, d), score in zip(missing, singles):
+            scores.setdefault(key, {})[d["name"]] = score
+    return scores
+
+async def score_companies(client, companies, definitions, on_result=None, concurrency=None,
+                          limiter=None, batch_size=None, use_cache=True, model=None, config=None):
+    """Scores (key, name) pairs on every definition; returns {key: {score name: value or None}}.
+
+    Companies go out `batch_size` per request with all scores in one JSON answer. `on_result(key, scores)`
+    runs as each company finishes (e.g. to append to a resume log). Cached scores (llm_cache) skip the request.
+    """
+    companies = list(dict(companies).items())   # each key is scored once
+    model, config = model or MODEL, config or GENERATION_CONFIG
+    batch_size = BATCH_SIZE if batch_size is None else batch_size
+    semaphore = asyncio.Semaphore(concurrency or MAX_CONCURRENT_REQUESTS)
+    limiter = limiter or QuotaLimiter()
+    scopes = {d["name"]: llm_cache.get_cache().scope(model, d["template_hash"]) for d in definitions} if use_cache else {}
+
+    results = {}
+    to_score = []
+    for key, name in companies:
+        cached = {n: scope.get(key) for n, scope in scopes.items()}
+        if scopes and all(score is not None for score in cached.values()):
+            results[key] = cached
+            if on_result:
+                on_result(key, cached)
+        else:
+            to_score.append((key, name))
+
+    async def run_batch(batch):
+        if len(batch) == 1 and len(definitions) == 1:
+            key, name = batch[0]
+            scores = {key: {definitions[0]["name"]: await score_single(client, key, name, definitions[0], model,
+                                                                        config, semaphore, limiter)}}
+        else:
+            scores = await score_batch(client, batch, definitions, model, config, semaphore, limiter)
+        for key, _ in batch:
+            company_scores = {d["name"]: scores.get(key, {}).get(d["name"]) for d in definitions}
+            scores[key] = company_scores
+            for n, scope in scopes.items():
+                scope.put(key, company_scores[n])
+            if on_result:
+                on_result(key, company_scores)
+        return scores
+
+    size = max(1, batch_size)
+    batches = [to_score[i:i + size] for i in range(0, len(to_score), size)]
+    for scores in await asyncio.gather(*(run_batch(batch) for batch in batches)):
+        results.update(scores)
+    return {key: results.get(key) for key, _ in companies}
+
+def run_scoring(client, companies, definitions, on_result=None, **options):
+    """Blocking entry point for the scorer scripts; returns {key: {score name: value}} in input order."""
+    return asyncio.run(score_companies(client, companies, definitions, on_result=on_result, **options))
@@ -0,0 +1,139 @@
+# screener_http.py (Browserless Screener export fetcher)
+import os
+import re
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import instrumentation
+from rate_limiter import ThrottledError
+
+# --- Configuration ---
+# Point this at a local stand-in server to exercise the fetcher offline
+SCREENER_BASE_URL = os.environ.get('SCREENER_BASE_URL', "https://www.screener.in")
+REQUEST_TIMEOUT = 30          # seconds, for both connect and read
+STREAM_CHUNK_SIZE = 64 * 1024
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36"
+
+CSRF_TOKEN_PATTERN = re.compile(r'name="csrfmiddlewaretoken"\s+value="([^"]+)"')
+EXPORT_ACTION_PATTERN = re.compile(r'action="(/user/company/export/\d+/)"')
+FILENAME_PATTERN = re.compile(r'filename\*?=(?:UTF-8\'\')?"?([^";]+)"?')
+XLSX_MAGIC = b'PK\x03\x04'
+
+class ExportNotAvailable(Exception):
+    """The company page exists but has no export (e.g. no consolidated financials), or does not exist."""
+
+class ScreenerHttpFetcher:
+    """Logs in once and downloads exports over one pooled keep-alive session shared by all threads."""
+
+    def __init__(self, limiter, base_url=SCREENER_BASE_URL, pool_size=8):
+        self.base_url = base_url.rstrip('/')
+        self.limiter = limiter
+        self.session = requests.Session()
+        self.session.headers.update({"User-Agent": USER_AGENT})
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._login_lock = threading.Lock()
+
+    def close(self):
+        self.session.close()
+
+    # --- Requests ---
+    def _request(self, method, url, **kwargs):
+        """Rate-limited request; throttling responses slow the shared limiter down and raise."""
+        self.limiter.acquire()
+        try:
+            response = self.session.request(method, url, timeout=REQUEST_TIMEOUT, **kwargs)
+        except requests.Timeout:
+            self.limiter.on_throttle()
+            raise
+        if response.status_code in (429, 503):
+            response.close()
+            self.limiter.on_throttle()
+            raise ThrottledError(f"HTTP {response.status_code} from {url}")
+        return response
+
+    def login(self, email, password):
+        login_url = f"{self.base_url}/login/"
+        with self._login_lock:
+            page = self._request("GET", login_url)
+            page.raise_for_status()
+            token = CSRF_TOKEN_PATTERN.search(page.text)
+            if not token:
+                raise RuntimeError("Login form has no CSRF token.")
+
+            response = self._request(
+                "POST", login_url,
+                data={"csrfmiddlewaretoken": token.group(1), "username": email, "password": password},
+                headers={"Referer": login_url},
+            )
+            response.raise_for_status()
+            if response.url.rstrip('/').endswith('/login'):
+                raise RuntimeError("Login rejected by Screener.")
+        print("Login successful (HTTP session). Continuing with downloads.")
+
+    # --- Exports ---
+    def download_export(self, url, report_type, destination_directory, code):
+        """Streams `code`'s export behind `url`'s "Export to Excel" form into `destination_directory`."""
+        with instrumentation.timer(f"screener_http.{report_type.lower()}"):
+            page = self._request("GET", url)
+            if page.status_code == 404:
+                raise ExportNotAvailable(f"{report_type} page not found: {url}")
+            page.raise_for_status()
+
+            action = EXPORT_ACTION_PATTERN.search(page.text)
+            token = CSRF_TOKEN_PATTERN.search(page.text)
+            if not action or not token:
+                raise ExportNotAvailable(f"{report_type} export form not found on {url}")
+
+            export_url = f"{self.base_url}{action.group(1)}"
+            with self._request("POST", export_url, data={"csrfmiddlewaretoken": token.group(1)},
+                               headers={"Referer": url}, stream=True) as response:
+                response.raise_for_status()
+                filename = self._filename(response, code, report_type)
+                final_path = os.path.join(destination_directory, filename)
+                partial_path = f"{final_path}.part"
+
+                try:
+                    with open(partial_path, 'wb') as f:
+                        head = b''
+                        for chunk in response.iter_content(STREAM_CHUNK_SIZE):
+                            # The signature may be split over chunks; check it as soon as it can fail
+                            if len(head) < len(XLSX_MAGIC):
+                                head += chunk[:len(XLSX_MAGIC) - len(head)]
+                                if not XLSX_MAGIC.startswith(head):
+                                    raise ExportNotAvailable(f"{report_type} export from {url} is not an xlsx file.")
+                            f.write(chunk)
+                    # Empty or shorter than the signature: never a valid export
+                    if head != XLSX_MAGIC:
+                        raise ExportNotAvailable(f"{report_type} export from {url} is empty or truncated.")
+                except BaseException:
+                    os.remove(partial_path)
+                    raise
+
+            os.replace(partial_path, final_path)
+            self.limiter.on_success()
+            return final_path
+
+    def fetch_export(self, code, destination_directory):
+        """Consolidated first, then standalone - the same fallback as the browser path. Returns (path, report_type)."""
+        consolidated_url = f"{self.base_url}/company/{code}/consolidated/"
+        standalone_url = f"{self.base_url}/company/{code}/"
+        try:
+            return self.download_export(consolidated_url, destination_directory=destination_directory,
+                                        report_type="Consolidated", code=code), "Consolidated"
+        except (ExportNotAvailable, requests.HTTPError):
+            instrumentation.incr("ticker_download.retries", key=code)
+            return self.download_export(standalone_url, destination_directory=destination_directory,
+                                        report_type="Standalone", code=code), "Standalone"
+
+    @staticmethod
+    def _filename(response, code, report_type):
+        disposition = response.headers.get("Content-Disposition", "")
+        match = FILENAME_PATTERN.search(disposition)
+        # Without a header the name must still be unique per ticker: concurrent downloads share the folder
+        filename = match.group(1) if match else f"{code}_{report_type}.xlsx"
+        # Never let a header choose a path outside the download folder
+        return os.path.basename(filename.replace('\\', '/'))
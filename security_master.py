@@ -0,0 +1,324 @@
+# security_master.py (Persistent index of NSE/BSE codes, name variants and export files -> one Security ID)
+import json
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+import pandas as pd
+
+import instrumentation
+
+# --- Configuration ---
+PROJECT_ROOT = os.getcwd()
+SECURITY_MASTER_PATH = os.path.join(PROJECT_ROOT, 'security_master.json')
+SECURITY_ID = "Security ID"
+TRIGRAM_MIN_SIMILARITY = 0.6      # Jaccard similarity of name trigrams accepted as the same company
+TRIGRAM_MIN_MARGIN = 0.1          # ...and by at least this much over the runner-up, else it is ambiguous
+MISMATCH_EXAMPLES = 10            # unmatched values printed per report
+LOCK_TIMEOUT_SECONDS = 30         # stages running in parallel wait this long for each other's save
+LOCK_STALE_SECONDS = 120          # a lock file older than this was left by a crashed process
+
+# --- Aliases ---
+# Every alias is "<kind>:<normalized value>"; IDs are derived from the first code seen
+# (NSE preferred), so stages that run in parallel assign the same ID to a new security.
+def normalize_name(name):
+    """Lowercase alphanumerics only, so 'Reliance Inds.' and 'RELIANCE INDS' are one alias."""
+    return re.sub(r"[^a-z0-9]", "", str(name).lower())
+
+def normalize_code(kind, value):
+    if value is None or pd.isna(value):
+        return None
+    value = str(value).strip()
+    if kind == "bse":
+        value = value[:-2] if value.endswith(".0") else value
+        return value if value.isdigit() else None
+    return value.upper() or None
+
+def alias_key(kind, value):
+    if kind == "name":
+        value = None if value is None or pd.isna(value) else normalize_name(value)
+    elif kind == "file":
+        value = None if value is None or pd.isna(value) else os.path.basename(str(value)).lower()
+    else:
+        value = normalize_code(kind, value)
+    return f"{kind}:{value}" if value else None
+
+def trigrams(normalized_name):
+    padded = f"  {normalized_name} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+@contextmanager
+def file_lock(path, timeout=LOCK_TIMEOUT_SECONDS, stale=LOCK_STALE_SECONDS):
+    """Inter-process lock: an O_EXCL lock file next to `path`, held while the block runs."""
+    lock_path = f"{path}.lock"
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock_path) > stale:
+                    os.remove(lock_path)
+                    continue
+            except OSError:
+                continue    # released (or removed as stale) meanwhile
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Could not lock {path} within {timeout}s. Remove {lock_path} if no stage is running.")
+            time.sleep(0.05)
+    try:
+        os.write(fd, str(os.getpid()).encode())
+        os.close(fd)
+        yield
+    finally:
+        os.remove(lock_path)
+
+# --- Index ---
+class SecurityMaster:
+    """Alias -> Security ID index with exact lookups first and a trigram index over names as the fallback.
+
+    The file holds {"securities": {id: {nse, bse, names, files}}, "aliases": {alias: id}}.
+    The trigram index is built once at load and extended as names are learned.
+    """
+
+    def __init__(self, path=SECURITY_MASTER_PATH):
+        self.path = path
+        self.securities = {}
+        self.aliases = {}
+        self._trigram_index = defaultdict(set)    # trigram -> name aliases containing it
+        self._lock = threading.Lock()
+        self._dirty = False
+        for alias, security_id in self._read().items():
+            self._add_alias(alias, security_id)
+        self._dirty = False
+
+    def _read(self):
+        """Loads the file into self.securities and returns its aliases."""
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Could not read security master {self.path}: {e}. Starting a new one.")
+            return {}
+        for security_id, record in data.get("securities", {}).items():
+            mine = self.securities.setdefault(security_id, record)
+            if mine is not record:
+                # What is on disk was saved first and wins
+                mine["nse"] = record.get("nse") or mine.get("nse")
+                mine["bse"] = record.get("bse") or mine.get("bse")
+                for field in ("names", "files"):
+                    mine[field] += [value for value in record.get(field, []) if value not in mine[field]]
+        return {alias: security_id for alias, security_id in data.get("aliases", {}).items()}
+
+    def _add_alias(self, alias, security_id):
+        existing = self.aliases.get(alias)
+        if existing is not None and existing != security_id:
+            # The first mapping wins; a conflicting one usually means a renamed or relisted company
+            instrumentation.incr("security_master.conflicts")
+            print(f"⚠️ Alias {alias} already belongs to {existing}, not reassigned to {security_id}.")
+            return existing
+        if existing is None:
+            self.aliases[alias] = security_id
+            self._dirty = True
+            if alias.startswith("name:"):
+                for gram in trigrams(alias[5:]):
+                    self._trigram_index[gram].add(alias)
+        return security_id
+
+    # --- Registration ---
+    def register(self, nse=None, bse=None, name=None, filename=None, security_id=None):
+        """Returns the Security ID of these identifiers, creating it when no code is known yet.
+
+        Needs an NSE or BSE code to create a security; name and file alone only resolve.
+        With security_id given the identifiers are added to that security instead of being looked up.
+        """
+        keys = {kind: alias_key(kind, value) for kind, value in
+                (("nse", nse), ("bse", bse), ("file", filename), ("name", name))}
+        with self._lock:
+            if security_id is None:
+                security_id = next((self.aliases[k] for k in keys.values() if k in self.aliases), None)
+            if security_id is None:
+                code = keys["nse"] or keys["bse"]
+                if code is None:
+                    return None
+                security_id = code.upper()      # e.g. "NSE:RELIANCE", "BSE:500325"
+            record = self.securities.setdefault(security_id, {"nse": None, "bse": None, "names": [], "files": []})
+            for kind, key in keys.items():
+                if key is None or self._add_alias(key, security_id) != security_id:
+                    continue
+                value = key.split(":", 1)[1]
+                if kind in ("nse", "bse"):
+                    record[kind] = record[kind] or value
+                elif kind == "name" and str(name).strip() not in record["names"]:
+                    record["names"].append(str(name).strip())
+                elif kind == "file" and value not in record["files"]:
+                    record["files"].append(value)
+            return security_id
+
+    def register_manifest(self, manifest_path):
+        """Learns which export file belongs to which NSE code from bulk_downloader's download manifest."""
+        if not os.path.exists(manifest_path):
+            return 0
+        try:
+            with open(manifest_path) as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Could not read download manifest {manifest_path}: {e}.")
+            return 0
+        for code, entry in entries.items():
+            self.register(nse=code, filename=entry.get("file"))
+        return len(entries)
+
+    # --- Resolution ---
+    def fuzzy_match(self, name):
+        """Best trigram match of an unknown name variant, or None when too weak or ambiguous."""
+        key = normalize_name(name)
+        if not key:
+            return None
+        grams = trigrams(key)
+        with self._lock:
+            candidates = set().union(*(self._trigram_index.get(g, ()) for g in grams))
+            scored = sorted(
+                ((len(grams & trigrams(alias[5:])) / len(grams | trigrams(alias[5:])), self.aliases[alias])
+                 for alias in candidates),
+                reverse=True,
+            )
+        if not scored:
+            return None
+        best_score, best_id = scored[0]
+        runner_up = next((score for score, security_id in scored if security_id != best_id), 0.0)
+        if best_score >= TRIGRAM_MIN_SIMILARITY and best_score - runner_up >= TRIGRAM_MIN_MARGIN:
+            return best_id
+        return None
+
+    def resolve_frame(self, df, label, nse="NSE Code", bse="BSE Code", name="Name", filename=None, learn=True):
+        """Security IDs for every row of df: exact alias joins in priority order, trigram names for the rest.
+
+        Rows with a code nobody registered get the ID derived from it. With learn=True every
+        resolved row's codes, name and file become aliases of its ID, so a name variant that
+        needed the trigram fallback resolves exactly next time. Rows left without an ID are
+        reported under `label`.
+        """
+        columns = {kind: col for kind, col in (("nse", nse), ("bse", bse), ("file", filename), ("name", name))
+                   if col and col in df.columns}
+        ids = pd.Series(pd.NA, index=df.index, dtype="string")
+        counts = {}
+        for kind, col in columns.items():
+            todo = ids.isna()
+            found = df.loc[todo, col].map(lambda value: alias_key(kind, value)).map(self.aliases).dropna()
+            ids[found.index] = found.astype("string")
+            counts[kind] = len(found)
+
+        # Codes the index has never seen belong to a new listing, registered under its own code
+        has_code = pd.Series(False, index=df.index)
+        for kind in ("nse", "bse"):
+            if kind in columns:
+                has_code |= df[columns[kind]].map(lambda value: normalize_code(kind, value) is not None)
+        new_codes = ids.isna() & has_code
+        counts["new"] = int(new_codes.sum())
+
+        def identifiers(i):
+            return {kind: df.at[i, col] for kind, col in
+                    (("nse", nse), ("bse", bse), ("name", name), ("filename", filename)) if col in columns.values()}
+
+        for i in df.index[new_codes]:
+            ids[i] = self.register(**identifiers(i))
+
+        counts["trigram"] = 0
+        if "name" in columns:
+            for i in df.index[ids.isna()]:
+                security_id = self.fuzzy_match(df.at[i, name])
+                if security_id is not None:
+                    ids[i] = security_id
+                    counts["trigram"] += 1
+
+        if learn:
+            for i in df.index[ids.notna() & ~new_codes]:
+                # A row code that already belongs to another security stays there (first mapping wins)
+                self.register(**identifiers(i), security_id=ids[i])
+
+        unmatched = df.loc[ids.isna(), name] if "name" in columns else df.index[ids.isna()].to_series()
+        self.report(label, len(df), counts, unmatched)
+        return ids
+
+    def report(self, label, total, counts, unmatched):
+        instrumentation.incr("security_master.trigram_matches", counts.get("trigram", 0), key=label)
+        instrumentation.incr("security_master.unmatched", len(unmatched), key=label)
+        detail = ", ".join(f"{kind} {count}" for kind, count in counts.items() if count)
+        print(f"🆔 {label}: {total - len(unmatched)}/{total} rows resolved to a Security ID ({detail or 'none'}).")
+        if len(unmatched):
+            examples = ", ".join(map(str, unmatched.head(MISMATCH_EXAMPLES)))
+            print(f"⚠️ {label}: {len(unmatched)} rows without a Security ID, e.g. {examples}")
+
+    def report_join(self, label, left_ids, right_ids):
+        """Reports IDs present on only one side of a join between two stages' outputs."""
+        left, right = set(left_ids.dropna()), set(right_ids.dropna())
+        only_left, only_right = sorted(left - right), sorted(right - left)
+        instrumentation.incr("security_master.join_misses", len(only_left), key=label)
+        if only_left:
+            print(f"⚠️ {label}: missing for {len(only_left)} securities, e.g. {', '.join(only_left[:MISMATCH_EXAMPLES])}")
+        if only_right:
+            print(f"ℹ️ {label}: {len(only_right)} securities are not in the universe, e.g. "
+                  f"{', '.join(only_right[:MISMATCH_EXAMPLES])}")
+
+    # --- Persistence ---
+    def save(self):
+        """Writes the index atomically, first merging in what another stage saved meanwhile.
+
+        The read-merge-write runs under a lock file, so stages in other processes never overwrite each other:
+        aliases already on disk keep their mapping and only this process's new aliases are added to them.
+        """
+        with self._lock, file_lock(self.path):
+            if not self._dirty:
+                return
+            mine = self.aliases
+            self.aliases = {}
+            self._trigram_index = defaultdict(set)
+            for alias, security_id in self._read().items():
+                self._add_alias(alias, security_id)
+            for alias, security_id in mine.items():
+                if self._add_alias(alias, security_id) != security_id:
+                    self._drop_from_record(security_id, alias)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({"securities": self.securities, "aliases": self.aliases}, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+
+    def _drop_from_record(self, security_id, alias):
+        """Removes an alias that lost a conflict from its record; drops the record once nothing points to it."""
+        record = self.securities.get(security_id)
+        if record is None:
+            return
+        kind, value = alias.split(":", 1)
+        if kind in ("nse", "bse") and record.get(kind) == value:
+            record[kind] = None
+        elif kind == "name":
+            record["names"] = [n for n in record["names"] if normalize_name(n) != value]
+        elif kind == "file":
+            record["files"] = [f for f in record["files"] if f != value]
+        if security_id not in self.aliases.values():
+            del self.securities[security_id]
+
+_MASTER = None
+
+def get_master():
+    """Process-wide index, loaded on first use."""
+    global _MASTER
+    if _MASTER is None:
+        _MASTER = SecurityMaster()
+    return _MASTER
+
+if __name__ == "__main__":
+    master = get_master()
+    kinds = defaultdict(int)
+    for alias in master.aliases:
+        kinds[alias.split(":", 1)[0]] += 1
+    print(f"🗃️ {SECURITY_MASTER_PATH}: {len(master.securities)} securities")
+    for kind, count in sorted(kinds.items()):
+        print(f"  {kind}: {count} aliases")
@@ -0,0 +1,166 @@
+# stage_cache.py (Content-addressed cache of pipeline stage outputs)
+import ast
+import datetime
+import hashlib
+import json
+import os
+import shutil
+
+import llm_cache
+
+# --- Configuration ---
+# Next to the pipeline scripts, not wherever the pipeline was launched from
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIRECTORY = os.path.join(PROJECT_ROOT, '.stage_cache')
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Stages whose outputs depend on the calendar and not only on their files list the
+# matching component under "volatile"; its current value becomes part of the key.
+VOLATILE_COMPONENTS = {
+    "date": lambda today: today.isoformat(),                  # e.g. a 'Date' column stamped with today
+    "fiscal_period": lambda today: llm_cache.fiscal_period(today),   # LLM scores are refreshed per quarter
+}
+
+# --- Hashing ---
+def hash_file(path, digest=None):
+    """Feeds the bytes of one file into `digest` (a new sha256 by default) and returns it."""
+    digest = digest or hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest
+
+def hash_path(path, digest):
+    """Hashes a file, or every file under a directory in a stable order (relative names included)."""
+    if os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for filename in sorted(files):
+                file_path = os.path.join(root, filename)
+                digest.update(os.path.relpath(file_path, path).replace(os.sep, '/').encode())
+                hash_file(file_path, digest)
+    else:
+        hash_file(path, digest)
+
+def local_modules(script_path, project_root=PROJECT_ROOT):
+    """The script plus every project module it imports, directly or through other project modules (sorted paths)."""
+    found = set()
+    pending = [os.path.abspath(script_path)]
+    while pending:
+        path = pending.pop()
+        if path in found:
+            continue
+        found.add(path)
+        with open(path, 'rb') as f:
+            tree = ast.parse(f.read(), filename=path)
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+                names = [node.module]
+            else:
+                continue
+            for name in names:
+                module_path = os.path.join(project_root, name.split('.')[0] + '.py')
+                if os.path.exists(module_path):
+                    pending.append(os.path.abspath(module_path))
+    return sorted(found)
+
+def compute_stage_key(stage, project_root=PROJECT_ROOT, today=None):
+    """Hash of the stage's input files, its code (script and imported project modules), its config
+    and its volatile components as of `today` (default: the current date).
+
+    None if an input is missing.
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps(stage, sort_keys=True).encode())
+
+    today = today or datetime.date.today()
+    for component in stage.get("volatile", []):
+        digest.update(f'volatile:{component}={VOLATILE_COMPONENTS[component](today)}'.encode())
+
+    script_path = os.path.join(project_root, stage["script"])
+    if not os.path.exists(script_path):
+        return None
+    # Editing a formula in metric_engine.py or a prompt in quality_mngmnt.py must invalidate the stage too
+    for module_path in local_modules(script_path, project_root):
+        digest.update(f'code:{os.path.relpath(module_path, project_root)}'.replace(os.sep, '/').encode())
+        hash_file(module_path, digest)
+
+    for input_name in stage["inputs"]:
+        input_path = os.path.join(project_root, input_name)
+        if not os.path.exists(input_path):
+            return None
+        digest.update(f'input:{input_name}'.encode())
+        hash_path(input_path, digest)
+
+    # Files the stage reads when they exist (e.g. its own parse cache); absence is part of the key too
+    for input_name in stage.get("optional_inputs", []):
+        input_path = os.path.join(project_root, input_name)
+        digest.update(f'optional:{input_name}'.encode())
+        if os.path.exists(input_path):
+            hash_path(input_path, digest)
+        else:
+            digest.update(b'absent')
+
+    return digest.hexdigest()
+
+# --- Storage ---
+def _entry_directory(stage, key):
+    return os.path.join(CACHE_DIRECTORY, stage["name"], key)
+
+def _copy(source, destination):
+    if os.path.isdir(destination):
+        shutil.rmtree(destination)
+    elif os.path.exists(destination):
+        os.remove(destination)
+
+    if os.path.isdir(source):
+        shutil.copytree(source, destination)
+    else:
+        shutil.copy2(source, destination)
+
+def restore_outputs(stage, key, project_root=PROJECT_ROOT):
+    """Copies the cached outputs for `key` back into the project. Returns False on a cache miss."""
+    entry = _entry_directory(stage, key)
+    if not os.path.exists(os.path.join(entry, 'COMPLETE')):
+        return False
+
+    for output_name in stage["outputs"]:
+        _copy(os.path.join(entry, output_name), os.path.join(project_root, output_name))
+    return True
+
+def newest_mtime(path):
+    """Modification time of a file, or of the most recently written file under a directory."""
+    if not os.path.isdir(path):
+        return os.path.getmtime(path)
+    mtimes = [os.path.getmtime(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files]
+    return max(mtimes, default=os.path.getmtime(path))
+
+def store_outputs(stage, key, project_root=PROJECT_ROOT, since=None):
+    """Saves the stage's outputs under `key`. Skipped (returns False) if any output was not produced,
+    or, with `since` (a time.time() value), was last written before the stage started.
+    """
+    output_paths = [os.path.join(project_root, o) for o in stage["outputs"]]
+    if not all(os.path.exists(p) for p in output_paths):
+        return False
+    # A leftover from an earlier run must never be cached under this run's key
+    if since is not None and any(newest_mtime(p) < since for p in output_paths):
+        return False
+
+    entry = _entry_directory(stage, key)
+    if os.path.exists(entry):
+        shutil.rmtree(entry)
+    os.makedirs(entry)
+
+    for output_name, output_path in zip(stage["outputs"], output_paths):
+        _copy(output_path, os.path.join(entry, output_name))
+
+    # Written last so a half-copied entry is never treated as a hit
+    with open(os.path.join(entry, 'COMPLETE'), 'w') as f:
+        f.write(key)
+    return True
+
+def clear_stage(stage):
+    """Drops every cached entry of one stage."""
+    shutil.rmtree(os.path.join(CACHE_DIRECTORY, stage["name"]), ignore_errors=True)
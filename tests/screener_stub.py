@@ -0,0 +1,53 @@
+# screener_stub.py (Local stand-in for the Screener pages and export endpoint, for tests)
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+XLSX_BYTES = b'PK\x03\x04' + b'\x00' * 60
+
+def company_page(export_id):
+    return (
+        '<form method="post" action="/user/company/export/%d/">'
+        '<input type="hidden" name="csrfmiddlewaretoken" value="token123">'
+        '</form>' % export_id
+    ).encode()
+
+class StubServer(ThreadingHTTPServer):
+    """Answers (method, path) from `routes`: path -> (status, headers, body). Unknown paths get 404."""
+    daemon_threads = True
+
+    def __init__(self, routes):
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.routes = routes
+        self.requests = []
+
+    @property
+    def base_url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+class StubHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def _answer(self, method):
+        length = int(self.headers.get("Content-Length", 0))
+        if length:
+            self.rfile.read(length)
+        self.server.requests.append((method, self.path))
+        status, headers, body = self.server.routes.get((method, self.path), (404, {}, b"not found"))
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._answer("GET")
+
+    def do_POST(self):
+        self._answer("POST")
+
+def start_stub(routes):
+    server = StubServer(routes)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
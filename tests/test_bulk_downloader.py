@@ -0,0 +1,58 @@
+# test_bulk_downloader.py (Download tracker attributes exactly one fresh export to each click)
+import os
+import threading
+
+import pytest
+
+pytest.importorskip("selenium")
+
+import bulk_downloader
+from selenium.common.exceptions import TimeoutException
+
+@pytest.fixture
+def tracker(tmp_path, monkeypatch):
+    monkeypatch.setattr(bulk_downloader, 'DOWNLOAD_TIMEOUT_INITIAL', 2)
+    monkeypatch.setattr(bulk_downloader, 'DOWNLOAD_POLL_INTERVAL', 0.01)
+    return bulk_downloader.DownloadTracker(str(tmp_path))
+
+def write(path, data=b"PK\x03\x04export"):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+def later(action, delay=0.1):
+    thread = threading.Timer(delay, action)
+    thread.start()
+    return thread
+
+def test_returns_the_single_new_export(tracker):
+    before = tracker.snapshot()
+    later(lambda: write(os.path.join(tracker.directory, 'Reliance.xlsx'))).join()
+    assert tracker.wait_for_download(before) == os.path.join(tracker.directory, 'Reliance.xlsx')
+
+def test_late_export_of_a_timed_out_ticker_is_not_credited(tracker):
+    # The previous ticker's download was still running when its wait timed out
+    late = os.path.join(tracker.directory, 'Infosys.xlsx')
+    write(late + '.crdownload')
+    before = tracker.snapshot()
+
+    later(lambda: os.replace(late + '.crdownload', late))
+    with pytest.raises(bulk_downloader.AmbiguousDownloadError):
+        tracker.wait_for_download(before)
+    assert not os.path.exists(late)
+
+def test_several_new_exports_are_rejected(tracker):
+    before = tracker.snapshot()
+    write(os.path.join(tracker.directory, 'Infosys.xlsx'))
+    write(os.path.join(tracker.directory, 'Reliance.xlsx'))
+    with pytest.raises(bulk_downloader.AmbiguousDownloadError):
+        tracker.wait_for_download(before)
+    assert os.listdir(tracker.directory) == []
+
+def test_timeout_sweeps_unclaimed_exports(tracker, monkeypatch):
+    monkeypatch.setattr(bulk_downloader, 'DOWNLOAD_TIMEOUT_INITIAL', 0.2)
+    before = tracker.snapshot()
+    write(os.path.join(tracker.directory, 'Infosys.xlsx'))
+    write(os.path.join(tracker.directory, 'Reliance.xlsx.crdownload'))
+    with pytest.raises(TimeoutException):
+        tracker.wait_for_download(before)
+    assert os.listdir(tracker.directory) == ['Reliance.xlsx.crdownload']
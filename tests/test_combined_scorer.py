@@ -0,0 +1,8 @@
+# test_combined_scorer.py (Importing the combined scorer registers every score it asks for)
+import combined_scorer
+import scoring_engine
+
+def test_requested_scores_are_registered():
+    assert combined_scorer.SCORE_NAMES == ["management", "growth"]
+    for name in combined_scorer.SCORE_NAMES:
+        assert scoring_engine.SCORE_REGISTRY[name]["name"] == name
@@ -0,0 +1,53 @@
+# test_final_database_update.py (Parsing of Master_SQL_Script.sql around the COPY, and the values COPY writes)
+import os
+
+import pandas as pd
+import pytest
+
+import final_database_update
+
+SQL_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Master_SQL_Script.sql')
+
+def read_script():
+    with open(SQL_SCRIPT) as f:
+        return f.read()
+
+@pytest.mark.parametrize("rebuild", [False, True])
+def test_every_command_is_a_statement(rebuild):
+    before_load, after_load = final_database_update.load_script_commands(read_script(), rebuild)
+    assert before_load and after_load
+    for command in before_load + after_load:
+        # psycopg2 rejects a chunk that is only comments with "can't execute an empty query"
+        assert not final_database_update.is_comment_only(command), command
+        assert "@LOAD" not in command
+
+def test_rebuild_section_only_with_rebuild():
+    incremental, _ = final_database_update.load_script_commands(read_script(), rebuild=False)
+    rebuild, _ = final_database_update.load_script_commands(read_script(), rebuild=True)
+    assert not any("DROP TABLE" in command for command in incremental)
+    assert sum("DROP TABLE" in command for command in rebuild) == 4
+
+def test_staging_table_created_before_load():
+    before_load, after_load = final_database_update.load_script_commands(read_script())
+    assert f"CREATE TEMP TABLE {final_database_update.COPY_TARGET_TABLE}" in before_load[-1]
+    assert after_load[0].strip().startswith("CREATE TEMP TABLE snapshot_dates")
+
+def test_missing_marker_is_an_error():
+    with pytest.raises(ValueError):
+        final_database_update.load_script_commands("SELECT 1;")
+
+def test_comment_banner_is_skipped():
+    sql = "CREATE TABLE a (x INT);\n\n------\n-- 3. LOAD DATA\n------\n"
+    assert final_database_update.split_commands(sql) == ["CREATE TABLE a (x INT)"]
+
+def test_numeric_columns_reach_copy_without_float32_rounding():
+    df = pd.DataFrame({col: [None] for col in final_database_update.SQL_COLUMN_MAP})
+    df["PEG Ratio"] = ["0.1"]
+    df["Management Score"] = ["7.3"]
+    df["Market Capitalization"] = ["123456789.123"]
+    df_copy = final_database_update.to_copy_frame(final_database_update.apply_schema(df))
+    row = df_copy.to_csv(header=False, index=False, na_rep='').strip().split(",")
+    columns = list(df_copy.columns)
+    assert row[columns.index("peg_ratio")] == "0.1"
+    assert row[columns.index("management_score")] == "7.3"
+    assert row[columns.index("market_capitalization")] == "123456789.123"
@@ -0,0 +1,23 @@
+# test_instrumentation.py (Prometheus textfile format, output locations)
+import os
+
+import instrumentation
+
+def test_every_metric_family_has_help_and_type():
+    raw = {"timings": {"stage": {"_": [0.5, 1.5]}}, "counters": {"rows_prepared": {"_": 3}}}
+    text = instrumentation.render_prometheus({"pipeline": instrumentation.summarize_component(raw)})
+    lines = text.splitlines()
+    families = {line.split('{')[0].split(' ')[0] for line in lines if not line.startswith('#')}
+    for family in families:
+        base = family
+        for suffix in ('_sum', '_count'):
+            if base.endswith(suffix) and base[:-len(suffix)] + ' ' in text:
+                base = base[:-len(suffix)]
+        assert f'# HELP {base} ' in text, base
+        assert f'# TYPE {base} ' in text, base
+    assert '# TYPE marketlens_last_run_timestamp_seconds gauge' in lines
+
+def test_outputs_live_next_to_the_scripts():
+    repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    assert instrumentation.RUN_MANIFEST_PATH == os.path.join(repo_root, 'run_manifest.json')
+    assert instrumentation.PROMETHEUS_TEXTFILE_PATH == os.path.join(repo_root, 'marketlens.prom')
@@ -0,0 +1,122 @@
+# test_metric_engine.py (Vectorized metrics match the original per-stock formulas, NaN/inf included)
+import numpy as np
+import pandas as pd
+import pytest
+
+import metric_engine
+
+# --- Reference: the per-stock formulas metric_engine replaced ---
+def reference_ttm(quarterly_values):
+    numeric_values = [pd.to_numeric(q, errors='coerce') for q in quarterly_values]
+    ttm_2 = np.nansum(numeric_values[0:4])
+    ttm_1 = np.nansum(numeric_values[4:8])
+    growth = np.nan
+    if ttm_2 != 0:
+        growth = ((ttm_1 / ttm_2) - 1) * 100
+    return ttm_1, ttm_2, growth
+
+def reference_eps(net_profits, equity_shares):
+    equity_shares = pd.to_numeric(equity_shares, errors='coerce') if equity_shares else 0.0
+    eps_values = []
+    for np_value in net_profits:
+        np_value = pd.to_numeric(np_value, errors='coerce')
+        if not pd.isna(np_value) and equity_shares > 0:
+            eps_values.append((np_value * 10_000_000) / equity_shares)
+        else:
+            eps_values.append(np.nan)
+    _, _, eps_growth = reference_ttm(eps_values)
+    return eps_values, eps_growth
+
+def reference_annual_growth(annual_values):
+    numeric_values = [pd.to_numeric(v, errors='coerce') for v in annual_values]
+    growth_rates = []
+    for i in range(len(numeric_values) - 1):
+        prev, curr = numeric_values[i], numeric_values[i + 1]
+        growth_rates.append((curr / prev) * 100 if prev != 0 else np.nan)
+    return growth_rates
+
+def reference_coa_net(cfo_growth, sales_growth):
+    indicator = 0
+    for cfo_g, sales_g in zip(cfo_growth, sales_growth):
+        cfo_g = np.nan if np.isinf(cfo_g) else cfo_g
+        sales_g = np.nan if np.isinf(sales_g) else sales_g
+        if not pd.isna(cfo_g) and not pd.isna(sales_g) and cfo_g >= 0.70 * sales_g:
+            indicator += 1
+    return indicator
+
+# --- Cases ---
+QUARTERS = {
+    "regular": [10, 12, 11, 13, 14, 15, 16, 18],
+    "zero previous ttm": [0, 0, 0, 0, 5, 6, 7, 8],
+    "previous ttm cancels out": [5, -5, 3, -3, 1, 2, 3, 4],
+    "all nan": [np.nan] * 8,
+    "text and blanks": ["", "n/a", None, 4, "5", 6.5, None, "7"],
+    "inf latest": [1, 2, 3, 4, np.inf, 1, 1, 1],
+    "inf previous": [np.inf, 2, 3, 4, 1, 1, 1, 1],
+    "inf both": [np.inf, 0, 0, 0, np.inf, 0, 0, 0],
+    "opposite infs": [np.inf, -np.inf, 1, 1, 1, 1, 1, 1],
+    "negative": [-4, -3, -2, -1, 1, 2, 3, 4],
+}
+SHARES = [10_000_000, 0, -5, np.nan, None, "", "abc", np.inf, "2500000"]
+ANNUAL = {
+    "regular": [100, 110, 120, 150],
+    "zero previous": [0, 110, 0, 150],
+    "all nan": [np.nan] * 4,
+    "inf": [np.inf, 10, 0, -np.inf],
+    "negative": [-10, 20, -30, 40],
+}
+
+def assert_same(actual, expected, case=""):
+    np.testing.assert_array_equal(np.asarray(actual, dtype=np.float64), np.asarray(expected, dtype=np.float64),
+                                  err_msg=case)
+
+def test_ttm_growth_matches_per_stock_formula():
+    matrix = metric_engine.to_numeric_matrix(list(QUARTERS.values()))
+    with np.errstate(all='ignore'):
+        ttm_1, ttm_2, growth = metric_engine.ttm_growth(matrix)
+        expected = [reference_ttm(row) for row in QUARTERS.values()]
+    for i, name in enumerate(QUARTERS):
+        assert_same([ttm_1[i], ttm_2[i], growth[i]], expected[i], name)
+
+@pytest.mark.parametrize("shares", SHARES)
+def test_eps_matches_per_stock_formula(shares):
+    profits = list(QUARTERS.values())
+    with np.errstate(all='ignore'):
+        eps = metric_engine.eps_matrix(metric_engine.to_numeric_matrix(profits),
+                                       metric_engine.to_numeric_matrix([shares] * len(profits)))
+        _, _, growth = metric_engine.ttm_growth(eps)
+        expected = [reference_eps(row, shares) for row in profits]
+    for i in range(len(profits)):
+        assert_same(eps[i], expected[i][0])
+        assert_same(growth[i], expected[i][1])
+
+def test_annual_growth_and_coa_net_match_per_stock_formula():
+    rows = list(ANNUAL.values())
+    with np.errstate(all='ignore'):
+        growth = metric_engine.annual_growth(metric_engine.to_numeric_matrix(rows))
+        expected = [reference_annual_growth(row) for row in rows]
+    assert_same(growth, expected)
+
+    # Every pair of CFO / sales histories, so inf and NaN years meet every other kind of year
+    cfo = np.repeat(growth, len(rows), axis=0)
+    sales = np.tile(growth, (len(rows), 1))
+    expected_coa = [reference_coa_net(c, s) for c, s in zip(cfo, sales)]
+    assert metric_engine.coa_net(cfo, sales).tolist() == expected_coa
+
+def test_compute_metrics_matches_per_stock_formulas():
+    quarters = list(QUARTERS.values())
+    annual = list(ANNUAL.values()) * 2
+    shares = SHARES + [1_000_000]
+    n = len(quarters)
+    with np.errstate(all='ignore'):
+        metrics = metric_engine.compute_metrics(quarters, quarters, quarters, quarters, shares[:n],
+                                                annual[:n], annual[::-1][:n])
+        for i in range(n):
+            opm_4q, _, growth = reference_ttm(quarters[i])
+            eps, eps_growth = reference_eps(quarters[i], shares[i])
+            coa = reference_coa_net(reference_annual_growth(annual[::-1][i]), reference_annual_growth(annual[i]))
+            assert_same([metrics["Sales growth"][i], metrics["op_avg"][i], metrics["OPM_growth"][i]], [growth] * 3)
+            assert_same(metrics["OPM_4Q"][i], opm_4q)
+            assert_same(metrics["EPS_Q"][i], eps)
+            assert_same(metrics["EPSgrowth"][i], eps_growth)
+            assert metrics["COA-Net"][i] == coa
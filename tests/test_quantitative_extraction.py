@@ -0,0 +1,81 @@
+# test_quantitative_extraction.py (Uncached formula guard of the openpyxl reader, extraction cache, Parquet part files)
+import hashlib
+import json
+import os
+
+import openpyxl
+import pandas as pd
+import pytest
+
+import quantitative_extraction
+
+def write_export(path, sales_d4="value"):
+    """Minimal export with every spec sheet; sales_d4 is "value", "formula" (never calculated) or None."""
+    wb = openpyxl.Workbook()
+    wb.remove(wb.active)
+    quarters = wb.create_sheet('Quarters')
+    quarters['A1'] = 'Test Company Ltd.'
+    for col in range(4, 12):
+        quarters.cell(row=4, column=col, value=100.0 + col)
+        quarters.cell(row=6, column=col, value=20.0 + col)
+        quarters.cell(row=14, column=col, value=0.2)
+    quarters['D4'] = {"value": 104.0, "formula": "='Data Sheet'!D49*2", None: None}[sales_d4]
+    data_sheet = wb.create_sheet('Data Sheet')
+    for col in range(4, 12):
+        data_sheet.cell(row=49, column=col, value=10.0 + col)
+    data_sheet['K70'] = 1_000_000
+    profit_loss = wb.create_sheet('Profit & Loss')
+    cash_flow = wb.create_sheet('Cash Flow')
+    for col in range(8, 12):
+        profit_loss.cell(row=4, column=col, value=400.0 + col)
+        cash_flow.cell(row=4, column=col, value=50.0 + col)
+    profit_loss['M25'] = 18.5
+    wb.save(path)
+    return str(path)
+
+def test_cached_values_are_extracted(tmp_path):
+    filename, stock_data, error = quantitative_extraction.extract_file(write_export(tmp_path / "ok.xlsx"))
+    assert error is None
+    assert stock_data["sales_q"][0] == 104.0
+
+def test_empty_cell_is_not_an_error(tmp_path):
+    filename, stock_data, error = quantitative_extraction.extract_file(write_export(tmp_path / "gap.xlsx", None))
+    assert error is None
+    assert stock_data["sales_q"][0] is None
+
+def test_uncached_formula_fails_loudly(tmp_path, monkeypatch):
+    path = write_export(tmp_path / "formula.xlsx", "formula")
+    filename, stock_data, error = quantitative_extraction.extract_file(path)
+    assert stock_data is None
+    assert isinstance(error, quantitative_extraction.UncachedFormulaError)
+    assert "Quarters!D4" in str(error)
+
+    # Without Excel the dispatcher reports it as a failed workbook instead of yielding NaN metrics
+    monkeypatch.setattr(quantitative_extraction.importlib.util, "find_spec", lambda name: None)
+    [(_, stock_data, error)] = quantitative_extraction.extract_files([path], workers=1)
+    assert stock_data is None and "Quarters!D4" in error
+
+def test_parts_read_back_as_one_dataset(tmp_path):
+    pytest.importorskip("pyarrow")
+    output_path = str(tmp_path / "quant.parquet")
+    batches = [quantitative_extraction.finalize_batch([]), quantitative_extraction.finalize_batch([])]
+    quantitative_extraction.write_quantitative_parquet(iter(batches), output_path)
+    assert not [name for name in os.listdir(output_path) if name.endswith(".tmp")]
+
+    # A temp file left behind by a crash must not break reading the dataset
+    batches[0].to_parquet(os.path.join(output_path, "_part-00002.parquet.tmp"), index=False)
+    open(os.path.join(output_path, "_part-00003.parquet.tmp"), "wb").close()
+    df = pd.read_parquet(output_path)
+    assert list(df.columns) == list(batches[0].columns)
+
+def test_rows_cached_by_earlier_readers_are_parsed_again(tmp_path):
+    path = str(tmp_path / "extraction_cache.parquet")
+    quantitative_extraction.save_extraction_cache({"abc": {"Name": "Reliance", "best_pe": 20.0}}, path)
+    assert set(quantitative_extraction.load_extraction_cache(path)) == {"abc"}
+
+    # The same spec before READER_VERSION was part of the key
+    df_cache = pd.read_parquet(path)
+    df_cache["spec_hash"] = hashlib.sha256(
+        json.dumps(quantitative_extraction.EXTRACTION_SPEC, sort_keys=True).encode()).hexdigest()[:16]
+    df_cache.to_parquet(path, index=False)
+    assert quantitative_extraction.load_extraction_cache(path) == {}
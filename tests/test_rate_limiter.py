@@ -0,0 +1,45 @@
+# test_rate_limiter.py (AIMD adaptation of the shared limiter, also when driven by HTTP 429s)
+import pytest
+
+import screener_http
+from rate_limiter import AdaptiveRateLimiter, ThrottledError
+from screener_stub import start_stub
+
+def make_limiter(rate=1.0):
+    return AdaptiveRateLimiter(rate, min_rate=0.25, max_rate=2.0, burst=5, increase=0.5, decrease_factor=0.5)
+
+def test_success_increases_additively_up_to_max():
+    limiter = make_limiter()
+    limiter.on_success()
+    assert limiter.rate == pytest.approx(1.5)
+    limiter.on_success()
+    limiter.on_success()
+    assert limiter.rate == pytest.approx(2.0)
+
+def test_throttle_decreases_multiplicatively_down_to_min():
+    limiter = make_limiter()
+    limiter.on_throttle()
+    assert limiter.rate == pytest.approx(0.5)
+    limiter.on_throttle()
+    limiter.on_throttle()
+    assert limiter.rate == pytest.approx(0.25)
+
+def test_throttle_drops_saved_up_tokens():
+    limiter = make_limiter(rate=100.0)
+    limiter.on_throttle()
+    assert limiter._tokens <= 0.0
+    # The next request has to wait for a fresh token at the reduced rate
+    assert limiter.acquire() > 0
+
+@pytest.mark.parametrize("status", [429, 503])
+def test_throttling_response_slows_limiter_down(status):
+    server = start_stub({("GET", "/company/ABC/consolidated/"): (status, {}, b"Too Many Requests")})
+    limiter = AdaptiveRateLimiter(100.0, min_rate=1.0, max_rate=200.0, burst=5)
+    fetcher = screener_http.ScreenerHttpFetcher(limiter, base_url=server.base_url)
+    try:
+        with pytest.raises(ThrottledError):
+            fetcher.download_export(f"{server.base_url}/company/ABC/consolidated/", "Consolidated", ".", "ABC")
+        assert limiter.rate == pytest.approx(50.0)
+    finally:
+        fetcher.close()
+        server.shutdown()
@@ -0,0 +1,99 @@
+# test_scoring_engine.py (Quota limiter, backoff and the retry path against mock_gemini_server)
+import asyncio
+import time
+
+import pytest
+
+import mock_gemini_server
+import scoring_engine
+
+@pytest.fixture
+def gemini(monkeypatch):
+    """Starts a mock with `behaviour` and points a fresh client at it; returns (server, client)."""
+    servers = []
+
+    def start(**behaviour):
+        server = mock_gemini_server.start_server({"latency": 0.0, "latency_jitter": 0.0, **behaviour})
+        servers.append(server)
+        monkeypatch.setattr(scoring_engine, 'BASE_URL', server.base_url)
+        monkeypatch.setattr(scoring_engine, '_client', None)
+        return server, scoring_engine.get_client()
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+def request(client, prompt="Rate TCS from 1 to 10."):
+    async def send():
+        return await scoring_engine.request_text(
+            client, "TCS", prompt, "gemini.test", scoring_engine.MODEL,
+            {"max_output_tokens": 16}, asyncio.Semaphore(1), scoring_engine.QuotaLimiter(),
+        )
+    return asyncio.run(send())
+
+def test_backoff_delay_is_capped_full_jitter(monkeypatch):
+    monkeypatch.setattr(scoring_engine.random, 'uniform', lambda low, high: (low, high))
+    assert scoring_engine.backoff_delay(0, base=2.0, cap=60.0) == (0, 2.0)
+    assert scoring_engine.backoff_delay(3, base=2.0, cap=60.0) == (0, 16.0)
+    assert scoring_engine.backoff_delay(10, base=2.0, cap=60.0) == (0, 60.0)
+
+def test_quota_limiter_waits_for_the_request_window():
+    limiter = scoring_engine.QuotaLimiter(requests_per_minute=2, tokens_per_minute=1000, window=0.3)
+
+    async def three_requests():
+        start = time.monotonic()
+        for _ in range(3):
+            await limiter.acquire(10)
+        return time.monotonic() - start
+
+    assert asyncio.run(three_requests()) >= 0.25
+
+def test_quota_limiter_waits_for_the_token_window():
+    limiter = scoring_engine.QuotaLimiter(requests_per_minute=100, tokens_per_minute=100, window=0.3)
+
+    async def two_large_requests():
+        start = time.monotonic()
+        await limiter.acquire(60)
+        first = time.monotonic() - start
+        await limiter.acquire(60)
+        return first, time.monotonic() - start
+
+    first, total = asyncio.run(two_large_requests())
+    assert first < 0.1
+    assert total >= 0.25
+
+def test_answer_is_returned_without_retries(gemini):
+    server, client = gemini()
+    assert 1 <= float(request(client)) <= 10
+    assert server.stats["requests"] == 1
+
+def test_throttled_requests_are_retried_then_given_up(gemini, monkeypatch):
+    server, client = gemini(throttle_rate=1.0)
+    monkeypatch.setattr(scoring_engine, 'MAX_ATTEMPTS', 3)
+    delays = []
+    monkeypatch.setattr(scoring_engine, 'backoff_delay', lambda attempt: delays.append(attempt) or 0.0)
+
+    assert request(client) is None
+    assert server.stats["requests"] == server.stats["throttled"] == 3
+    # Backoff only between attempts, never after the last one
+    assert delays == [0, 1]
+
+def test_batches_are_timed_per_size_and_counted_per_company(gemini):
+    _, client = gemini()
+    recorder = scoring_engine.instrumentation.RECORDER
+    recorder.reset()
+    definition = {
+        "name": "growth", "low": 1, "high": 10, "criteria": "Growth outlook.",
+        "build_prompt": lambda name: f"Rate {name} from 1 to 10.", "parse_score": float,
+    }
+    batch = [("TCS", "Tata Consultancy Services"), ("INFY", "Infosys")]
+
+    async def score():
+        return await scoring_engine.score_batch(client, batch, [definition], scoring_engine.MODEL, {},
+                                                asyncio.Semaphore(1), scoring_engine.QuotaLimiter())
+
+    assert set(asyncio.run(score())) == {"TCS", "INFY"}
+    assert list(recorder.timings["gemini.scores.batch"]) == ["size_2"]
+    assert recorder.counters["gemini.scores.batch_answered"] == {"TCS": 1, "INFY": 1}
+    recorder.reset()
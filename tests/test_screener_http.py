@@ -0,0 +1,56 @@
+# test_screener_http.py (Export downloads against a local stub: signature check and file naming)
+import os
+
+import pytest
+
+import screener_http
+from rate_limiter import AdaptiveRateLimiter
+from screener_stub import XLSX_BYTES, company_page, start_stub
+
+EXPORT_PATH = "/user/company/export/1/"
+
+@pytest.fixture
+def fetch(tmp_path):
+    """fetch(export_answer, code) downloads `code`'s consolidated export, answered with export_answer."""
+    servers, fetchers = [], []
+
+    def run(export_answer, code="ABC"):
+        server = start_stub({
+            ("GET", f"/company/{code}/consolidated/"): (200, {}, company_page(1)),
+            ("POST", EXPORT_PATH): export_answer,
+        })
+        fetcher = screener_http.ScreenerHttpFetcher(AdaptiveRateLimiter(1000.0, 1.0, 1000.0, burst=10),
+                                                    base_url=server.base_url)
+        servers.append(server)
+        fetchers.append(fetcher)
+        return fetcher.download_export(f"{server.base_url}/company/{code}/consolidated/", "Consolidated",
+                                       str(tmp_path), code)
+
+    yield run
+    for fetcher in fetchers:
+        fetcher.close()
+    for server in servers:
+        server.shutdown()
+
+def test_valid_export_uses_header_filename(fetch, tmp_path):
+    headers = {"Content-Disposition": 'attachment; filename="ABC Ltd.xlsx"'}
+    path = fetch((200, headers, XLSX_BYTES))
+    assert path == os.path.join(str(tmp_path), "ABC Ltd.xlsx")
+    with open(path, 'rb') as f:
+        assert f.read() == XLSX_BYTES
+
+def test_filename_without_header_is_unique_per_code(fetch):
+    first = fetch((200, {}, XLSX_BYTES), code="ABC")
+    second = fetch((200, {}, XLSX_BYTES), code="XYZ")
+    assert os.path.basename(first) == "ABC_Consolidated.xlsx"
+    assert os.path.basename(second) == "XYZ_Consolidated.xlsx"
+
+def test_header_cannot_escape_download_folder(fetch, tmp_path):
+    path = fetch((200, {"Content-Disposition": 'attachment; filename="../../evil.xlsx"'}, XLSX_BYTES))
+    assert os.path.dirname(path) == str(tmp_path)
+
+@pytest.mark.parametrize("body", [b"", b"PK", b"<html>Please log in</html>"], ids=["empty", "truncated", "html"])
+def test_non_xlsx_body_is_rejected_and_removed(fetch, tmp_path, body):
+    with pytest.raises(screener_http.ExportNotAvailable):
+        fetch((200, {}, body))
+    assert os.listdir(tmp_path) == []
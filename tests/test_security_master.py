@@ -0,0 +1,72 @@
+# test_security_master.py (Security ID resolution, learning and concurrent saves)
+import multiprocessing
+import os
+
+import pandas as pd
+
+import security_master
+
+def save_codes(path, prefix, count):
+    master = security_master.SecurityMaster(path)
+    for i in range(count):
+        master.register(nse=f"{prefix}{i}", name=f"{prefix} Company {i}")
+        master.save()
+
+def test_concurrent_saves_keep_every_alias(tmp_path):
+    path = str(tmp_path / "security_master.json")
+    workers = [multiprocessing.Process(target=save_codes, args=(path, prefix, 15)) for prefix in "ABCD"]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+        assert worker.exitcode == 0
+
+    master = security_master.SecurityMaster(path)
+    assert {f"nse:{prefix}{i}" for prefix in "ABCD" for i in range(15)} <= set(master.aliases)
+    assert len(master.securities) == 60
+    assert not os.path.exists(f"{path}.lock")
+
+def test_stale_lock_is_taken_over(tmp_path):
+    path = str(tmp_path / "security_master.json")
+    open(f"{path}.lock", "w").close()
+    os.utime(f"{path}.lock", (0, 0))
+    master = security_master.SecurityMaster(path)
+    master.register(nse="ABC")
+    master.save()
+    assert "nse:ABC" in security_master.SecurityMaster(path).aliases
+
+def test_learning_keeps_the_rows_own_codes(tmp_path):
+    master = security_master.SecurityMaster(str(tmp_path / "security_master.json"))
+    reliance = master.register(nse="RELIANCE", name="Reliance Industries")
+    tcs = master.register(bse="532540", name="Tata Consultancy Services")
+    df = pd.DataFrame({
+        "NSE Code": ["TCS", "RELIANCE"],
+        "BSE Code": ["532540", "532540"],
+        "Name": ["TCS Ltd", "Reliance Inds"],
+    })
+
+    ids = master.resolve_frame(df, "test")
+
+    assert list(ids) == [tcs, reliance]
+    # The new NSE code is learned on the security the row resolved to
+    assert master.aliases["nse:TCS"] == tcs
+    assert master.securities[tcs]["nse"] == "TCS"
+    # A conflicting code keeps its first mapping instead of being overwritten
+    assert master.aliases["bse:532540"] == tcs
+    assert master.securities[reliance]["bse"] is None
+
+def test_save_keeps_the_mapping_saved_first(tmp_path):
+    path = str(tmp_path / "security_master.json")
+    first = security_master.SecurityMaster(path)
+    second = security_master.SecurityMaster(path)
+    # Both stages meet the same listing: one sees its BSE code first, the other its NSE code
+    assert first.register(bse="500325", name="Reliance Industries") == "BSE:500325"
+    assert second.register(nse="RELIANCE", name="Reliance Industries") == "NSE:RELIANCE"
+    first.save()
+    second.save()
+
+    saved = security_master.SecurityMaster(path)
+    assert saved.aliases["name:relianceindustries"] == "BSE:500325"
+    assert saved.aliases["nse:RELIANCE"] == "NSE:RELIANCE"
+    assert saved.securities["NSE:RELIANCE"]["names"] == []
+    assert saved.securities["BSE:500325"]["names"] == ["Reliance Industries"]
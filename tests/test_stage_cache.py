@@ -0,0 +1,76 @@
+# test_stage_cache.py (Stage keys follow the code a stage imports and the calendar, cache location)
+import datetime
+import os
+import time
+
+import stage_cache
+
+def write(path, text):
+    with open(path, 'w') as f:
+        f.write(text)
+
+def make_project(root):
+    write(os.path.join(root, 'stage.py'), "import os\nimport helper\n")
+    write(os.path.join(root, 'helper.py'), "from formulas import growth\n")
+    write(os.path.join(root, 'formulas.py'), "def growth(a, b):\n    return a / b - 1\n")
+    write(os.path.join(root, 'unrelated.py'), "X = 1\n")
+    write(os.path.join(root, 'input.csv'), "Name\nA\n")
+    return {"name": "stage", "script": "stage.py", "inputs": ["input.csv"], "outputs": []}
+
+def test_local_modules_follow_imports_transitively(tmp_path):
+    make_project(str(tmp_path))
+    modules = stage_cache.local_modules(os.path.join(str(tmp_path), 'stage.py'), str(tmp_path))
+    assert [os.path.basename(p) for p in modules] == ['formulas.py', 'helper.py', 'stage.py']
+
+def test_key_changes_with_an_imported_module(tmp_path):
+    root = str(tmp_path)
+    stage = make_project(root)
+    key = stage_cache.compute_stage_key(stage, root)
+
+    write(os.path.join(root, 'unrelated.py'), "X = 2\n")
+    assert stage_cache.compute_stage_key(stage, root) == key
+
+    write(os.path.join(root, 'formulas.py'), "def growth(a, b):\n    return (a - b) / abs(b)\n")
+    assert stage_cache.compute_stage_key(stage, root) != key
+
+def test_cache_directory_does_not_depend_on_launch_directory():
+    repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    assert stage_cache.CACHE_DIRECTORY == os.path.join(repo_root, '.stage_cache')
+
+def test_volatile_components_follow_the_calendar(tmp_path):
+    root = str(tmp_path)
+    stage = make_project(root)
+    day = datetime.date(2025, 10, 1)
+    next_day = datetime.date(2025, 10, 2)
+    assert stage_cache.compute_stage_key(stage, root, today=day) == stage_cache.compute_stage_key(stage, root, today=next_day)
+
+    dated = {**stage, "volatile": ["date"]}
+    assert stage_cache.compute_stage_key(dated, root, today=day) != stage_cache.compute_stage_key(dated, root, today=next_day)
+
+    quarterly = {**stage, "volatile": ["fiscal_period"]}
+    key = stage_cache.compute_stage_key(quarterly, root, today=day)
+    assert stage_cache.compute_stage_key(quarterly, root, today=next_day) == key
+    assert stage_cache.compute_stage_key(quarterly, root, today=datetime.date(2026, 1, 2)) != key
+
+def test_outputs_older_than_the_stage_are_not_stored(tmp_path, monkeypatch):
+    monkeypatch.setattr(stage_cache, 'CACHE_DIRECTORY', str(tmp_path / 'cache'))
+    root = str(tmp_path)
+    stage = {**make_project(root), "outputs": ["output.csv"]}
+    write(os.path.join(root, 'output.csv'), "left over\n")
+    os.utime(os.path.join(root, 'output.csv'), (0, 0))
+
+    assert not stage_cache.store_outputs(stage, 'key', root, since=time.time())
+    assert not stage_cache.restore_outputs(stage, 'key', root)
+
+    write(os.path.join(root, 'output.csv'), "fresh\n")
+    assert stage_cache.store_outputs(stage, 'key', root, since=time.time() - 5)
+    assert stage_cache.restore_outputs(stage, 'key', root)
+
+def test_optional_inputs_may_be_missing_but_change_the_key(tmp_path):
+    root = str(tmp_path)
+    stage = {**make_project(root), "optional_inputs": ["parse_cache.parquet"]}
+    key = stage_cache.compute_stage_key(stage, root)
+    assert key is not None
+
+    write(os.path.join(root, 'parse_cache.parquet'), "rows")
+    assert stage_cache.compute_stage_key(stage, root) != key
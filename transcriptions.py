@@ -1,19 +1,10 @@
 import pandas as pd
-import time
-import os
 import re
-import random
-from google import genai
-from google.genai.errors import APIError
 
-# ==============================
-# 🔑 ENTER YOUR GEMINI API KEY HERE
-# ==============================
-API_KEY = "API KEY"  # <-- your valid Gemini API key here
-
-# API details
-MODEL = "gemini-2.5-flash"
-MAX_OUTPUT_TOKENS = 256
+import checkpoint_journal
+import instrumentation
+import llm_cache
+import scoring_engine
 
 # ==============================
 # 📘 FILE PATHS
@@ -21,29 +12,25 @@ MAX_OUTPUT_TOKENS = 256
 INPUT_FILE = r"C:\StockModelPipeline\query-results.csv"
 OUTPUT_FILE = r"C:\StockModelPipeline\query-results_growth.csv"
 FAILED_FILE = r"C:\StockModelPipeline\query-results_growthfailed.csv"
+JOURNAL_FILE = r"C:\StockModelPipeline\query-results_growth.journal.jsonl"  # resume log of an unfinished run
 
 # ==============================
-# ⚙️ Initialize Gemini Client
+# 🔍 Prompt & answer parsing
 # ==============================
-try:
-    client = genai.Client(api_key=API_KEY)
-    print("✨ Gemini Client Initialized.")
-except Exception as e:
-    print(f"❌ Error initializing Gemini Client: {e}. Check installation/key.")
-    client = None
-
-
-# ==============================
-# 🔍 Gemini API Function
-# ==============================
-def get_growth_guidance_score(company_name: str):
-    """
-    Get projected growth guidance score for a company between 0–10.
-    """
-    if client is None:
-        return None
+# Used when this score is requested together with others (see combined_scorer.py)
+CRITERIA = """Projected Growth Guidance Score out of 10.
+Check if the company has held or participated in any investor meet, analyst call, or management interaction
+in the current financial year (FY 2025–26). If yes, analyze the management commentary or guidance from that
+interaction to determine their projected business growth outlook — particularly on revenue, EBITDA,
+and profit growth expectations.
+- 10 = very strong growth guidance (>15% expected growth)
+- 5 = moderate guidance (~5–10% growth)
+- 1 = weak or negative guidance (<0% or no growth)
+If no investor meet or analyst call is found, still infer a reasonable score
+from financial performance, sentiment, or recent business trends."""
 
-    prompt = f"""
+def build_prompt(company_name: str):
+    return f"""
 You are an equity research analyst.
 
 Check if the Indian listed company **{company_name}** (listed on the NSE)
@@ -65,83 +52,101 @@ from financial performance, sentiment, or recent business trends.
 Return **only the numeric score** (e.g. 8.4). Do not include any text or explanation.
 """
 
-    for attempt in range(3):
-        try:
-            response = client.models.generate_content(
-                model=MODEL,
-                contents=prompt,
-                config=dict(
-                    temperature=0.0,
-                    max_output_tokens=MAX_OUTPUT_TOKENS,
-                    thinking_config=dict(thinking_budget=0, include_thoughts=False),
-                ),
-            )
-
-            text_content = response.text.strip() if response.text else ""
-            if not text_content:
-                print(f"⚠️ Empty response for {company_name}. Retrying...")
-                time.sleep(10 + random.uniform(0, 5))
-                continue
-
-            # Extract a number between 0–10
-            match = re.search(r"\b(?:[0-9]|10)(?:\.\d{1,2})?\b", text_content)
-            if match:
-                score = float(match.group(0))
-                if 0 <= score <= 10:
-                    return score
-
-            print(f"⚠️ Invalid response for {company_name}: {text_content}")
-            return None
-
-        except APIError as e:
-            print(f"❌ API Error ({attempt+1}/3) for {company_name}: {e}")
-            time.sleep(15 + random.uniform(0, 5))
-        except Exception as e:
-            print(f"❌ General Error ({attempt+1}/3) for {company_name}: {e}")
-            time.sleep(10 + random.uniform(0, 5))
 
+def parse_score(text_content: str):
+    """Extracts a number between 0–10, or None if the answer holds no valid score."""
+    match = re.search(r"\b(?:[0-9]|10)(?:\.\d{1,2})?\b", text_content)
+    if match:
+        score = float(match.group(0))
+        if 0 <= score <= 10:
+            return score
     return None
 
 
+GROWTH_SCORE = scoring_engine.register_score(
+    "growth", "Transcriptions_score", CRITERIA, 0, 10, build_prompt, parse_score
+)
+
+
+def score_companies(companies, on_result=None, batch=True, use_cache=True):
+    """Scores (NSE code, name) pairs through scoring_engine, BATCH_SIZE per request; returns {code: score}."""
+    scores = scoring_engine.run_scoring(
+        scoring_engine.get_client(), companies, [GROWTH_SCORE],
+        on_result=(lambda code, s: on_result(code, s["growth"])) if on_result else None,
+        batch_size=scoring_engine.BATCH_SIZE if batch else 1, use_cache=use_cache,
+    )
+    return {code: s["growth"] for code, s in scores.items()}
+
+
+def get_growth_guidance_score(company_name: str):
+    """
+    Get projected growth guidance score for a company between 0–10.
+    """
+    if scoring_engine.get_client() is None:
+        return None
+    return score_companies([(company_name, company_name)], batch=False)[company_name]
+
+
 # ==============================
-# 📊 MAIN EXECUTION (ALL COMPANIES)
+# 📊 MAIN EXECUTION (ALL COMPANIES, resumes an interrupted run)
 # ==============================
-def main():
-    if client is None:
+def main(df=None):
+    """Scores every company and returns the scores of this run."""
+    if scoring_engine.get_client() is None:
         print("\n🚫 Cannot run main() due to client initialization failure.")
-        return
+        return None
 
-    df = pd.read_csv(INPUT_FILE)
+    df = pd.read_csv(INPUT_FILE) if df is None else df.copy()
     if "Name" not in df.columns:
         raise ValueError("❌ CSV must have a 'Name' column.")
 
     df["Name"] = df["Name"].astype(str).str.strip()
 
-    # ✅ Process ALL companies
-    df_target = df.reset_index(drop=True)
-    print(f"➡️ Processing all {len(df_target)} companies.\n")
+    # ✅ Process ALL companies, except those an interrupted run already finished
+    journal = checkpoint_journal.CheckpointJournal(JOURNAL_FILE, required=["Transcriptions_score"])
+    df_target = df[[name not in journal for name in df["Name"]]].reset_index(drop=True)
+    print(f"➡️ Processing {len(df_target)} of {len(df)} companies.\n")
 
     failed = []
-    for idx, name in enumerate(df_target["Name"], start=1):
-        print(f"\n({idx}/{len(df_target)}) → Getting score for: {name}")
-
-        score = get_growth_guidance_score(name)
-
-        pd.DataFrame([{"Name": name, "Transcriptions_score": score}]).to_csv(
-            OUTPUT_FILE, mode="a", header=not os.path.exists(OUTPUT_FILE), index=False
-        )
-
+    completed = 0
+    # Batch answers are keyed by NSE code; companies without one fall back to their name
+    codes = df_target["NSE Code"] if "NSE Code" in df_target.columns else df_target["Name"]
+    codes = codes.where(codes.notna(), df_target["Name"]).astype(str).str.strip()
+    names_by_code = dict(zip(codes, df_target["Name"]))
+
+    def on_result(code, score):
+        # Runs on the event loop thread as each company finishes, so appends never interleave
+        nonlocal completed
+        completed += 1
+        name = names_by_code[code]
+        print(f"({completed}/{len(df_target)}) → {name}: {score}")
+        journal.append({"Name": name, "Transcriptions_score": score})
+        instrumentation.incr("companies_scored")
         if score is None:
             failed.append(name)
 
-        # Respect rate limits
-        time.sleep(8 + random.uniform(0, 4))
+    # Rate limits are enforced by scoring_engine's quota limiter
+    try:
+        score_companies(list(names_by_code.items()), on_result=on_result)
+    finally:
+        journal.flush()
+    llm_cache.get_cache().report()
+    df_scores = journal.compact(OUTPUT_FILE, ["Name", "Transcriptions_score"])
 
     if failed:
         pd.DataFrame({"Failed_Companies": failed}).to_csv(FAILED_FILE, index=False)
         print(f"\n⚠️ Failed companies saved to {FAILED_FILE}")
 
     print(f"\n✅ Completed! Results saved to: {OUTPUT_FILE}")
+    return df_scores
+
+
+def run_stage(frames, checkpoint=True):
+    """In-process entry point. OUTPUT_FILE is always written, as in the script run."""
+    df_scores = main(frames.get('query-results.csv'))
+    if df_scores is None:
+        raise RuntimeError("Gemini client is not initialized.")
+    return {'query-results_growth.csv': df_scores}
 
 
 # ==============================
@@ -149,4 +154,7 @@ def main():
 # ==============================
 if __name__ == "__main__":
 
-    main()
+    try:
+        main()
+    finally:
+        instrumentation.flush("transcriptions")